@@ -0,0 +1 @@
+"""Pipeline building blocks for the AdaptTable Streamlit app."""
@@ -0,0 +1,253 @@
+"""Model backends behind one interface.
+
+Every backend takes a system prompt and a user prompt, streams the response,
+and returns a ``Completion`` with the text, token usage and timing.  Callers
+may pass a JSON schema to get schema-constrained JSON output (structured
+outputs or JSON mode on OpenAI, a response schema on Gemini).  Provider SDKs
+are imported on first use of a backend for that provider, so a process only
+pays for the ones it calls (``SDK_IMPORT_SECONDS`` records what each cost).
+Clients and model objects are built once per process (``get_backend`` is
+cached), every call has a timeout, and throttling/server errors are retried
+with exponential backoff.  New models are added with ``register_model``.
+``base_url`` points a backend at another endpoint, such as the local stub
+servers in ``benchmarks/``.
+"""
+import functools
+import importlib
+import random
+import time
+from dataclasses import dataclass, field
+
+DEFAULT_TIMEOUT = 120.0
+DEFAULT_MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Module -> seconds its first import took in this process
+SDK_IMPORT_SECONDS = {}
+
+
+def import_sdk(module):
+    """Import a provider SDK on first use, timing the import."""
+    start = time.perf_counter()
+    sdk = importlib.import_module(module)
+    SDK_IMPORT_SECONDS.setdefault(module, time.perf_counter() - start)
+    return sdk
+
+
+@dataclass
+class Completion:
+    text: str
+    elapsed: float
+    first_token_time: float = None
+    usage: dict = field(default_factory=dict)
+    retries: int = 0
+    cached: bool = False
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter for retry ``attempt`` (0-based)."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+class Backend:
+    provider = None
+
+    def __init__(self, model_id, api_key, timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 structured_output=True, base_url=None):
+        self.model_id = model_id
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_url = base_url
+        # Whether the model accepts a full JSON schema (vs. plain JSON mode)
+        self.structured_output = structured_output
+
+    def stream(self, system_prompt, user_prompt, usage, response_schema=None):
+        """Yield response text chunks, filling ``usage`` once the stream ends.
+
+        With ``response_schema`` the response is JSON constrained to that schema.
+        """
+        raise NotImplementedError
+
+    def is_retryable(self, error):
+        status = getattr(error, "status_code", None) or getattr(error, "code", None)
+        return status in RETRYABLE_STATUS_CODES
+
+    def complete(self, system_prompt, user_prompt, on_text=None, response_schema=None):
+        """Run the prompt to completion, calling ``on_text`` with the partial text as it grows."""
+        start_time = time.time()
+        for attempt in range(self.max_retries + 1):
+            usage = {}
+            text = ""
+            first_token_time = None
+            try:
+                for chunk in self.stream(system_prompt, user_prompt, usage, response_schema):
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    text += chunk
+                    if on_text is not None:
+                        on_text(text)
+                return Completion(
+                    text=text,
+                    elapsed=time.time() - start_time,
+                    first_token_time=first_token_time,
+                    usage=usage,
+                    retries=attempt,
+                )
+            except Exception as error:
+                # A half-streamed answer has already been shown, so only retry
+                # failures that happen before the first token
+                if text or attempt == self.max_retries or not self.is_retryable(error):
+                    raise
+                time.sleep(backoff_delay(attempt))
+
+
+class OpenAIBackend(Backend):
+    provider = "openai"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.openai = import_sdk("openai")
+        # Retries are handled by Backend.complete so they are counted and consistent
+        self.client = self.openai.OpenAI(
+            api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, max_retries=0
+        )
+
+    def is_retryable(self, error):
+        if isinstance(error, (self.openai.APIConnectionError, self.openai.APITimeoutError)):
+            return True
+        return super().is_retryable(error)
+
+    def _response_format(self, response_schema):
+        if response_schema is None:
+            return self.openai.NOT_GIVEN
+        if not self.structured_output:
+            return {"type": "json_object"}
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "response", "schema": response_schema, "strict": True},
+        }
+
+    def stream(self, system_prompt, user_prompt, usage, response_schema=None):
+        stream = self.client.chat.completions.create(
+            model=self.model_id,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            response_format=self._response_format(response_schema),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        for chunk in stream:
+            if chunk.usage is not None:
+                details = getattr(chunk.usage, "prompt_tokens_details", None)
+                usage.update(
+                    prompt_tokens=chunk.usage.prompt_tokens,
+                    completion_tokens=chunk.usage.completion_tokens,
+                    cached_tokens=getattr(details, "cached_tokens", 0) or 0,
+                )
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class GeminiBackend(Backend):
+    provider = "gemini"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        genai = import_sdk("google.generativeai")
+        if self.base_url:
+            # Only the REST transport can be pointed at a plain-HTTP endpoint
+            genai.configure(api_key=self.api_key, transport="rest", client_options={"api_endpoint": self.base_url})
+        else:
+            genai.configure(api_key=self.api_key)
+        self.model = genai.GenerativeModel(self.model_id)
+
+    def stream(self, system_prompt, user_prompt, usage, response_schema=None):
+        generation_config = None
+        if response_schema is not None:
+            generation_config = {
+                "response_mime_type": "application/json",
+                "response_schema": gemini_schema(response_schema),
+            }
+        response = self.model.generate_content(
+            f"{system_prompt}\n\n{user_prompt}",
+            generation_config=generation_config,
+            stream=True,
+            request_options={"timeout": self.timeout},
+        )
+        for chunk in response:
+            metadata = getattr(chunk, "usage_metadata", None)
+            if metadata is not None and metadata.prompt_token_count:
+                usage.update(
+                    prompt_tokens=metadata.prompt_token_count,
+                    completion_tokens=metadata.candidates_token_count,
+                    cached_tokens=getattr(metadata, "cached_content_token_count", 0) or 0,
+                )
+            try:
+                piece = chunk.text
+            except ValueError:
+                continue  # e.g. a trailing chunk that only carries finish metadata
+            if piece:
+                yield piece
+
+
+def gemini_schema(schema):
+    """Translate a JSON schema into the OpenAPI subset Gemini accepts.
+
+    Gemini has no ``additionalProperties`` and spells ``["string", "null"]``
+    as ``{"type": "string", "nullable": true}``.
+    """
+    if isinstance(schema, list):
+        return [gemini_schema(value) for value in schema]
+    if not isinstance(schema, dict):
+        return schema
+    converted = {}
+    for key, value in schema.items():
+        if key == "additionalProperties":
+            continue
+        if key == "type" and isinstance(value, list):
+            types = [t for t in value if t != "null"]
+            converted["type"] = types[0]
+            if len(types) < len(value):
+                converted["nullable"] = True
+        else:
+            converted[key] = gemini_schema(value)
+    return converted
+
+
+PROVIDERS = {
+    OpenAIBackend.provider: OpenAIBackend,
+    GeminiBackend.provider: GeminiBackend,
+}
+
+# Display label -> (provider, model id, backend options)
+MODEL_REGISTRY = {}
+
+
+def register_model(label, provider, model_id, **options):
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown provider {provider!r}; expected one of {sorted(PROVIDERS)}")
+    MODEL_REGISTRY[label] = (provider, model_id, options)
+
+
+register_model("OpenAI GPT-4o", "openai", "gpt-4o")
+# Predates structured outputs; JSON mode is used instead
+register_model("OpenAI GPT-3.5-Turbo-0125", "openai", "gpt-3.5-turbo-0125", structured_output=False)
+register_model("Google Gemini 2.5", "gemini", "gemini-2.5-pro-preview-03-25")
+
+
+def model_provider(label):
+    return MODEL_REGISTRY[label][0]
+
+
+@functools.lru_cache(maxsize=None)
+def get_backend(label, api_key, timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES, base_url=None):
+    """The process-wide backend for a registered model label."""
+    provider, model_id, options = MODEL_REGISTRY[label]
+    return PROVIDERS[provider](
+        model_id, api_key, timeout=timeout, max_retries=max_retries, base_url=base_url, **options
+    )
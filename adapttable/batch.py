@@ -0,0 +1,317 @@
+"""Headless batch processing of archived receipts.
+
+    python -m adapttable.batch archive/ --out results/ --processes 4 --threads 8
+    python -m adapttable.batch households.jsonl --out results/ --model "Google Gemini 2.5"
+
+Runs the same pipeline as the app (``adapttable.household``) for every
+household in a source, and writes one ``<household>.json`` per household to
+the output directory.  A source is one of:
+
+- a directory: each subdirectory is a household of the images inside it, and
+  images directly in the directory form one household named after it;
+- a ``.jsonl`` manifest: ``{"household": "id", "images": ["a.jpg", ...]}`` per
+  line, paths relative to the manifest;
+- a ``.csv`` manifest with ``household`` and ``image`` columns.
+
+Households run on ``threads`` threads in each of ``processes`` processes.
+Requests to each provider go through a token-bucket ``RateLimiter``; with
+several processes each gets an equal share of the per-minute limit.  Output
+files double as checkpoints: a rerun skips households whose output is
+complete and was produced with the same settings, and the on-disk OCR and
+response caches make a household interrupted part-way cheap to redo.  With
+``--history`` each household's receipts are also added to the purchase
+history (``adapttable.history``) under its id, and its summary draws on
+everything stored for it.
+``run_batch`` is the importable entry point.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+from adapttable.backends import DEFAULT_MAX_RETRIES, DEFAULT_TIMEOUT, MODEL_REGISTRY, get_backend, model_provider
+from adapttable.cache import CACHE_DIR, DiskCache, ResponseCache
+from adapttable.expansions import ExpansionIndex
+from adapttable.history import PurchaseHistory
+from adapttable.household import analyze_household, make_complete
+from adapttable.ocr import VISION_URL
+from adapttable.pipeline import content_hash
+from adapttable.tracing import Tracer
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+class RateLimiter:
+    """Token bucket allowing ``rate`` acquisitions per ``per`` seconds, in bursts of up to ``rate``."""
+
+    def __init__(self, rate, per=60.0):
+        self.capacity = max(1.0, rate)
+        self.fill_rate = rate / per
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+
+@dataclass
+class BatchConfig:
+    model: str = next(iter(MODEL_REGISTRY))
+    vision_api_key: str = None
+    openai_api_key: str = None
+    gemini_api_key: str = None
+    vision_url: str = VISION_URL
+    openai_base_url: str = None
+    gemini_base_url: str = None
+    single_call: bool = False
+    filter_lines: bool = True
+    preprocess: bool = True
+    crop: bool = False
+    # Requests per minute, per provider, across all processes
+    vision_rpm: float = 1800
+    openai_rpm: float = 500
+    gemini_rpm: float = 60
+    threads: int = 4
+    use_cache: bool = True
+    cache_dir: str = str(CACHE_DIR)
+    timeout: float = DEFAULT_TIMEOUT
+    max_retries: int = DEFAULT_MAX_RETRIES
+    trace_dir: str = None
+    # Add parsed receipts to the purchase history under the household id, and summarize from it
+    history: bool = False
+
+    def output_key(self):
+        """Key of the settings that change a household's output, for checkpoint validity."""
+        flags = (self.single_call, self.filter_lines, self.preprocess, self.crop, self.history)
+        return content_hash(self.model, *(str(flag) for flag in flags))
+
+
+def load_households(source):
+    """``{household id: [image paths]}`` from a directory or manifest."""
+    source = Path(source)
+    households = {}
+    if source.is_dir():
+        images = sorted(path for path in source.iterdir() if path.suffix.lower() in IMAGE_SUFFIXES)
+        if images:
+            households[source.name] = images
+        for directory in sorted(path for path in source.iterdir() if path.is_dir()):
+            images = sorted(path for path in directory.iterdir() if path.suffix.lower() in IMAGE_SUFFIXES)
+            if images:
+                households[directory.name] = images
+    elif source.suffix == ".jsonl":
+        with open(source, encoding="utf-8") as handle:
+            for line in handle:
+                if line.strip():
+                    entry = json.loads(line)
+                    households.setdefault(str(entry["household"]), []).extend(
+                        source.parent / image for image in entry["images"]
+                    )
+    elif source.suffix == ".csv":
+        with open(source, newline="", encoding="utf-8") as handle:
+            for row in csv.DictReader(handle):
+                households.setdefault(row["household"], []).append(source.parent / row["image"])
+    else:
+        raise ValueError(f"Expected a directory, .jsonl or .csv manifest, got {source}")
+    return households
+
+
+def output_path(out_dir, household):
+    safe_name = re.sub(r"[^\w.-]", "_", household)
+    return Path(out_dir) / f"{safe_name}.json"
+
+
+def is_done(out_dir, household, config):
+    try:
+        data = json.loads(output_path(out_dir, household).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return False
+    return data.get("status") == "ok" and data.get("config_key") == config.output_key()
+
+
+def _write_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    with os.fdopen(fd, "w", encoding="utf-8") as handle:
+        json.dump(data, handle, indent=2)
+    os.replace(tmp, path)
+
+
+def process_households(households, out_dir, config, processes=1, on_done=None):
+    """Process ``{id: [paths]}`` in this process; returns ``{id: "ok" | error message}``.
+
+    ``processes`` is how many processes share the rate limits.
+    """
+    cache_dir = Path(config.cache_dir)
+    provider = model_provider(config.model)
+    api_key = config.openai_api_key if provider == "openai" else config.gemini_api_key
+    base_url = config.openai_base_url if provider == "openai" else config.gemini_base_url
+    model_rpm = config.openai_rpm if provider == "openai" else config.gemini_rpm
+    tracer = None
+    if config.trace_dir:
+        # One log per process; rotating handlers can't share a file across processes
+        tracer = Tracer(Path(config.trace_dir) / f"spans-{os.getpid()}.jsonl")
+
+    complete = make_complete(
+        get_backend(config.model, api_key, timeout=config.timeout, max_retries=config.max_retries,
+                    base_url=base_url),
+        config.model,
+        response_cache=ResponseCache(cache_dir / "responses.sqlite3") if config.use_cache else None,
+        tracer=tracer,
+        limiter=RateLimiter(model_rpm / processes),
+    )
+    ocr_limiter = RateLimiter(config.vision_rpm / processes)
+    ocr_cache = DiskCache(cache_dir / "ocr") if config.use_cache else None
+    expansion_index = ExpansionIndex(cache_dir / "expansions.json")
+    history = PurchaseHistory(cache_dir / "history.sqlite3") if config.history else None
+
+    def run_one(household, paths):
+        start = time.perf_counter()
+        try:
+            result = analyze_household(
+                [path.read_bytes() for path in paths],
+                complete,
+                config.vision_api_key,
+                names=[path.name for path in paths],
+                vision_url=config.vision_url,
+                ocr_cache=ocr_cache,
+                expansion_index=expansion_index,
+                single_call=config.single_call,
+                filter_lines=config.filter_lines,
+                preprocess=config.preprocess,
+                crop=config.crop,
+                ocr_limiter=ocr_limiter,
+                history=history,
+                household=household,
+            )
+            if not result.receipts:
+                raise RuntimeError("no receipt could be read")
+            data = {"household": household, "status": "ok", **result.to_dict()}
+            status = "ok"
+        except Exception as e:
+            status = f"{type(e).__name__}: {e}"
+            data = {"household": household, "status": "error", "error": status}
+        data["config_key"] = config.output_key()
+        data["elapsed"] = time.perf_counter() - start
+        _write_json(output_path(out_dir, household), data)
+        if on_done is not None:
+            on_done(household, status, data["elapsed"])
+        return status
+
+    statuses = {}
+    with ThreadPoolExecutor(max_workers=max(1, config.threads)) as pool:
+        futures = {pool.submit(run_one, household, paths): household for household, paths in households.items()}
+        for future in as_completed(futures):
+            statuses[futures[future]] = future.result()
+    # Concurrent processes would overwrite each other's additions to the shared index
+    if processes == 1:
+        expansion_index.save()
+    if tracer is not None:
+        tracer.write_metrics()
+    return statuses
+
+
+def run_batch(households, out_dir, config=None, processes=1, on_done=None):
+    """Process every household not already done; returns ``{id: "ok" | "skipped" | error message}``.
+
+    ``households`` is ``{id: [image paths]}`` (see ``load_households``).
+    ``on_done(household, status, seconds)`` is called as each one finishes
+    (in the worker process when ``processes > 1``).
+    """
+    config = config or BatchConfig()
+    statuses = {household: "skipped" for household in households if is_done(out_dir, household, config)}
+    pending = {household: paths for household, paths in households.items() if household not in statuses}
+    if not pending:
+        return statuses
+
+    processes = max(1, min(processes, len(pending)))
+    if processes == 1:
+        statuses.update(process_households(pending, out_dir, config, on_done=on_done))
+        return statuses
+
+    # Round-robin so every process gets a similar mix of households
+    items = list(pending.items())
+    chunks = [dict(items[i::processes]) for i in range(processes)]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(process_households, chunk, out_dir, config, processes, on_done) for chunk in chunks]
+        for future in as_completed(futures):
+            statuses.update(future.result())
+    return statuses
+
+
+def _print_done(household, status, seconds):
+    print(f"{household}: {status} ({seconds:.1f}s)", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the receipt pipeline over archived households.")
+    parser.add_argument("source", help="Directory of households, or a .jsonl/.csv manifest")
+    parser.add_argument("--out", required=True, help="Directory for per-household JSON (and checkpoints)")
+    parser.add_argument("--model", default=BatchConfig.model, choices=list(MODEL_REGISTRY))
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=BatchConfig.threads, help="Households per process at once")
+    parser.add_argument("--single-call", action="store_true", help="Summary and guidance in one model call")
+    parser.add_argument("--no-filter", action="store_true", help="Send every OCR line to the parser")
+    parser.add_argument("--no-preprocess", action="store_true", help="Send images to Vision as uploaded")
+    parser.add_argument("--crop", action="store_true", help="Crop images to the receipt outline")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the OCR and response caches")
+    parser.add_argument("--vision-rpm", type=float, default=BatchConfig.vision_rpm)
+    parser.add_argument("--openai-rpm", type=float, default=BatchConfig.openai_rpm)
+    parser.add_argument("--gemini-rpm", type=float, default=BatchConfig.gemini_rpm)
+    parser.add_argument("--vision-url", default=VISION_URL)
+    parser.add_argument("--openai-base-url")
+    parser.add_argument("--gemini-base-url")
+    parser.add_argument("--trace-dir", help="Write per-process span logs here")
+    parser.add_argument("--history", action="store_true",
+                        help="Add receipts to each household's purchase history and summarize from it")
+    args = parser.parse_args()
+
+    config = BatchConfig(
+        model=args.model,
+        vision_api_key=os.environ.get("GOOGLE_VISION_API_KEY"),
+        openai_api_key=os.environ.get("OPENAI_API_KEY"),
+        gemini_api_key=os.environ.get("GOOGLE_AI_API_KEY"),
+        vision_url=args.vision_url,
+        openai_base_url=args.openai_base_url,
+        gemini_base_url=args.gemini_base_url,
+        single_call=args.single_call,
+        filter_lines=not args.no_filter,
+        preprocess=not args.no_preprocess,
+        crop=args.crop,
+        vision_rpm=args.vision_rpm,
+        openai_rpm=args.openai_rpm,
+        gemini_rpm=args.gemini_rpm,
+        threads=args.threads,
+        use_cache=not args.no_cache,
+        trace_dir=args.trace_dir,
+        history=args.history,
+    )
+    households = load_households(args.source)
+    print(f"{len(households)} household(s), model {config.model}, {args.processes} process(es) x {config.threads} thread(s)")
+    statuses = run_batch(households, args.out, config, processes=args.processes, on_done=_print_done)
+
+    counts = {"ok": 0, "skipped": 0, "error": 0}
+    for status in statuses.values():
+        counts[status if status in counts else "error"] += 1
+    print(f"Done: {counts['ok']} processed, {counts['skipped']} already done, {counts['error']} failed")
+    raise SystemExit(1 if counts["error"] else 0)
+
+
+if __name__ == "__main__":
+    main()
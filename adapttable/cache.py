@@ -0,0 +1,214 @@
+"""Persistent caches shared across sessions.
+
+``DiskCache`` stores text values under content-derived keys (e.g. the SHA-256
+of a receipt image) as one file per entry.  A hit refreshes the entry's mtime,
+which doubles as its last-access time for LRU eviction; entries older than
+``max_age`` seconds are dropped, and the least recently used ones go first
+once the directory grows past ``max_bytes``.  The directory's size is tracked
+as entries are written, so it is only scanned when that total passes
+``max_bytes`` or every ``SCAN_INTERVAL`` seconds (to expire old entries and
+pick up other processes' writes).  ``ImageStore`` is the same
+layout holding uploaded receipt images, keyed by their SHA-256, so sessions
+keep only the key.  ``ResponseCache`` keeps model responses in SQLite, keyed
+on provider, model and prompts.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Longest a DiskCache goes without a full scan of its directory
+SCAN_INTERVAL = 3600
+# A scan over budget evicts down to this fraction of it, so a full cache isn't rescanned on every write
+EVICT_TO = 0.9
+
+CACHE_DIR = Path(
+    os.environ.get("ADAPTTABLE_CACHE_DIR", Path(__file__).resolve().parent.parent / ".cache")
+)
+
+
+class DiskCache:
+    # Values are str; subclasses storing bytes set this
+    binary = False
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024, max_age=30 * 24 * 3600):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._total_bytes = None  # unknown until the first scan
+        self._last_scan = 0.0
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.directory / key[:2] / key
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                return None
+            value = path.read_bytes() if self.binary else path.read_text(encoding="utf-8")
+            os.utime(path)  # mark as recently used
+            return value
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            replaced = path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        # Write-then-rename so concurrent readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        with os.fdopen(fd, "wb" if self.binary else "w", encoding=None if self.binary else "utf-8") as handle:
+            handle.write(value)
+        written = os.path.getsize(tmp)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += written - replaced
+            due = (
+                self._total_bytes is None
+                or self._total_bytes > self.max_bytes
+                or time.time() - self._last_scan >= SCAN_INTERVAL
+            )
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones if over ``max_bytes``."""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for path in self.directory.glob("*/*"):
+                if path.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                if now - stat.st_mtime > self.max_age:
+                    path.unlink(missing_ok=True)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes if total <= self.max_bytes else self.max_bytes * EVICT_TO
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+            self._total_bytes = total
+            self._last_scan = now
+
+
+class ImageStore(DiskCache):
+    """Content-addressed on-disk store of uploaded receipt images.
+
+    Shared by every session in the process (and across restarts); identical
+    uploads are stored once.  Images untouched for ``max_age`` seconds, and
+    the least recently used past ``max_bytes``, are evicted, so a caller
+    must handle ``get`` returning None for an image it stored long ago.
+    """
+
+    binary = True
+
+    def __init__(self, directory, max_bytes=2 * 1024 * 1024 * 1024, max_age=7 * 24 * 3600):
+        super().__init__(directory, max_bytes=max_bytes, max_age=max_age)
+
+    def put(self, image_bytes):
+        """Store ``image_bytes`` (if not already there); returns its key, the SHA-256 hex digest."""
+        key = hashlib.sha256(image_bytes).hexdigest()
+        path = self._path(key)
+        if path.exists():
+            os.utime(path)
+        else:
+            self.set(key, image_bytes)
+        return key
+
+
+class ResponseCache:
+    """SQLite-backed model response cache with a TTL and a max entry count.
+
+    Keys cover the provider, model id and both prompts, so any change to a
+    prompt (or its embedded master record) is a miss.  Least recently used
+    entries are evicted once ``max_entries`` is exceeded.  A connection is
+    opened per operation, which keeps the cache safe to use from worker
+    threads and from several processes at once.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=5000):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+            )
+
+    def _connect(self):
+        return closing_connection(sqlite3.connect(self.path, timeout=10))
+
+    @staticmethod
+    def make_key(provider, model, system_prompt, user_prompt, response_schema=None):
+        payload = json.dumps([provider, model, system_prompt, user_prompt, response_schema])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+@contextlib.contextmanager
+def closing_connection(conn):
+    """Commit (or roll back) and always close an sqlite3 connection."""
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
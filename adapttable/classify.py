@@ -0,0 +1,404 @@
+"""Local food classification of master-record items.
+
+Every item name is mapped to a food category, an approximate glycemic band
+(low / medium / high, or neutral for non-food and drinks like water) and
+fiber/protein flags, using a hand-built lexicon rather than a model call.
+Names are tokenized against token indexes of food terms and modifiers
+(longer phrases such as "sweet potato" win over their single words; a word
+that is both, like "strawberry", is a modifier when a food follows it), and
+the attributes of every match are gathered from NumPy lookup columns and
+reduced per item in one pass: the band is the highest band of any food term,
+adjusted by modifiers ("whole wheat", "sugar free"); the category and fiber
+flag come from the head term (the last one in the name); protein is set if
+any term has it.  A name with any non-food term is non-food whatever else it matches
+("Bounty Paper Towels 6 Roll" is not a bread roll).
+
+``partition_record`` uses this to give each guidance prompt only the items
+it needs.  Items the lexicon does not know go to both prompts, so the model
+still sees everything it would have judged before; non-food items go to
+neither.
+"""
+import functools
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from adapttable.receipts import MasterRecord, Receipt
+
+NEUTRAL, LOW, MEDIUM, HIGH = 0, 1, 2, 3
+BAND_NAMES = {NEUTRAL: "neutral", LOW: "low", MEDIUM: "medium", HIGH: "high"}
+UNKNOWN = "unclassified"
+NON_FOOD = "non-food"
+REFINED_GRAINS, WHOLE_GRAINS = "refined grains", "whole grains"
+
+# term, category, glycemic band, fiber, protein
+FOOD_TERMS = [
+    # Vegetables
+    *((term, "vegetables", LOW, True, False) for term in (
+        "spinach", "kale", "lettuce", "romaine", "arugula", "broccoli", "cauliflower", "carrot", "celery",
+        "cucumber", "pepper", "onion", "tomato", "zucchini", "cabbage", "asparagus", "green bean",
+        "mushroom", "salad", "greens", "brussels sprout", "squash", "eggplant", "garlic", "radish", "beet",
+        "okra", "leek", "veggie", "vegetable", "coleslaw", "pickle",
+    )),
+    ("potato", "starchy vegetables", HIGH, False, False),
+    ("sweet potato", "starchy vegetables", MEDIUM, True, False),
+    ("corn", "starchy vegetables", MEDIUM, True, False),
+    ("peas", "starchy vegetables", LOW, True, True),
+    ("french fry", "prepared foods", HIGH, False, False),
+    ("fries", "prepared foods", HIGH, False, False),
+    ("hash brown", "prepared foods", HIGH, False, False),
+    ("tater tot", "prepared foods", HIGH, False, False),
+    # Fruit
+    *((term, "fruit", LOW, True, False) for term in (
+        "apple", "berry", "strawberry", "blueberry", "raspberry", "blackberry", "orange", "pear", "cherry",
+        "grapefruit", "lemon", "lime", "peach", "plum", "kiwi", "clementine", "mandarin", "apricot",
+    )),
+    *((term, "fruit", MEDIUM, True, False) for term in ("banana", "grape", "pineapple", "mango", "melon", "cantaloupe", "papaya")),
+    ("watermelon", "fruit", HIGH, False, False),
+    ("raisin", "fruit", HIGH, True, False),
+    ("date", "fruit", HIGH, True, False),
+    ("dried fruit", "fruit", HIGH, True, False),
+    ("applesauce", "fruit", MEDIUM, False, False),
+    ("avocado", "healthy fats", LOW, True, False),
+    # Legumes
+    *((term, "legumes", LOW, True, True) for term in (
+        "bean", "lentil", "chickpea", "garbanzo", "hummus", "edamame", "black bean", "kidney bean",
+        "pinto bean", "refried bean",
+    )),
+    ("tofu", "proteins", LOW, False, True),
+    ("tempeh", "proteins", LOW, True, True),
+    # Grains
+    ("oat", WHOLE_GRAINS, LOW, True, False),
+    ("oatmeal", WHOLE_GRAINS, MEDIUM, True, False),
+    ("cream of wheat", REFINED_GRAINS, HIGH, False, False),
+    ("cream of rice", REFINED_GRAINS, HIGH, False, False),
+    ("quinoa", WHOLE_GRAINS, LOW, True, True),
+    ("barley", WHOLE_GRAINS, LOW, True, False),
+    ("brown rice", WHOLE_GRAINS, MEDIUM, True, False),
+    ("bran", WHOLE_GRAINS, LOW, True, False),
+    *((term, REFINED_GRAINS, HIGH, False, False) for term in (
+        "bread", "bagel", "rice", "white rice", "cereal", "cracker", "flour", "pancake", "waffle", "muffin",
+        "croissant", "bun", "roll", "biscuit", "pretzel", "rice cake", "cornflake", "white bread",
+        "english muffin", "pita", "naan", "frosted flake", "corn flake", "rice krispie", "froot loop",
+        "lucky charm",
+    )),
+    *((term, REFINED_GRAINS, MEDIUM, False, False) for term in (
+        "pasta", "spaghetti", "macaroni", "penne", "noodle", "tortilla", "couscous", "ramen", "lasagna",
+        "cheerio", "shredded wheat", "raisin bran",
+    )),
+    # Proteins
+    *((term, "proteins", LOW, False, True) for term in (
+        "chicken", "beef", "pork", "turkey", "ham", "bacon", "sausage", "fish", "salmon", "tuna", "shrimp",
+        "egg", "steak", "ground beef", "lamb", "cod", "tilapia", "sardine", "jerky", "deli", "meatball",
+        "chorizo", "hot dog", "pepperoni", "salami", "crab", "scallop", "rotisserie",
+    )),
+    ("nugget", "prepared foods", MEDIUM, False, True),
+    ("fish stick", "prepared foods", MEDIUM, False, True),
+    # Dairy
+    *((term, "dairy", LOW, False, True) for term in (
+        "milk", "yogurt", "yoghurt", "greek yogurt", "cheese", "cottage cheese", "cheddar", "mozzarella",
+        "parmesan", "kefir", "string cheese", "cream cheese", "skyr",
+    )),
+    ("butter", "fats and oils", LOW, False, False),
+    ("cream", "fats and oils", LOW, False, False),
+    ("sour cream", "fats and oils", LOW, False, False),
+    ("half and half", "fats and oils", LOW, False, False),
+    ("creamer", "fats and oils", MEDIUM, False, False),
+    ("oil", "fats and oils", NEUTRAL, False, False),
+    ("olive oil", "fats and oils", NEUTRAL, False, False),
+    ("margarine", "fats and oils", NEUTRAL, False, False),
+    # Nuts and seeds
+    *((term, "nuts and seeds", LOW, True, True) for term in (
+        "almond", "walnut", "peanut", "pecan", "cashew", "pistachio", "nut", "peanut butter",
+        "almond butter", "seed", "chia", "flax", "sunflower", "pumpkin seed", "trail mix",
+    )),
+    ("almond milk", "dairy alternatives", LOW, False, False),
+    ("oat milk", "dairy alternatives", MEDIUM, False, False),
+    ("soy milk", "dairy alternatives", LOW, False, True),
+    # Snacks and sweets
+    *((term, "snacks", HIGH, False, False) for term in (
+        "chip", "crisp", "tortilla chip", "cheese puff", "granola bar", "fruit snack", "snack", "goldfish",
+        "cheez it", "dorito", "cheeto", "pringle",
+    )),
+    ("popcorn", "snacks", MEDIUM, True, False),
+    ("granola", "snacks", HIGH, True, False),
+    ("protein bar", "snacks", MEDIUM, False, True),
+    *((term, "sweets", HIGH, False, False) for term in (
+        "cookie", "cake", "cupcake", "candy", "chocolate", "donut", "doughnut", "brownie", "pie", "syrup",
+        "honey", "sugar", "jam", "jelly", "ice cream", "frosting", "pastry", "pudding", "marshmallow",
+        "gummy", "oreo", "poptart", "pop tart", "danish", "cinnamon roll", "sweet roll", "sherbet",
+        "popsicle", "nutella", "caramel", "dessert", "twinkie",
+    )),
+    # Drinks
+    *((term, "sugary drinks", HIGH, False, False) for term in (
+        "soda", "cola", "coke", "pepsi", "sprite", "juice", "lemonade", "sports drink", "gatorade",
+        "powerade", "kool aid", "sweet tea", "punch", "energy drink", "red bull", "dr pepper",
+        "mountain dew", "fanta", "capri sun", "smoothie", "frappuccino",
+    )),
+    *((term, "drinks", NEUTRAL, False, False) for term in (
+        "diet soda", "diet coke", "diet pepsi", "coke zero", "pepsi zero", "water", "coffee", "tea", "sparkling water", "seltzer", "club soda", "la croix", "espresso",
+    )),
+    ("beer", "alcohol", MEDIUM, False, False),
+    ("wine", "alcohol", LOW, False, False),
+    # Condiments and prepared foods
+    *((term, "condiments", NEUTRAL, False, False) for term in (
+        "mustard", "salsa", "vinegar", "soy sauce", "hot sauce", "spice", "seasoning", "salt", "pepper sauce",
+        "mayo", "mayonnaise",
+    )),
+    *((term, "condiments", MEDIUM, False, False) for term in ("ketchup", "dressing", "sauce", "pasta sauce", "gravy")),
+    ("bbq sauce", "condiments", HIGH, False, False),
+    ("barbecue sauce", "condiments", HIGH, False, False),
+    *((term, "prepared foods", HIGH, False, False) for term in (
+        "pizza", "mac and cheese", "mac n cheese", "frozen dinner", "tv dinner", "hot pocket", "corn dog",
+    )),
+    *((term, "prepared foods", MEDIUM, False, True) for term in ("burrito", "soup", "chili", "sandwich", "taco")),
+    # Not food; any of these makes the whole name non-food, so words that also
+    # name foods ("cup", "bag", "vitamin") only appear in unambiguous phrases
+    *((term, NON_FOOD, NEUTRAL, False, False) for term in (
+        "towel", "paper towel", "toilet paper", "tissue", "napkin", "detergent", "soap", "shampoo",
+        "conditioner", "foil", "plastic wrap", "trash bag", "garbage bag", "freezer bag", "storage bag",
+        "sandwich bag", "diaper", "wipe", "cleaner", "bleach", "toothpaste", "toothbrush", "deodorant",
+        "lotion", "battery", "light bulb", "dish sponge", "dish soap", "pet food", "dog food", "cat food",
+        "cat litter", "litter", "multivitamin", "medicine", "bandage", "razor", "candle", "gift card",
+        "greeting card", "charcoal", "ziploc", "paper cup", "plastic cup", "paper plate",
+    )),
+]
+
+# term, glycemic band shift, fiber, protein, caps the band at low.
+# Fiber modifiers also turn a refined grain into a whole grain ("whole wheat bread").
+MODIFIERS = [
+    *((term, -1, True, False, False) for term in (
+        "whole wheat", "whole grain", "multigrain", "wholemeal", "high fiber", "sprouted",
+    )),
+    *((term, 0, False, False, True) for term in ("sugar free", "diet", "zero", "unsweetened", "no sugar", "zero sugar", "sf")),
+    *((term, 0, False, True, False) for term in ("high protein", "protein")),
+    *((term, 1, False, False, False) for term in (
+        "sweetened", "frosted", "glazed", "honey", "chocolate", "candied", "sugar", "caramel", "maple",
+        "vanilla", "strawberry", "instant", "white",
+    )),
+]
+
+# Longest lexicon phrase, in words
+MAX_PHRASE_WORDS = 3
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _variants(term):
+    """The term plus plural spellings of its last word, for exact token lookups."""
+    *head, last = term.split()
+    forms = {last, f"{last}s", f"{last}es"}
+    if last.endswith("y") and len(last) > 3:
+        forms.add(f"{last[:-1]}ies")
+    if last.endswith("f"):
+        forms.add(f"{last[:-1]}ves")
+    return {" ".join(head + [form]) for form in forms}
+
+
+@dataclass(frozen=True)
+class ItemClass:
+    category: str
+    band: int
+    fiber: bool = False
+    protein: bool = False
+
+    @property
+    def band_name(self):
+        return BAND_NAMES[self.band]
+
+
+class FoodClassifier:
+    """Vectorized lookup of ``ItemClass`` for item names (see the module docstring)."""
+
+    def __init__(self, terms=FOOD_TERMS, modifiers=MODIFIERS):
+        self.categories = sorted({category for _, category, _, _, _ in terms} | {WHOLE_GRAINS}) + [UNKNOWN]
+        category_ids = {category: index for index, category in enumerate(self.categories)}
+        self.refined_grains, self.whole_grains = category_ids[REFINED_GRAINS], category_ids[WHOLE_GRAINS]
+        self.non_food = category_ids.get(NON_FOOD, -1)
+        rows = [(category_ids[category], band, fiber, protein, 0, False, False)
+                for _, category, band, fiber, protein in terms]
+        rows += [(-1, NEUTRAL, fiber, protein, shift, sugar_free, True)
+                 for _, shift, fiber, protein, sugar_free in modifiers]
+        columns = list(zip(*rows))
+        self.category = np.array(columns[0], dtype=np.int16)
+        self.band = np.array(columns[1], dtype=np.int8)
+        self.fiber = np.array(columns[2], dtype=bool)
+        self.protein = np.array(columns[3], dtype=bool)
+        self.shift = np.array(columns[4], dtype=np.int8)
+        self.sugar_free = np.array(columns[5], dtype=bool)
+        self.is_modifier = np.array(columns[6], dtype=bool)
+
+        # Token indexes: phrases (with plurals) -> row, kept apart so a word can be both
+        self.food_index, self.modifier_index = {}, {}
+        for index, entries, offset in ((self.food_index, terms, 0), (self.modifier_index, modifiers, len(terms))):
+            for row, (term, *_) in reversed(list(enumerate(entries, offset))):
+                for variant in _variants(term):
+                    index[variant] = row
+        # First words of multi-word phrases (any other word is looked up on its own) and of modifiers
+        self._phrase_starts = {variant.split()[0] for variant in [*self.food_index, *self.modifier_index]
+                               if " " in variant}
+        self._modifier_starts = {variant.split()[0] for variant in self.modifier_index}
+
+    def _longest(self, index, tokens, position):
+        """``(row, words)`` of the longest phrase in ``index`` starting at ``position``, or ``(None, 0)``."""
+        if tokens[position] in self._phrase_starts:
+            for words in range(min(MAX_PHRASE_WORDS, len(tokens) - position), 1, -1):
+                row = index.get(" ".join(tokens[position:position + words]))
+                if row is not None:
+                    return row, words
+        row = index.get(tokens[position])
+        return (row, 1) if row is not None else (None, 0)
+
+    def _food_from(self, tokens, position):
+        """Whether a food phrase starts at or after ``position``."""
+        return any(self._longest(self.food_index, tokens, start)[0] is not None
+                   for start in range(position, len(tokens)))
+
+    def _matches(self, names):
+        """Flat ``(item, row, position)`` arrays of lexicon hits, longest phrases first.
+
+        ``position`` is that of the hit's last word.
+        """
+        items, rows, positions = [], [], []
+        for item, name in enumerate(names):
+            tokens = _TOKEN.findall(name.lower())
+            position = 0
+            while position < len(tokens):
+                row, words = self._longest(self.food_index, tokens, position)
+                if tokens[position] in self._modifier_starts:
+                    modifier, modifier_words = self._longest(self.modifier_index, tokens, position)
+                    # A word that is both ("strawberry", "honey") flavors a food after it, else is the food
+                    if modifier is not None and (
+                        modifier_words > words
+                        or (modifier_words == words and self._food_from(tokens, position + words))
+                    ):
+                        row, words = modifier, modifier_words
+                if row is None:
+                    position += 1
+                    continue
+                items.append(item)
+                rows.append(row)
+                positions.append(position + words - 1)
+                position += words
+        return (
+            np.array(items, dtype=np.int64),
+            np.array(rows, dtype=np.int64),
+            np.array(positions, dtype=np.int64),
+        )
+
+    def classify(self, names):
+        """One ``ItemClass`` per name, in order."""
+        count = len(names)
+        items, rows, positions = self._matches(names)
+        modifier = self.is_modifier[rows]
+
+        band = np.zeros(count, dtype=np.int8)
+        np.maximum.at(band, items[~modifier], self.band[rows[~modifier]])
+        protein = np.zeros(count, dtype=bool)
+        np.logical_or.at(protein, items, self.protein[rows])
+
+        # Head term: the last food term in each name
+        category = np.full(count, len(self.categories) - 1, dtype=np.int16)
+        fiber = np.zeros(count, dtype=bool)
+        food_items, food_rows, food_positions = items[~modifier], rows[~modifier], positions[~modifier]
+        order = np.lexsort((food_positions, food_items))
+        food_items, food_rows = food_items[order], food_rows[order]
+        if len(food_items):
+            last = np.flatnonzero(np.r_[food_items[1:] != food_items[:-1], True])
+            category[food_items[last]] = self.category[food_rows[last]]
+            fiber[food_items[last]] = self.fiber[food_rows[last]]
+
+        # Any non-food term overrides the head term
+        non_food = np.zeros(count, dtype=bool)
+        np.logical_or.at(non_food, items[~modifier], self.category[rows[~modifier]] == self.non_food)
+        category[non_food] = self.non_food
+        band[non_food] = NEUTRAL
+        fiber[non_food] = protein[non_food] = False
+
+        # Modifiers only adjust items that matched a food with a glycemic band
+        shift = np.zeros(count, dtype=np.int8)
+        np.add.at(shift, items[modifier], self.shift[rows[modifier]])
+        whole = np.zeros(count, dtype=bool)
+        np.logical_or.at(whole, items[modifier], self.fiber[rows[modifier]])
+        whole &= ~non_food
+        fiber |= whole
+        category[whole & (category == self.refined_grains)] = self.whole_grains
+        sugar_free = np.zeros(count, dtype=bool)
+        np.logical_or.at(sugar_free, items[modifier], self.sugar_free[rows[modifier]])
+        banded = band > NEUTRAL
+        band[banded] = np.clip(band[banded] + shift[banded], LOW, HIGH)
+        band[banded & sugar_free] = LOW
+
+        return [
+            ItemClass(self.categories[category[i]], int(band[i]), bool(fiber[i]), bool(protein[i]))
+            for i in range(count)
+        ]
+
+
+@functools.lru_cache(maxsize=None)
+def default_classifier():
+    return FoodClassifier()
+
+
+def is_helpful(item_class):
+    if item_class.category == NON_FOOD:
+        return False
+    if item_class.category == UNKNOWN:
+        return True
+    return item_class.band == LOW or (item_class.band == MEDIUM and (item_class.fiber or item_class.protein))
+
+
+def is_challenging(item_class):
+    if item_class.category == NON_FOOD:
+        return False
+    if item_class.category == UNKNOWN:
+        return True
+    return item_class.band == HIGH or (item_class.band == MEDIUM and not (item_class.fiber or item_class.protein))
+
+
+@dataclass
+class FoodPartition:
+    helpful: MasterRecord = field(default_factory=MasterRecord)
+    challenging: MasterRecord = field(default_factory=MasterRecord)
+    category_counts: dict = field(default_factory=dict)  # category -> items (with repeats), largest first
+
+    def record_for(self, stage):
+        """The subset for a guidance stage (``"helpful_foods"`` or ``"challenging_foods"``)."""
+        return self.helpful if stage == "helpful_foods" else self.challenging
+
+
+def _subset(master_record, keep):
+    """Receipts with only the items ``keep(item)`` accepts, each distinct name once."""
+    seen = set()
+    receipts = []
+    for receipt in master_record.receipts:
+        items = []
+        for item in receipt.items:
+            name = item.name.casefold()
+            if name not in seen and keep(item):
+                seen.add(name)
+                items.append(item)
+        if items:
+            receipts.append(Receipt(receipt.store, receipt.date, tuple(items)))
+    return MasterRecord(receipts)
+
+
+def partition_record(master_record, classifier=None):
+    """Split a master record into the items each guidance prompt needs, plus category counts.
+
+    Ambiguous items (no confident expansion) are left for the model in both subsets;
+    non-food items are in neither, but are counted.
+    """
+    classifier = classifier or default_classifier()
+    items = master_record.items
+    classes = {}
+    for item, item_class in zip(items, classifier.classify([item.name for item in items])):
+        classes[item] = ItemClass(UNKNOWN, NEUTRAL) if item.ambiguous else item_class
+    counts = Counter(classes[item].category for item in items)
+    return FoodPartition(
+        helpful=_subset(master_record, lambda item: is_helpful(classes[item])),
+        challenging=_subset(master_record, lambda item: is_challenging(classes[item])),
+        category_counts=dict(counts.most_common()),
+    )
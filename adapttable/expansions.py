@@ -0,0 +1,200 @@
+"""Local abbreviation expansion index for receipt items.
+
+Receipt lines repeat heavily within a chain ("GV SHP SH", "HP JUICE"), so
+confident expansions from past parser runs are kept per store, keyed by the
+normalized raw item.  Lookups try an exact match first, then fall back to a
+character trie: a truncated code resolves if it is a prefix of exactly one
+known item.  A line that only starts with a known item ("GV MILK CHOC" after
+"GV MILK") is not resolved, since its extra tokens may change what the item
+is.  Only lines the index cannot resolve are sent to the parser, and the two
+sets of items are merged back in receipt order.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+
+from adapttable.receipts import Receipt, ReceiptItem
+
+# Prefix matches shorter than this are too weak to trust
+MIN_PREFIX_LENGTH = 4
+# Lines searched for a known store name
+STORE_HEADER_LINES = 8
+
+_PRICE = re.compile(r"^-?\$?\d+[.,]\d{2}[A-Z]?$")
+_CODE = re.compile(r"^\d{6,}[A-Z]?$")
+_TERMINAL = "$"
+_COUNT = "#"
+
+
+def normalize_store(store):
+    return " ".join(re.findall(r"[a-z0-9]+", store.lower()))
+
+
+def normalize_item(raw):
+    """Upper-case, collapse whitespace and cut at the first UPC/price token."""
+    tokens = []
+    for token in raw.upper().split():
+        if _PRICE.match(token) or _CODE.match(token):
+            break
+        tokens.append(token)
+    return " ".join(tokens)
+
+
+class _Trie:
+    def __init__(self):
+        self.root = {_COUNT: 0}
+
+    def insert(self, key, value):
+        path = [self.root]
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {_COUNT: 0})
+            path.append(node)
+        if _TERMINAL not in node:
+            for visited in path:
+                visited[_COUNT] += 1
+        node[_TERMINAL] = value
+
+    def unique_completion(self, prefix):
+        """Value of the only key starting with ``prefix``, if exactly one does."""
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return None
+        if node[_COUNT] != 1:
+            return None
+        while _TERMINAL not in node:
+            node = next(child for char, child in node.items() if char not in (_COUNT, _TERMINAL))
+        return node[_TERMINAL]
+
+
+class ExpansionIndex:
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._stores = {}   # normalized store -> display name
+        self._entries = {}  # normalized store -> {normalized raw: expansion}
+        self._tries = {}
+        if self.path and self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            for entry in data.values():
+                for raw, expansion in entry["items"].items():
+                    self.add(entry["name"], raw, expansion)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    def add(self, store, raw, expansion):
+        store_key, raw_key = normalize_store(store), normalize_item(raw)
+        if not store_key or not raw_key or not expansion:
+            return
+        with self._lock:
+            self._stores.setdefault(store_key, store)
+            self._entries.setdefault(store_key, {})[raw_key] = expansion
+            self._tries.setdefault(store_key, _Trie()).insert(raw_key, expansion)
+
+    def seed(self, receipts):
+        """Learn every confident (non-ambiguous) expansion from parsed receipts."""
+        for receipt in receipts:
+            for item in receipt.items:
+                if not item.ambiguous and item.expansion:
+                    self.add(receipt.store, item.raw, item.expansion)
+
+    def detect_store(self, receipt_text):
+        """Known store whose name appears in the receipt header, if any."""
+        header = normalize_store(" ".join(receipt_text.splitlines()[:STORE_HEADER_LINES]))
+        matches = [key for key in self._entries if f" {key} " in f" {header} "]
+        return max(matches, key=len) if matches else None
+
+    def lookup(self, store_key, raw):
+        entries = self._entries.get(store_key)
+        if not entries:
+            return None
+        raw_key = normalize_item(raw)
+        if not raw_key:
+            return None
+        if raw_key in entries:
+            return entries[raw_key]
+        if len(raw_key) >= MIN_PREFIX_LENGTH:
+            return self._tries[store_key].unique_completion(raw_key)
+        return None
+
+    def resolve(self, receipt_text):
+        """Split OCR text into locally expanded items and lines left for the parser.
+
+        Returns ``(store, resolved, remaining)`` where ``resolved`` is a list of
+        ``(line number, ReceiptItem)`` and ``remaining`` a list of
+        ``(line number, line)``.  ``store`` is None when the store is unknown,
+        in which case nothing is resolved.
+        """
+        lines = list(enumerate(receipt_text.splitlines()))
+        # Workers resolve while the script thread seeds new entries
+        with self._lock:
+            store_key = self.detect_store(receipt_text)
+            if store_key is None:
+                return None, [], lines
+
+            resolved, remaining = [], []
+            for line_number, line in lines:
+                expansion = self.lookup(store_key, line)
+                if expansion:
+                    resolved.append((line_number, ReceiptItem(line.strip(), expansion, False)))
+                else:
+                    remaining.append((line_number, line))
+            return self._stores[store_key], resolved, remaining
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            data = {
+                store_key: {"name": self._stores[store_key], "items": entries}
+                for store_key, entries in self._entries.items()
+            }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            json.dump(data, handle)
+        os.replace(tmp, self.path)
+
+
+def merge_resolved(receipts, store, resolved, remaining):
+    """Merge locally resolved items back into parsed receipts, in receipt line order.
+
+    Parser items are placed at the first unclaimed remaining line that
+    contains their raw text, or right after the previous item if none does.
+    """
+    if not resolved:
+        return receipts
+    if not receipts:
+        receipts = [Receipt(store=store, date="Unknown date")]
+
+    # Locally resolved items belong to the first receipt in this text
+    positioned = [(line_number, item, 0) for line_number, item in resolved]
+    cursor = 0
+    last_position = -1
+    for receipt_index, receipt in enumerate(receipts):
+        for item in receipt.items:
+            needle = normalize_item(item.raw)
+            position = last_position
+            for offset, (line_number, line) in enumerate(remaining[cursor:]):
+                if needle and needle in normalize_item(line):
+                    position = line_number
+                    cursor += offset + 1
+                    break
+            last_position = position
+            positioned.append((position, item, receipt_index))
+
+    positioned.sort(key=lambda entry: entry[0])  # stable, so ties keep parser order
+    return [
+        Receipt(
+            receipt.store,
+            receipt.date,
+            tuple(item for _, item, index in positioned if index == receipt_index),
+        )
+        for receipt_index, receipt in enumerate(receipts)
+    ]
@@ -0,0 +1,245 @@
+"""Persistent purchase history per household.
+
+Parsed receipts are written to SQLite as soon as they come back from the
+parser, one row per receipt and one per line item, so a returning household
+builds a longitudinal record without re-uploading anything.  Each item row
+carries its household, normalized store, purchase day, normalized item name
+and ``adapttable.classify`` category, and is indexed on household with each
+of the others, so the aggregates the summary prompt uses (``item_frequency``,
+``category_trends``, ``overview``) are index range scans that stay fast at
+tens of thousands of items per household.  The prompt gets those aggregates
+(``prompts.purchase_history_note``) instead of every past receipt.
+
+Every aggregate takes ``exclude_images``, the image hashes of the receipts
+already in the prompt, so the history describes only earlier purchases.  The
+ids of those receipts go into a per-connection temp table rather than bound
+parameters, so any number of them stays under SQLite's variable limit, and the
+item indexes end in ``receipt_id`` so the filter stays an index-only scan.
+
+Writes are idempotent per receipt image: recording the same image for a
+household again is a no-op.  Like ``ResponseCache``, a connection is opened
+per operation, so one store can be shared by worker threads and processes.
+"""
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from adapttable.cache import closing_connection
+from adapttable.classify import default_classifier
+from adapttable.expansions import normalize_store
+
+# Receipt dates as the parser returns them; US month/day order first
+DATE_FORMATS = (
+    "%m/%d/%Y", "%m/%d/%y", "%m-%d-%Y", "%m-%d-%y", "%Y-%m-%d", "%Y/%m/%d",
+    "%b %d %Y", "%B %d %Y", "%d %b %Y", "%d %B %Y",
+)
+_DATE = re.compile(
+    r"\d{1,4}[/-]\d{1,2}[/-]\d{2,4}|[A-Za-z]{3,9}\.? \d{1,2},? \d{4}|\d{1,2} [A-Za-z]{3,9}\.? \d{4}"
+)
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS receipts ("
+    " id INTEGER PRIMARY KEY,"
+    " household TEXT NOT NULL,"
+    " image_hash TEXT NOT NULL,"
+    " position INTEGER NOT NULL,"
+    " store TEXT NOT NULL,"
+    " store_norm TEXT NOT NULL,"
+    " date TEXT NOT NULL,"
+    " day TEXT NOT NULL,"
+    " added_at REAL NOT NULL,"
+    " UNIQUE (household, image_hash, position))",
+    "CREATE TABLE IF NOT EXISTS items ("
+    " receipt_id INTEGER NOT NULL REFERENCES receipts (id),"
+    " household TEXT NOT NULL,"
+    " store_norm TEXT NOT NULL,"
+    " day TEXT NOT NULL,"
+    " raw TEXT NOT NULL,"
+    " name TEXT NOT NULL,"
+    " item_norm TEXT NOT NULL,"
+    " category TEXT NOT NULL,"
+    " ambiguous INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS receipts_household_day ON receipts (household, day)",
+    "CREATE INDEX IF NOT EXISTS items_household_item"
+    " ON items (household, item_norm, ambiguous, day, name, receipt_id)",
+    "CREATE INDEX IF NOT EXISTS items_household_day ON items (household, day, category, receipt_id)",
+    "CREATE INDEX IF NOT EXISTS items_household_store ON items (household, store_norm, day)",
+)
+
+
+def normalize_name(name):
+    """Item key across receipts: case-folded with whitespace collapsed, as ``MasterRecord.item_names``."""
+    return " ".join(name.casefold().split())
+
+
+def _not_excluded(column, excluded):
+    """``AND column NOT IN`` the ``excluded`` temp table, or nothing if nothing is excluded."""
+    return f" AND {column} NOT IN (SELECT id FROM excluded)" if excluded else ""
+
+
+def parse_day(date, default=None):
+    """ISO day (``YYYY-MM-DD``) of a receipt date string, or ``default`` if it can't be read."""
+    match = _DATE.search(date or "")
+    if match:
+        text = match.group(0).replace(",", "").replace(".", "")
+        for date_format in DATE_FORMATS:
+            try:
+                return datetime.strptime(text, date_format).date().isoformat()
+            except ValueError:
+                continue
+    return default
+
+
+class PurchaseHistory:
+    """SQLite store of every parsed receipt item, by household (see the module docstring)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self):
+        return closing_connection(sqlite3.connect(self.path, timeout=10))
+
+    def record_receipts(self, household, image_hash, receipts):
+        """Store the ``Receipt`` list parsed from one image; returns the number of items written.
+
+        Receipts without a readable date are filed under the day they were added.
+        """
+        now = time.time()
+        today = datetime.fromtimestamp(now, timezone.utc).date().isoformat()
+        items = [item for receipt in receipts for item in receipt.items]
+        categories = iter(item_class.category for item_class in default_classifier().classify(
+            [item.name for item in items]
+        ))
+        written = 0
+        with self._connect() as conn:
+            for position, receipt in enumerate(receipts):
+                store_norm = normalize_store(receipt.store)
+                day = parse_day(receipt.date, today)
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO receipts"
+                    " (household, image_hash, position, store, store_norm, date, day, added_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (household, image_hash, position, receipt.store, store_norm, receipt.date, day, now),
+                )
+                # Built either way, to keep ``categories`` in step with the items
+                rows = [
+                    (cursor.lastrowid, household, store_norm, day, item.raw, item.name,
+                     normalize_name(item.name), next(categories), int(item.ambiguous))
+                    for item in receipt.items
+                ]
+                if not cursor.rowcount:
+                    continue  # Already recorded
+                conn.executemany(
+                    "INSERT INTO items"
+                    " (receipt_id, household, store_norm, day, raw, name, item_norm, category, ambiguous)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                written += len(rows)
+        return written
+
+    @staticmethod
+    def _exclude(conn, household, exclude_images):
+        """Put the ids of a household's receipts parsed from ``exclude_images`` in ``conn``'s ``excluded`` table.
+
+        Returns whether any image was given; the table lives as long as ``conn``.
+        """
+        exclude_images = set(exclude_images)
+        if not exclude_images:
+            return False
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS excluded (id INTEGER PRIMARY KEY)")
+        conn.executemany(
+            "INSERT OR IGNORE INTO excluded SELECT id FROM receipts WHERE household = ? AND image_hash = ?",
+            [(household, image_hash) for image_hash in exclude_images],
+        )
+        return True
+
+    def overview(self, household, exclude_images=()):
+        """``{receipts, items, distinct_items, stores, first_day, last_day}`` for a household."""
+        with self._connect() as conn:
+            excluded = self._exclude(conn, household, exclude_images)
+            receipts, stores, first_day, last_day = conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT store_norm), MIN(day), MAX(day) FROM receipts WHERE household = ?"
+                + _not_excluded("id", excluded),
+                [household],
+            ).fetchone()
+            items, distinct_items = conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT item_norm) FROM items WHERE household = ?"
+                + _not_excluded("receipt_id", excluded),
+                [household],
+            ).fetchone()
+        return {
+            "receipts": receipts,
+            "items": items,
+            "distinct_items": distinct_items,
+            "stores": stores,
+            "first_day": first_day,
+            "last_day": last_day,
+        }
+
+    def item_frequency(self, household, limit=20, since=None, store=None, exclude_images=()):
+        """Most often bought items, as ``[(name, times bought, days bought on, last day)]``.
+
+        Ambiguous items are left out; ``since`` is an ISO day, ``store`` a store name.
+        """
+        sql = ("SELECT MAX(name), COUNT(*), COUNT(DISTINCT day), MAX(day) FROM items"
+               " WHERE household = ? AND ambiguous = 0")
+        params = [household]
+        if since is not None:
+            sql += " AND day >= ?"
+            params.append(since)
+        if store is not None:
+            sql += " AND store_norm = ?"
+            params.append(normalize_store(store))
+        with self._connect() as conn:
+            excluded = self._exclude(conn, household, exclude_images)
+            sql += (_not_excluded("receipt_id", excluded)
+                    + " GROUP BY item_norm ORDER BY COUNT(*) DESC, MAX(day) DESC LIMIT ?")
+            return conn.execute(sql, [*params, limit]).fetchall()
+
+    def category_trends(self, household, months=6, exclude_images=()):
+        """Items bought per category per month for the last ``months`` months with purchases.
+
+        Returns ``{"YYYY-MM": {category: count}}`` in month order.
+        """
+        with self._connect() as conn:
+            excluded = self._exclude(conn, household, exclude_images)
+            recent = [month for (month,) in conn.execute(
+                "SELECT DISTINCT substr(day, 1, 7) FROM receipts WHERE household = ?"
+                + _not_excluded("id", excluded) + " ORDER BY 1 DESC LIMIT ?",
+                [household, months],
+            )]
+            if not recent:
+                return {}
+            rows = conn.execute(
+                "SELECT substr(day, 1, 7), category, COUNT(*) FROM items"
+                " WHERE household = ? AND day >= ?" + _not_excluded("receipt_id", excluded) + " GROUP BY 1, 2",
+                [household, f"{min(recent)}-01"],
+            ).fetchall()
+        trends = {month: {} for month in sorted(recent)}
+        for month, category, count in rows:
+            trends[month][category] = count
+        return {month: dict(sorted(counts.items(), key=lambda entry: -entry[1]))
+                for month, counts in trends.items()}
+
+    def summary(self, household, top_items=20, months=6, exclude_images=()):
+        """The aggregates the household summary prompt uses, or None for a household with no history.
+
+        ``exclude_images`` are the receipts the prompt already has; a household
+        with no other receipts has no history.
+        """
+        overview = self.overview(household, exclude_images)
+        if not overview["receipts"]:
+            return None
+        return {
+            **overview,
+            "top_items": self.item_frequency(household, limit=top_items, exclude_images=exclude_images),
+            "category_trends": self.category_trends(household, months=months, exclude_images=exclude_images),
+        }
@@ -0,0 +1,315 @@
+"""The OCR -> parse -> summary -> guidance pipeline for one household.
+
+The app runs these steps one by one between widgets; the batch CLI and the
+benchmarks run them end to end with ``analyze_household``.  Both use the same
+step functions, so behavior and prompts match.  Models are reached through a
+``complete`` callable, normally built by ``make_complete``::
+
+    complete(system_prompt, user_prompt, on_text=None, response_schema=None, stage=None) -> Completion
+"""
+import contextlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from adapttable.backends import Completion
+from adapttable.classify import partition_record
+from adapttable.ocr import DEFAULT_MAX_CONCURRENCY, VISION_URL, annotate_images, image_hash
+from adapttable.parsing import parse_receipt_text
+from adapttable.prompts import (
+    DIETITIAN_SYSTEM_PROMPT,
+    GUIDANCE_SCHEMA,
+    challenging_foods_prompt,
+    challenging_foods_update_prompt,
+    combined_guidance_prompt,
+    combined_guidance_update_prompt,
+    helpful_foods_prompt,
+    helpful_foods_update_prompt,
+    parse_guidance_json,
+    summary_prompt,
+    summary_update_prompt,
+)
+from adapttable.receipts import MasterRecord
+from adapttable.tracing import Span
+
+GUIDANCE_PROMPTS = {
+    "helpful_foods": helpful_foods_prompt,
+    "challenging_foods": challenging_foods_prompt,
+}
+GUIDANCE_UPDATE_PROMPTS = {
+    "helpful_foods": helpful_foods_update_prompt,
+    "challenging_foods": challenging_foods_update_prompt,
+}
+# Stands in for a guidance section when the household bought nothing that belongs in it
+NO_GUIDANCE_ITEMS = {
+    "helpful_foods": (
+        "I looked through your recent shopping list for foods that are especially helpful for blood sugar "
+        "control, such as vegetables, beans and lentils, nuts, eggs and other lean proteins, and didn't find "
+        "any this time. Adding a few of these to your next shop is an easy place to start."
+    ),
+    "challenging_foods": (
+        "Nothing on your recent shopping list stands out as likely to challenge blood sugar control: there "
+        "are no sugary drinks, sweets, refined grains or other high-GI items to flag this time."
+    ),
+}
+
+
+def make_complete(backend, model_label, response_cache=None, tracer=None, limiter=None, session=None,
+                  concurrency=None, read_cache=True):
+    """A ``complete`` callable for ``backend`` that serves repeats from ``response_cache``.
+
+    With ``read_cache=False`` the cache is not read, but fresh responses still
+    replace what it holds.  Every call (including cache hits and failures) is recorded as a span on
+    ``tracer``; ``limiter`` is acquired before each request to the provider,
+    and a ``concurrency`` slot (``adapttable.jobs.ConcurrencyLimiter``) is held
+    while it is in flight.  Safe to call from worker threads.
+    """
+    def record(span):
+        if tracer is not None:
+            tracer.record(span)
+
+    def complete(system_prompt, user_prompt, on_text=None, response_schema=None, stage=None):
+        stage = stage or "model_call"
+        cache_key = None
+        if response_cache is not None:
+            cache_key = response_cache.make_key(
+                backend.provider, backend.model_id, system_prompt, user_prompt, response_schema
+            )
+        if cache_key is not None and read_cache:
+            start_time = time.time()
+            cached_text = response_cache.get(cache_key)
+            if cached_text is not None:
+                elapsed = time.time() - start_time
+                record(Span(stage, model_label, elapsed, first_token_time=elapsed, cache="hit", session=session))
+                return Completion(cached_text, elapsed, first_token_time=elapsed, cached=True)
+
+        if limiter is not None:
+            limiter.acquire()
+        slot = concurrency.slot(backend.provider) if concurrency is not None else contextlib.nullcontext()
+        bytes_sent = len(system_prompt.encode("utf-8")) + len(user_prompt.encode("utf-8"))
+        cache = None if response_cache is None else "miss" if read_cache else "bypass"
+        start_time = time.time()
+        try:
+            with slot:
+                completion = backend.complete(
+                    system_prompt, user_prompt, on_text=on_text, response_schema=response_schema
+                )
+        except Exception as e:
+            record(Span(stage, model_label, time.time() - start_time, bytes_sent=bytes_sent, cache=cache,
+                        error=type(e).__name__, session=session))
+            raise
+        record(Span(
+            stage,
+            model_label,
+            completion.elapsed,
+            first_token_time=completion.first_token_time,
+            bytes_sent=bytes_sent,
+            bytes_received=len(completion.text.encode("utf-8")),
+            prompt_tokens=completion.usage.get("prompt_tokens", 0),
+            completion_tokens=completion.usage.get("completion_tokens", 0),
+            cached_tokens=completion.usage.get("cached_tokens", 0),
+            retries=completion.retries,
+            cache=cache,
+            session=session,
+        ))
+        if cache_key is not None and completion.text.strip():
+            response_cache.set(cache_key, completion.text)
+        return completion
+
+    return complete
+
+
+def write_summary(complete, master_record_prompt, on_text=None, category_counts=None, history=None):
+    """``history`` is ``PurchaseHistory.summary()`` for a household with stored receipts."""
+    return complete(
+        DIETITIAN_SYSTEM_PROMPT,
+        summary_prompt(master_record_prompt, category_counts, history),
+        on_text=on_text,
+        stage="household_summary",
+    )
+
+
+def write_guidance(complete, stage, items, on_text=None):
+    """One guidance section (``"helpful_foods"`` or ``"challenging_foods"``).
+
+    ``items`` is the stage's share of the master record
+    (``partition_record(record).record_for(stage)``); when it is empty no call
+    is made and the section is ``NO_GUIDANCE_ITEMS[stage]``.
+    """
+    if not items.receipts:
+        return Completion(NO_GUIDANCE_ITEMS[stage], 0.0, first_token_time=0.0)
+    return complete(
+        DIETITIAN_SYSTEM_PROMPT, GUIDANCE_PROMPTS[stage](items.to_prompt()), on_text=on_text, stage=stage
+    )
+
+
+def write_combined_guidance(complete, master_record_prompt, on_text=None, category_counts=None, history=None):
+    """Summary and both guidance sections in one call; returns ``(completion, sections)``.
+
+    Raises ValueError when the response cannot be split into sections.
+    """
+    completion = complete(
+        DIETITIAN_SYSTEM_PROMPT,
+        combined_guidance_prompt(master_record_prompt, category_counts, history),
+        on_text=on_text,
+        response_schema=GUIDANCE_SCHEMA,
+        stage="combined_guidance",
+    )
+    return completion, parse_guidance_json(completion.text)
+
+
+def update_summary(complete, previous, added_record_prompt, on_text=None, category_counts=None, history=None):
+    """Revise ``previous`` for the items in ``added_record_prompt`` (a delta prompt).
+
+    ``category_counts`` are for the whole record, as the revised summary is.
+    """
+    return complete(
+        DIETITIAN_SYSTEM_PROMPT,
+        summary_update_prompt(previous, added_record_prompt, category_counts, history),
+        on_text=on_text,
+        stage="household_summary_update",
+    )
+
+
+def update_guidance(complete, stage, previous, added_items, on_text=None):
+    """Revise section ``previous`` for ``added_items``, the stage's share of the new items.
+
+    Without any, ``previous`` stands; a section that had no items is written afresh.
+    """
+    if not added_items.receipts:
+        return Completion(previous, 0.0, first_token_time=0.0)
+    if previous == NO_GUIDANCE_ITEMS[stage]:
+        return write_guidance(complete, stage, added_items, on_text=on_text)
+    return complete(
+        DIETITIAN_SYSTEM_PROMPT,
+        GUIDANCE_UPDATE_PROMPTS[stage](previous, added_items.to_prompt()),
+        on_text=on_text,
+        stage=f"{stage}_update",
+    )
+
+
+def update_combined_guidance(complete, previous_sections, added_record_prompt, on_text=None):
+    """Delta version of ``write_combined_guidance``; raises ValueError the same way."""
+    completion = complete(
+        DIETITIAN_SYSTEM_PROMPT,
+        combined_guidance_update_prompt(previous_sections, added_record_prompt),
+        on_text=on_text,
+        response_schema=GUIDANCE_SCHEMA,
+        stage="combined_guidance_update",
+    )
+    return completion, parse_guidance_json(completion.text)
+
+
+@dataclass
+class HouseholdResult:
+    receipts: list = field(default_factory=list)  # [{"name", "hash", "text"}]
+    failed: list = field(default_factory=list)    # names of receipts that could not be read
+    master_record: MasterRecord = None
+    sections: dict = field(default_factory=dict)  # summary, helpful_foods, challenging_foods
+    timings: dict = field(default_factory=dict)   # stage -> seconds
+    calls: list = field(default_factory=list)     # [(stage, Completion)]
+    skipped: list = field(default_factory=list)   # guidance stages with no items, so no call
+
+    def to_dict(self):
+        return {
+            "receipts": [{"name": r["name"], "hash": r["hash"]} for r in self.receipts],
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "master_record": self.master_record.to_dict() if self.master_record else None,
+            **self.sections,
+            "timings": self.timings,
+            "usage": [
+                {"stage": stage, "cached": completion.cached, "retries": completion.retries, **completion.usage}
+                for stage, completion in self.calls
+            ],
+        }
+
+
+def analyze_household(images, complete, vision_api_key, names=None, vision_url=VISION_URL, ocr_cache=None,
+                      expansion_index=None, single_call=False, filter_lines=True, preprocess=True,
+                      crop=False, vision_batch_size=4, vision_max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                      parser_max_concurrency=4, ocr_limiter=None, history=None, household=None):
+    """Run the whole pipeline over one household's receipt images (raw bytes).
+
+    ``ocr_limiter``, if given, is acquired once per image sent to Vision, so
+    OCR cache hits cost nothing.  With a ``history`` (``PurchaseHistory``) and
+    ``household`` id, parsed receipts are added to the household's stored
+    history and the summary draws on its earlier receipts.
+    """
+    names = names or [f"receipt-{i + 1}" for i in range(len(images))]
+    result = HouseholdResult()
+    pipeline_start = time.perf_counter()
+
+    start = time.perf_counter()
+    texts = annotate_images(
+        images, vision_api_key, batch_size=vision_batch_size, max_concurrency=vision_max_concurrency,
+        preprocess=preprocess, crop=crop, cache=ocr_cache, url=vision_url, limiter=ocr_limiter,
+    )
+    result.timings["ocr"] = time.perf_counter() - start
+    for name, image, text in zip(names, images, texts):
+        if text is None:
+            result.failed.append(name)
+        else:
+            result.receipts.append({"name": name, "hash": image_hash(image), "text": text})
+    if not result.receipts:
+        return result
+
+    start = time.perf_counter()
+    workers = max(1, min(parser_max_concurrency, len(result.receipts)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parsed = list(pool.map(
+            lambda receipt: parse_receipt_text(receipt["text"], complete, expansion_index, filter_lines),
+            result.receipts,
+        ))
+    result.timings["receipt_parsing"] = time.perf_counter() - start
+    for receipt, parse in zip(result.receipts, parsed):
+        result.calls.append(("receipt_parsing", parse.completion))
+        if expansion_index is not None:
+            expansion_index.seed(parse.receipts)
+        if history is not None and household is not None:
+            history.record_receipts(household, receipt["hash"], parse.receipts)
+    # Only earlier receipts count as history; these ones are already in the prompt
+    household_history = (
+        history.summary(household, exclude_images=[receipt["hash"] for receipt in result.receipts])
+        if history is not None and household is not None else None
+    )
+
+    # Upload order, each receipt keeping its own store name and date
+    result.master_record = MasterRecord([receipt for parse in parsed for receipt in parse.receipts])
+    master_record_prompt = result.master_record.to_prompt()
+    partition = partition_record(result.master_record)
+
+    if single_call:
+        start = time.perf_counter()
+        completion, result.sections = write_combined_guidance(
+            complete, master_record_prompt, category_counts=partition.category_counts, history=household_history
+        )
+        result.timings["combined_guidance"] = time.perf_counter() - start
+        result.calls.append(("combined_guidance", completion))
+    else:
+        completion = write_summary(
+            complete, master_record_prompt, category_counts=partition.category_counts, history=household_history
+        )
+        result.sections["summary"] = completion.text
+        result.timings["household_summary"] = completion.elapsed
+        result.calls.append(("household_summary", completion))
+
+        # Both sections depend only on the master record, so they run at once;
+        # a section with no items is filled in without a call
+        start = time.perf_counter()
+        result.skipped = [stage for stage in GUIDANCE_PROMPTS if not partition.record_for(stage).receipts]
+        with ThreadPoolExecutor(max_workers=len(GUIDANCE_PROMPTS)) as pool:
+            futures = {
+                stage: pool.submit(write_guidance, complete, stage, partition.record_for(stage))
+                for stage in GUIDANCE_PROMPTS
+            }
+            for stage, future in futures.items():
+                completion = future.result()
+                result.sections[stage] = completion.text
+                result.timings[stage] = completion.elapsed
+                if stage not in result.skipped:
+                    result.calls.append((stage, completion))
+        result.timings["food_guidance_wall_clock"] = time.perf_counter() - start
+
+    result.timings["total"] = time.perf_counter() - pipeline_start
+    return result
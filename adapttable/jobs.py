@@ -0,0 +1,140 @@
+"""Background jobs shared by every session in a process.
+
+Long pipeline steps (OCR, parsing, the summary, the food guidance) run as
+``Job``s on one ``JobManager`` thread pool instead of on a session's script
+thread.  A job lives in the manager, not in the script run, so a rerun (a
+widget click, a model change) neither interrupts nor repeats it: the session
+keeps only the job ID, renders the job's ``progress`` and streamed
+``partial`` text while it runs, and applies its ``result`` once it is done.
+Submitting the same ``(kind, key, session)`` while a job for it is still
+queued or running returns that job.  Finished jobs are dropped after
+``retention`` seconds.
+
+Jobs must not touch ``st.session_state``: everything they need is captured
+when they are submitted, and everything they produce goes in the result.
+
+``ConcurrencyLimiter`` caps the requests in flight to each provider across
+every job and session in the process, so a burst of sessions queues locally
+instead of tripping the provider's rate limits.
+"""
+import contextlib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+@dataclass
+class Job:
+    kind: str
+    key: str
+    session: str = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    state: str = QUEUED
+    progress: dict = field(default_factory=dict)  # step -> short status text
+    partial: dict = field(default_factory=dict)   # stage -> text streamed so far
+    result: object = None
+    error: BaseException = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED)
+
+    def report(self, step, status):
+        """Record progress; called from the job's own threads."""
+        self.progress[step] = status
+
+    def stream(self, stage, text):
+        """Record the partial text of ``stage``; usable as an ``on_text`` callback."""
+        self.partial[stage] = text
+
+    def status(self):
+        """``(state, progress, partial)``, copied so the caller can render them while the job runs."""
+        return self.state, dict(self.progress), dict(self.partial)
+
+
+class JobManager:
+    """Runs ``Job``s on a shared pool of ``max_workers`` threads (see the module docstring)."""
+
+    def __init__(self, max_workers=8, retention=3600):
+        self.retention = retention
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, key, fn, session=None):
+        """Run ``fn(job)`` in the background; its return value becomes ``job.result``."""
+        with self._lock:
+            self._expire()
+            for job in self._jobs.values():
+                if (job.kind, job.key, job.session) == (kind, key, session) and not job.finished:
+                    return job
+            job = Job(kind, key, session)
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        job.state, job.started_at = RUNNING, time.time()
+        try:
+            job.result = fn(job)
+            job.state = DONE
+        except Exception as e:
+            job.error = e
+            job.state = FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def counts(self):
+        """Jobs per state, for metrics."""
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job.state] += 1
+        return counts
+
+    def _expire(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+
+class ConcurrencyLimiter:
+    """At most ``limits[provider]`` requests in flight per provider; unlisted providers are not limited."""
+
+    def __init__(self, limits):
+        self.limits = dict(limits)
+        self._slots = {provider: threading.BoundedSemaphore(limit) for provider, limit in self.limits.items()}
+        self._in_use = {provider: 0 for provider in self.limits}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def slot(self, provider):
+        """Hold one of ``provider``'s slots for the duration of a request, waiting for one if needed."""
+        semaphore = self._slots.get(provider)
+        if semaphore is None:
+            yield
+            return
+        with semaphore:
+            with self._lock:
+                self._in_use[provider] += 1
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self._in_use[provider] -= 1
+
+    def in_use(self):
+        """``{provider: requests in flight}``, for metrics."""
+        with self._lock:
+            return dict(self._in_use)
@@ -0,0 +1,176 @@
+"""Google Vision OCR client.
+
+Receipts are sent to ``images:annotate`` in batches (the endpoint accepts
+several images per call) over one pooled, keep-alive ``requests.Session`` with
+connect/read timeouts and retries on throttling and server errors.  Batches are
+issued concurrently on a bounded thread pool so total latency tracks the
+slowest call rather than the sum of all of them.  Images are shrunk by
+``preprocess_receipt`` before encoding unless preprocessing is turned off.
+When a cache is supplied, text is looked up by the SHA-256 of the original
+image bytes first and Vision is only called for misses.
+"""
+import base64
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from adapttable.preprocess import preprocess_receipt
+
+VISION_URL = "https://vision.googleapis.com/v1/images:annotate"
+
+# Vision allows up to 16 images per annotate call and caps the JSON body at
+# roughly 10 MB, so batches are bounded by both count and encoded size.
+MAX_IMAGES_PER_REQUEST = 16
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+
+# Upper bound on in-flight annotate calls, to stay under the Vision quota.
+DEFAULT_MAX_CONCURRENCY = 4
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+
+
+@functools.lru_cache(maxsize=None)
+def vision_session():
+    """Process-wide HTTP session reused for every Vision call."""
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=16)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def image_hash(image_bytes):
+    """Content key for a receipt image, shared by the OCR cache and duplicate detection."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _encode(image_bytes):
+    return base64.b64encode(image_bytes).decode("utf-8")
+
+
+def prepare_image(image_bytes, preprocess=True, crop=False):
+    """Preprocess (optionally) and base64-encode one image for the annotate payload."""
+    if preprocess:
+        image_bytes = preprocess_receipt(image_bytes, crop=crop)
+    return _encode(image_bytes)
+
+
+def make_batches(encoded_images, batch_size=MAX_IMAGES_PER_REQUEST, max_bytes=MAX_BATCH_BYTES):
+    """Group ``(index, base64)`` pairs into batches bounded by count and size."""
+    batches = []
+    current, current_bytes = [], 0
+    for index, content in enumerate(encoded_images):
+        if current and (len(current) >= batch_size or current_bytes + len(content) > max_bytes):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append((index, content))
+        current_bytes += len(content)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _extract_text(response):
+    if isinstance(response, dict) and "fullTextAnnotation" in response:
+        return response["fullTextAnnotation"]["text"]
+    return None
+
+
+def annotate_batch(batch, api_key, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), url=VISION_URL):
+    """Send one annotate call and return the text (or None) for each image in it."""
+    payload = {
+        "requests": [
+            {
+                "image": {"content": content},
+                "features": [{"type": "TEXT_DETECTION"}],
+            }
+            for _, content in batch
+        ]
+    }
+    try:
+        response = vision_session().post(
+            url, params={"key": api_key}, json=payload, timeout=timeout
+        )
+        result = response.json()
+    except (requests.RequestException, ValueError):
+        return [None] * len(batch)
+
+    responses = result.get("responses") if isinstance(result, dict) else None
+    if not isinstance(responses, list):
+        responses = []
+    # Responses come back in request order, one per image.
+    return [
+        _extract_text(responses[i]) if i < len(responses) else None
+        for i in range(len(batch))
+    ]
+
+
+def iter_annotations(images, api_key, batch_size=MAX_IMAGES_PER_REQUEST,
+                     max_concurrency=DEFAULT_MAX_CONCURRENCY, preprocess=True, crop=False,
+                     cache=None, url=VISION_URL, concurrency=None, limiter=None):
+    """OCR raw image bytes concurrently, yielding ``(index, text, cached)`` as results arrive.
+
+    ``text`` is None for images Vision could not read; other images in the
+    same run are unaffected.  ``cached`` is True when the text came from
+    ``cache`` without a Vision call.  Results are yielded in the caller's
+    thread, so it is safe to update Streamlit elements while iterating.
+    ``url`` points the client at another annotate endpoint (e.g. a local stub).
+    ``concurrency`` (``adapttable.jobs.ConcurrencyLimiter``) caps annotate
+    calls in flight across every caller sharing it, under ``"vision"``.
+    ``limiter`` (e.g. ``adapttable.batch.RateLimiter``) is acquired once per
+    image just before the call that sends it, so cache hits do not use it.
+    """
+    pending = []
+    for index, image in enumerate(images):
+        text = cache.get(image_hash(image)) if cache is not None else None
+        if text is not None:
+            yield index, text, True
+        else:
+            pending.append(index)
+    if not pending:
+        return
+
+    def annotate(batch):
+        if limiter is not None:
+            for _ in batch:
+                limiter.acquire()
+        if concurrency is None:
+            return annotate_batch(batch, api_key, url=url)
+        with concurrency.slot("vision"):
+            return annotate_batch(batch, api_key, url=url)
+
+    workers = max(1, min(max_concurrency, len(pending)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vision") as pool:
+        encoded = list(pool.map(lambda i: prepare_image(images[i], preprocess, crop), pending))
+        batches = make_batches(encoded, batch_size=batch_size)
+        futures = {pool.submit(annotate, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            for (position, _), text in zip(futures[future], future.result()):
+                index = pending[position]
+                if text is not None and cache is not None:
+                    cache.set(image_hash(images[index]), text)
+                yield index, text, False
+
+
+def annotate_images(images, api_key, batch_size=MAX_IMAGES_PER_REQUEST,
+                    max_concurrency=DEFAULT_MAX_CONCURRENCY, preprocess=True, crop=False,
+                    cache=None, url=VISION_URL, limiter=None):
+    """OCR a list of raw image bytes; returns one text (or None) per image, in order."""
+    texts = [None] * len(images)
+    for index, text, _ in iter_annotations(
+        images, api_key, batch_size, max_concurrency, preprocess, crop, cache, url, limiter=limiter
+    ):
+        texts[index] = text
+    return texts
@@ -0,0 +1,133 @@
+"""Deterministic OCR line filter applied before the receipt parser prompt.
+
+Vision returns every line on the receipt: totals, tax, tenders, card numbers,
+barcodes, addresses, survey URLs and loyalty boilerplate, often half the
+prompt.  Each line is classified with simple rules; the store/date header and
+anything that might be an item are kept, and only lines matching a known
+noise pattern are dropped.  A line ending in a price is an item unless it is a
+total, tax, tender or card line, and the other patterns only match lines that
+start with their boilerplate.  The filter is deliberately conservative: an
+unrecognised line is kept.
+"""
+import re
+from dataclasses import dataclass, field
+
+# The first lines carry the store name (and often the date); always kept
+HEADER_LINES = 3
+
+_AMOUNT = r"[\s:$#*@=xX\d.,%()/-]*"
+
+_DATE = re.compile(
+    r"\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}-\d{2}-\d{2}|"
+    r"(JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC)[A-Z]*\.?\s+\d{1,2},?\s+\d{4})\b",
+    re.IGNORECASE,
+)
+
+# Payment lines that carry an amount but never name an item; checked before the
+# price test below, since every one of them ends in a price
+_PAYMENT_PATTERNS = [
+    # Totals, tax, tenders and savings, when nothing but an amount follows
+    re.compile(
+        r"^\**\s*(SUB\s?-?TOTAL|TOTAL(\s+(DUE|TAX|SAVINGS|PURCHASE|AMOUNT|ITEMS))?|(SALES\s+)?TAX\s*\d*|"
+        r"BAL(ANCE)?(\s+DUE)?|CHANGE(\s+DUE)?|CASH|TEND(ER|ERED)?|AMOUNT|AMT|"
+        r"(US\s+)?DEBIT|CREDIT|VISA|MASTERCARD|MC|AMEX|DISCOVER|EBT(\s+\w+)?|"
+        r"YOU\s+SAVED|([\w+]+\s+){0,3}(SAVINGS|EARNINGS)|DISCOUNT\s+TOTAL|COUPONS?(\s+TOTAL)?)"
+        r"(\s+TEND(ER|ERED)?)?" + _AMOUNT + r"$",
+        re.IGNORECASE,
+    ),
+    re.compile(r"^#?\s*ITEMS?\s+SOLD\b|\bITEMS?\s+SOLD" + _AMOUNT + r"$", re.IGNORECASE),
+    re.compile(r"^\$?\d+[.,]\d{2}\s+TOTAL\b|\bTOTAL\s+PAYMENT\b|\bTAX\b.*\bON\s+\$?\d", re.IGNORECASE),
+    # Masked card numbers
+    re.compile(r"(\*{3,}|X{4,}|#{4,})\s*\d{2,}", re.IGNORECASE),
+]
+
+# Lines without a price. Each pattern must account for the line from its
+# start, so an item name that merely contains one of these words ("MANAGER
+# SPECIAL CHEESE", its price split onto the next line) is kept.
+_NOISE_PATTERNS = [
+    # Payment-terminal details
+    re.compile(
+        r"^\W*(ACCOUNT\s*[:#]|ACCT\s*[:#]|(APPR(OVAL)?|AUTH(ORIZATION)?)(\s+CODE)?\s*[:#]?\s*\w*\d|"
+        r"TERMINAL\s*(#|:|ID)|TERM\s*#|REF\s*#|TRANS(ACTION)?\s*(ID|#)|SEQ\s*#|AID\s*[:#]?\s*A0\d*|TC\s*#|"
+        r"TR\s*#|MID\s*[:#]|TID\s*[:#]|NETWORK\s+ID|CHIP\s+READ|PIN\s+VERIFIED|NO\s+SIGNATURE|"
+        r"CARD\s+TYPE|ENTRY\s+METHOD|EFT\b|PAY\s+FROM\s+PRIMARY|USER\s+ID|REC\s*#)",
+        re.IGNORECASE,
+    ),
+    re.compile(r"^\W*(APPROVED|CONTACTLESS)(\s+\w*\d\w*)?\W*$", re.IGNORECASE),
+    # Barcodes and long numeric runs on their own
+    re.compile(r"^[\d\s-]{8,}$"),
+    # URLs, surveys and contests
+    re.compile(r"https?://|\bwww\.|\.(com|net|org)\b", re.IGNORECASE),
+    re.compile(
+        r"^\W*((TAKE\s+)?(OUR|THE|A)\s+SURVEY|SURVEY\b|FEEDBACK\b|TELL\s+US|CHANCE\s+TO\s+WIN|SWEEPSTAKES|"
+        r"ENTER\s+TO\s+WIN|HOW\s+WAS\s+YOUR|RATE\s+YOUR|VISIT\s+US)",
+        re.IGNORECASE,
+    ),
+    # Phone numbers, street addresses and city/state/ZIP lines
+    re.compile(r"^\W*\(?\s*\d{3}\s*\)?\s*[\s.-]\s*\d{3}\s*[\s.-]\s*\d{4}\W*$"),
+    re.compile(
+        r"^\d+\s+[\w\s.'-]*\b(ST|STREET|AVE|AVENUE|RD|ROAD|BLVD|BOULEVARD|DR|DRIVE|HWY|HIGHWAY|"
+        r"LN|LANE|WAY|PKWY|PARKWAY|COURT|PLAZA|PIKE)\b\.?$",
+        re.IGNORECASE,
+    ),
+    re.compile(r"^[A-Z .'-]+,\s*[A-Z]{2}\s+\d{5}(-\d{4})?$", re.IGNORECASE),
+    # Store, cashier and loyalty boilerplate: sentences that start the line
+    re.compile(
+        r"^\W*(THANK\s+YOU|THANKS\s+FOR\s+SHOPPING|PLEASE\s+COME\s+AGAIN|REWARDS?\s+(MEMBER|NUMBER|POINTS|BALANCE)|"
+        r"POINTS\s+(EARNED|BALANCE|REDEEMED)|FUEL\s+POINTS|RETURN\s+POLICY|RETURNS?\s+WITH(IN)?|"
+        r"CUSTOMER\s+COPY|STORE\s+COPY|GET\s+REWARDED|SIGN\s+UP|OPEN\s+\d+\s+HOURS|"
+        r"KEEP\s+(THIS\s+)?RECEIPT|RECEIPT\s*(ID|NUMBER|#)|(GET\s+)?FREE\s+DELIVERY|SCAN\s+WITH)(?!\w)",
+        re.IGNORECASE,
+    ),
+    # Staff and store numbers, only as labels ("CASHIER: 12", "ST# 05260 OP# 009044")
+    re.compile(
+        r"^\W*(STORE\s+MANAGER\b|(CASHIER|OPERATOR|MANAGER|MGR)\s*[:#]|(ST|STORE|OP|TE)\s*#\s*\d)",
+        re.IGNORECASE,
+    ),
+    # Store slogans, as whole lines
+    re.compile(
+        r"^\W*(SAVE\s+MONEY\W+LIVE\s+BETTER|LIVE\s+BETTER|LOW\s+PRICES\s+YOU\s+CAN\s+TRUST\W*(EVERY\s+DAY)?)\W*$",
+        re.IGNORECASE,
+    ),
+    # Times on their own
+    re.compile(r"^\d{1,2}:\d{2}(:\d{2})?\s*(AM|PM)?$", re.IGNORECASE),
+]
+
+# A price with nothing naming an item (Vision often splits the price column off)
+_PRICE_ONLY = re.compile(r"^-?\$?\s*\d+[.,]\d{2}\s*-?[A-Z]{0,2}$", re.IGNORECASE)
+_PRICE = re.compile(r"\d+[.,]\d{2}\s*-?[A-Z]{0,2}$")
+
+
+@dataclass
+class FilterResult:
+    text: str
+    kept: list = field(default_factory=list)
+    dropped: list = field(default_factory=list)
+
+
+def classify_line(line, line_number):
+    """One of ``"header"``, ``"date"``, ``"item"``, ``"other"`` (all kept) or ``"noise"``."""
+    stripped = line.strip()
+    if not stripped:
+        return "noise"
+    if line_number < HEADER_LINES:
+        return "header"
+    if _DATE.search(stripped):
+        return "date"
+    if _PRICE_ONLY.match(stripped):
+        return "noise"
+    if any(pattern.search(stripped) for pattern in _PAYMENT_PATTERNS):
+        return "noise"
+    if _PRICE.search(stripped):
+        return "item"
+    if any(pattern.search(stripped) for pattern in _NOISE_PATTERNS):
+        return "noise"
+    return "other"
+
+
+def filter_ocr_text(text):
+    """Drop noise lines from one receipt's OCR text, keeping line order."""
+    kept, dropped = [], []
+    for line_number, line in enumerate(text.splitlines()):
+        (dropped if classify_line(line, line_number) == "noise" else kept).append(line)
+    return FilterResult(text="\n".join(kept), kept=kept, dropped=dropped)
@@ -0,0 +1,68 @@
+"""Parsing one receipt's OCR text into ``Receipt`` objects.
+
+Shared by the app and the headless benchmarks.  Noise lines are filtered out
+first, known items are expanded from the local ``ExpansionIndex``, and only
+the lines left over go to the model; its JSON is merged back with the local
+items in receipt order.  The model is reached through a ``complete`` callable
+(see ``adapttable.household``) so callers decide about caching, tracing and
+which backend to use.
+"""
+import json
+from dataclasses import dataclass, field
+
+from adapttable.expansions import merge_resolved
+from adapttable.ocr_filter import filter_ocr_text
+from adapttable.pipeline import estimate_tokens
+from adapttable.prompts import RECEIPT_PARSER_SYSTEM_PROMPT, receipt_parser_prompt
+from adapttable.receipts import RECEIPTS_SCHEMA, parse_receipts_json
+
+
+@dataclass
+class ParseResult:
+    completion: object
+    receipts: list
+    expansion_stats: dict = field(default_factory=dict)
+    filter_stats: dict = field(default_factory=dict)
+
+
+def parse_receipt_text(receipt_text, complete, expansion_index=None, filter_lines=True):
+    """Parse one receipt; safe to call from worker threads.
+
+    ``complete`` runs the model and returns a ``Completion``.  Without an
+    ``expansion_index`` every kept line goes to the model.
+    """
+    filter_stats = {"lines_dropped": 0, "tokens_dropped": 0}
+    if filter_lines:
+        filtered = filter_ocr_text(receipt_text)
+        filter_stats = {
+            "lines_dropped": len(filtered.dropped),
+            "tokens_dropped": estimate_tokens(receipt_text) - estimate_tokens(filtered.text),
+        }
+        receipt_text = filtered.text
+
+    lines = receipt_text.splitlines()
+    if expansion_index is not None:
+        store, resolved, remaining = expansion_index.resolve(receipt_text)
+    else:
+        store, resolved, remaining = None, [], list(enumerate(lines))
+
+    completion = complete(
+        RECEIPT_PARSER_SYSTEM_PROMPT,
+        receipt_parser_prompt("\n".join(line for _, line in remaining)),
+        response_schema=RECEIPTS_SCHEMA,
+        stage="receipt_parsing",
+    )
+    receipts = merge_resolved(parse_receipts_json(completion.text), store, resolved, remaining)
+
+    # Saved input (the resolved lines) plus the output the model would have written
+    tokens_saved = sum(
+        estimate_tokens(lines[line_number])
+        + estimate_tokens(json.dumps({"raw": item.raw, "expansion": item.expansion, "ambiguous": False}))
+        for line_number, item in resolved
+    )
+    expansion_stats = {
+        "local": len(resolved),
+        "parsed": sum(len(receipt.items) for receipt in receipts) - len(resolved),
+        "tokens_saved": tokens_saved,
+    }
+    return ParseResult(completion, receipts, expansion_stats, filter_stats)
@@ -0,0 +1,47 @@
+"""Staged analysis pipeline state.
+
+Every stage (OCR -> master record -> household summary -> helps/hinders) stores
+its result in a state mapping together with the key of the inputs it was
+computed from.  A stage only runs again when that key changes, so reruns that
+are pure UI interactions cost no external calls.  The state mapping is
+``st.session_state`` in the app, but any dict works.
+"""
+import hashlib
+
+STAGES_KEY = "pipeline_stages"
+
+
+def content_hash(*parts):
+    """SHA-256 over a sequence of str/bytes parts (order-sensitive)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token) for metrics."""
+    return (len(text) + 3) // 4
+
+
+def _stages(state):
+    if STAGES_KEY not in state:
+        state[STAGES_KEY] = {}
+    return state[STAGES_KEY]
+
+
+def stage_is_fresh(state, stage, key):
+    entry = _stages(state).get(stage)
+    return entry is not None and entry["key"] == key
+
+
+def stage_result(state, stage, default=None):
+    entry = _stages(state).get(stage)
+    return entry["result"] if entry is not None else default
+
+
+def store_stage(state, stage, key, result):
+    """Record ``result`` as the output of ``stage`` for inputs ``key``."""
+    _stages(state)[stage] = {"key": key, "result": result}
@@ -0,0 +1,172 @@
+"""Typed in-memory model of parsed receipts.
+
+The receipt parser returns schema-constrained JSON (``RECEIPTS_SCHEMA``):
+``{"receipts": [{"store", "date", "items": [{"raw", "expansion", "ambiguous"}]}]}``.
+It is loaded into ``Receipt``/``ReceiptItem`` objects and merged into a
+``MasterRecord``.  Downstream prompts get ``MasterRecord.to_prompt()``, a
+compact one-line-per-item serialization, rather than a markdown table.
+"""
+import json
+from dataclasses import dataclass, field
+
+RECEIPTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "receipts": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "store": {"type": "string"},
+                    "date": {"type": "string"},
+                    "items": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "raw": {"type": "string"},
+                                "expansion": {"type": ["string", "null"]},
+                                "ambiguous": {"type": "boolean"},
+                            },
+                            "required": ["raw", "expansion", "ambiguous"],
+                            "additionalProperties": False,
+                        },
+                    },
+                },
+                "required": ["store", "date", "items"],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["receipts"],
+    "additionalProperties": False,
+}
+
+
+@dataclass(frozen=True)
+class ReceiptItem:
+    raw: str
+    expansion: str = None
+    ambiguous: bool = False
+
+    @property
+    def name(self):
+        """Best available name: the expansion when confident, else the raw text."""
+        return self.raw if self.ambiguous or not self.expansion else self.expansion
+
+
+@dataclass(frozen=True)
+class Receipt:
+    store: str
+    date: str
+    items: tuple = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        items = []
+        for item in data.get("items") or []:
+            raw = str(item.get("raw") or "").strip()
+            if not raw:
+                continue
+            expansion = (item.get("expansion") or "").strip() or None
+            ambiguous = bool(item.get("ambiguous")) or expansion is None or expansion.lower() == "ambiguous"
+            items.append(ReceiptItem(raw, None if ambiguous else expansion, ambiguous))
+        return cls(
+            store=str(data.get("store") or "Unknown store").strip(),
+            date=str(data.get("date") or "Unknown date").strip(),
+            items=tuple(items),
+        )
+
+    def to_dict(self):
+        return {
+            "store": self.store,
+            "date": self.date,
+            "items": [
+                {"raw": item.raw, "expansion": item.expansion, "ambiguous": item.ambiguous}
+                for item in self.items
+            ],
+        }
+
+
+def parse_receipts_json(text):
+    """Load parser output into a list of ``Receipt``; raises ValueError on malformed JSON."""
+    text = text.strip()
+    if text.startswith("```"):
+        # Tolerate a fenced block from models without a native JSON mode
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    data = json.loads(text)
+    if isinstance(data, dict) and "receipts" in data:
+        data = data["receipts"]
+    elif isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list):
+        raise ValueError("Receipt parser output is not a list of receipts")
+    return [Receipt.from_dict(receipt) for receipt in data if isinstance(receipt, dict)]
+
+
+@dataclass
+class MasterRecord:
+    receipts: list = field(default_factory=list)
+
+    @property
+    def items(self):
+        return [item for receipt in self.receipts for item in receipt.items]
+
+    def item_names(self):
+        """Sorted distinct item names, case-insensitive.
+
+        The summary and food guidance depend only on these, so a receipt that
+        adds nothing new leaves them as they are.
+        """
+        return sorted({item.name.casefold() for item in self.items})
+
+    def items_not_in(self, known_names):
+        """A record of only the items whose names are not in ``known_names``, each once."""
+        seen = set(known_names)
+        receipts = []
+        for receipt in self.receipts:
+            items = []
+            for item in receipt.items:
+                if item.name.casefold() not in seen:
+                    seen.add(item.name.casefold())
+                    items.append(item)
+            if items:
+                receipts.append(Receipt(receipt.store, receipt.date, tuple(items)))
+        return MasterRecord(receipts)
+
+    def to_prompt(self):
+        """Compact serialization for downstream prompts.
+
+        One header line per receipt (``# Store | Date``), then one line per
+        item: ``RAW => Expansion``, or ``RAW (ambiguous)`` without a confident
+        expansion.
+        """
+        lines = []
+        for receipt in self.receipts:
+            lines.append(f"# {receipt.store} | {receipt.date}")
+            for item in receipt.items:
+                if item.ambiguous:
+                    lines.append(f"{item.raw} (ambiguous)")
+                else:
+                    lines.append(f"{item.raw} => {item.expansion}")
+        return "\n".join(lines)
+
+    def to_markdown(self):
+        """The familiar per-store table shown to the user."""
+        blocks = []
+        for receipt in self.receipts:
+            rows = [
+                f"| {item.raw} | {'Ambiguous' if item.ambiguous else item.expansion} |"
+                for item in receipt.items
+            ]
+            blocks.append(
+                f"Store Name: {receipt.store}\nDate: {receipt.date}\n\n"
+                "| Raw Item | Expansion |\n|----------|-----------|\n" + "\n".join(rows)
+            )
+        return "\n\n".join(blocks)
+
+    def to_dict(self):
+        return {"receipts": [receipt.to_dict() for receipt in self.receipts]}
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
@@ -0,0 +1,136 @@
+"""Display fragments for the food-guidance sections.
+
+Guidance text is parsed once into a ``Guidance``: introduction blocks,
+``FoodItemCard`` entries (the ``Food Item:`` line and every block after it up
+to the next card or the Top Tips), an optional Top Tips block and the
+closing remarks after it.  ``render_guidance`` turns that into one
+markdown/HTML fragment per section, in the order the model wrote it,
+memoized on the section and its text, so a rerun emits a single element per
+section with no parsing.  Malformed output (a card with no details, stray
+text between cards) renders as plain markdown instead of failing.
+"""
+import functools
+import html
+import re
+from dataclasses import dataclass
+
+# Emitted once, above the sections, by the app whenever guidance is on the page
+GUIDANCE_CSS = """<style>
+.food-item-helpful, .food-item-challenging {
+    padding: 15px;
+    border-radius: 8px;
+    margin: 15px 0;
+    font-size: 1.2em;
+    font-weight: 600;
+}
+.food-item-helpful { background-color: #e8f5e9; color: #2e7d32; }
+.food-item-challenging { background-color: #ffebee; color: #c62828; }
+</style>"""
+
+HEADINGS = {
+    "helpful_foods": (
+        "<h3 style='font-size: 1.5rem; font-weight: 600; color: #2e7d32; margin-top: 1.5em; margin-bottom: 1em;'>"
+        "Here are some items from your list that can be particularly helpful in managing blood sugar:</h3>"
+    ),
+    "challenging_foods": (
+        "<h3 style='font-size: 1.5rem; font-weight: 600; color: #c62828; margin-top: 1.5em; margin-bottom: 1em;'>"
+        "Now let's take a look at food items that could be more challenging:</h3>"
+    ),
+}
+TIPS_HEADING = (
+    "<h3 style='font-size: 1.5rem; font-weight: 600; color: #1565c0; margin-top: 1.5em; margin-bottom: 1em;'>"
+    "💡 Top Tips for Blood Sugar Stability</h3>"
+)
+CARD_CLASSES = {"helpful_foods": "food-item-helpful", "challenging_foods": "food-item-challenging"}
+# The challenging-foods prompt has no introduction step; lead-ins the model adds anyway are dropped
+CHALLENGING_SKIP_PHRASES = ("let's take a look", "Okay,", "Remember, this is about")
+RENDER_CACHE_SIZE = 256
+
+_BLOCK_SEPARATOR = re.compile(r"\n\s*\n")
+_TIPS_HEADING_LINE = re.compile(r"^\s*💡\s*\*\*Top Tips[^\n]*\n?")
+
+
+@dataclass(frozen=True)
+class FoodItemCard:
+    title: str           # the "Food Item:" line, markdown emphasis removed
+    details: tuple = ()  # markdown blocks under it ("Why...", "How to Use It", follow-on text)
+
+
+@dataclass(frozen=True)
+class Guidance:
+    intro: tuple = ()
+    cards: tuple = ()
+    tips: str = None
+    closing: tuple = ()  # blocks after the Top Tips
+
+
+def _title_text(line):
+    return line.replace("**", "").replace("__", "").strip()
+
+
+def parse_guidance(text):
+    """Split one guidance section's markdown into a ``Guidance``."""
+    intro, cards, closing = [], [], []
+    tips = None
+    card = None  # (title, [details]) being filled
+    for block in (block.strip() for block in _BLOCK_SEPARATOR.split(text.replace("\r\n", "\n"))):
+        if not block:
+            continue
+        if tips is not None:
+            closing.append(block)
+        elif "💡 **Top Tips" in block:
+            tips = block
+        elif "Food Item:" in block:
+            if card is not None:
+                cards.append(card)
+            lines = block.split("\n")
+            index = next(i for i, line in enumerate(lines) if "Food Item:" in line)
+            rest = "\n".join(lines[:index] + lines[index + 1:]).strip()
+            card = (_title_text(lines[index]), [rest] if rest else [])
+        elif card is not None:
+            card[1].append(block)
+        else:
+            intro.append(block)
+    if card is not None:
+        cards.append(card)
+    return Guidance(
+        intro=tuple(intro),
+        cards=tuple(FoodItemCard(title, tuple(details)) for title, details in cards),
+        tips=tips,
+        closing=tuple(closing),
+    )
+
+
+def _card_fragment(card, css_class):
+    return "\n\n".join((f'<div class="{css_class}">{html.escape(card.title)}</div>',) + card.details)
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_guidance(section, text):
+    """One markdown/HTML fragment for ``section`` (``"helpful_foods"`` or ``"challenging_foods"``).
+
+    Cached per content across sessions; render with
+    ``st.markdown(fragment, unsafe_allow_html=True)``.
+    """
+    guidance = parse_guidance(text)
+    intro, cards, closing = guidance.intro, guidance.cards, guidance.closing
+    if section == "challenging_foods":
+        def keep(blocks):
+            return tuple(block for block in blocks if not any(skip in block for skip in CHALLENGING_SKIP_PHRASES))
+
+        # A closing remark with no Top Tips after it is the last card's final block
+        intro, closing = keep(intro), keep(closing)
+        cards = [FoodItemCard(card.title, keep(card.details)) for card in cards]
+
+    # The heading introduces the cards; a section with none (see
+    # household.NO_GUIDANCE_ITEMS) is just its text
+    parts = list(intro) if section == "helpful_foods" else []
+    if guidance.cards:
+        parts.append(HEADINGS[section])
+    if section != "helpful_foods":
+        parts += intro
+    parts += [_card_fragment(card, CARD_CLASSES[section]) for card in cards]
+    if guidance.tips:
+        parts += [TIPS_HEADING, _TIPS_HEADING_LINE.sub("", guidance.tips, count=1).strip()]
+    parts += closing
+    return "\n\n".join(part for part in parts if part)
@@ -0,0 +1,303 @@
+"""Per-stage tracing and metrics export.
+
+Every external call (OCR per receipt, each model call) and every pipeline step
+is recorded as a ``Span``: duration, time to first token, payload bytes, token
+usage, retries and response-cache hit/miss.  A process-wide ``Tracer``
+
+- appends spans as JSON lines to a size-rotated log,
+- keeps a window of recent spans in memory (primed from the log on start-up)
+  for p50/p95 summaries that survive sessions and restarts, and
+- aggregates Prometheus counters and histograms (plus gauges set with
+  ``set_gauge``), written as a text-format file for the node exporter's
+  textfile collector and optionally served on ``/metrics`` by
+  ``serve_metrics``.
+
+``estimate_size`` and ``SessionMemory`` track how much memory session state
+holds, per session and across the process.
+"""
+import collections
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Histogram buckets (seconds) for durations and time to first token
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+WINDOW_SIZE = 5000
+METRICS_WRITE_INTERVAL = 5.0
+
+
+@dataclass
+class Span:
+    stage: str
+    model: str
+    duration: float
+    # "call" for one external request, "step" for a pipeline step as the user waits for it
+    kind: str = "call"
+    first_token_time: float = None
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    retries: int = 0
+    cache: str = None  # "hit", "miss", "bypass" (not read) or None when no cache is involved
+    error: str = None
+    session: str = None
+    timestamp: float = field(default_factory=time.time)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+
+def estimate_size(obj, _seen=None):
+    """Approximate deep size of ``obj`` in bytes, following containers and object attributes."""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen or callable(obj):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        size += sum(estimate_size(key, seen) + estimate_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, collections.deque)):
+        size += sum(estimate_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), seen)
+    return size
+
+
+class SessionMemory:
+    """Latest session-state size per live session, for process-wide totals.
+
+    Sessions that have not reported for ``idle_timeout`` seconds are assumed
+    gone (Streamlit frees their state) and drop out of the totals.
+    """
+
+    def __init__(self, idle_timeout=3600):
+        self.idle_timeout = idle_timeout
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def update(self, session, size):
+        now = time.time()
+        with self._lock:
+            self._sizes[session] = (size, now)
+            for key, (_, seen) in list(self._sizes.items()):
+                if now - seen > self.idle_timeout:
+                    del self._sizes[key]
+
+    def totals(self):
+        """``{"sessions", "total", "largest"}`` over live sessions (bytes)."""
+        with self._lock:
+            sizes = [size for size, _ in self._sizes.values()]
+        return {"sessions": len(sizes), "total": sum(sizes), "largest": max(sizes, default=0)}
+
+
+class Tracer:
+    def __init__(self, log_path=None, metrics_path=None, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 window_size=WINDOW_SIZE):
+        self.log_path = Path(log_path) if log_path else None
+        self.metrics_path = Path(metrics_path) if metrics_path else None
+        self._lock = threading.Lock()
+        self._window = collections.deque(maxlen=window_size)
+        self._durations = collections.defaultdict(_Histogram)
+        self._first_tokens = collections.defaultdict(_Histogram)
+        self._counters = collections.Counter()
+        self._gauges = {}
+        self._dirty = False
+        self._last_write = 0.0
+        self._logger = None
+        if self.log_path:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            self._prime_window()
+            handler = logging.handlers.RotatingFileHandler(
+                self.log_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger = logging.getLogger(f"adapttable.spans.{id(self)}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.addHandler(handler)
+
+    def _prime_window(self):
+        """Reload recent spans from the log so summaries span restarts."""
+        if not self.log_path.exists():
+            return
+        with open(self.log_path, encoding="utf-8") as handle:
+            for line in collections.deque(handle, maxlen=self._window.maxlen):
+                try:
+                    self._window.append(Span(**json.loads(line)))
+                except (ValueError, TypeError):
+                    continue
+
+    def record(self, span):
+        """Record a finished span; safe to call from worker threads."""
+        key = (span.stage, span.model, span.kind)
+        with self._lock:
+            self._window.append(span)
+            self._durations[key].observe(span.duration)
+            if span.first_token_time is not None:
+                self._first_tokens[key].observe(span.first_token_time)
+            for name, value in (
+                ("tokens:prompt", span.prompt_tokens),
+                ("tokens:completion", span.completion_tokens),
+                ("tokens:cached", span.cached_tokens),
+                ("bytes:sent", span.bytes_sent),
+                ("bytes:received", span.bytes_received),
+                ("retries", span.retries),
+            ):
+                self._counters[key + (name,)] += value or 0
+            if span.cache:
+                self._counters[key + (f"cache:{span.cache}",)] += 1
+            if span.error:
+                self._counters[key + ("errors",)] += 1
+            self._dirty = True
+        if self._logger is not None:
+            self._logger.info(json.dumps(asdict(span)))
+        self.write_metrics(min_interval=METRICS_WRITE_INTERVAL)
+
+    def set_gauge(self, name, value, help_text=""):
+        """Set the current value of gauge ``adapttable_<name>``."""
+        with self._lock:
+            # Gauges are set on every script run; only a new value needs a metrics write
+            if self._gauges.get(name) != (value, help_text):
+                self._gauges[name] = (value, help_text)
+                self._dirty = True
+
+    def summary(self, kind=None, model=None):
+        """``{(stage, model): {"n", "p50", "p95", "first_token_p50"}}`` over the recent window."""
+        with self._lock:
+            spans = [
+                span for span in self._window
+                if span.error is None and (kind is None or span.kind == kind) and (model is None or span.model == model)
+            ]
+        grouped = collections.defaultdict(list)
+        for span in spans:
+            grouped[(span.stage, span.model)].append(span)
+        summary = {}
+        for key, group in grouped.items():
+            durations = [span.duration for span in group]
+            first_tokens = [span.first_token_time for span in group if span.first_token_time is not None]
+            summary[key] = {
+                "n": len(group),
+                "p50": percentile(durations, 0.50),
+                "p95": percentile(durations, 0.95),
+                "first_token_p50": percentile(first_tokens, 0.50) if first_tokens else None,
+            }
+        return summary
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            for metric, histograms, help_text in (
+                ("adapttable_stage_duration_seconds", self._durations, "Stage or call duration"),
+                ("adapttable_first_token_seconds", self._first_tokens, "Time to first streamed token"),
+            ):
+                lines += [f"# HELP {metric} {help_text}.", f"# TYPE {metric} histogram"]
+                for (stage, model, kind), histogram in sorted(histograms.items()):
+                    for bound, count in zip(BUCKETS, histogram.counts):
+                        lines.append(
+                            f"{metric}_bucket{_labels(stage=stage, model=model, kind=kind, le=bound)} {count}"
+                        )
+                    lines.append(
+                        f"{metric}_bucket{_labels(stage=stage, model=model, kind=kind, le='+Inf')} {histogram.count}"
+                    )
+                    lines.append(f"{metric}_sum{_labels(stage=stage, model=model, kind=kind)} {histogram.total}")
+                    lines.append(f"{metric}_count{_labels(stage=stage, model=model, kind=kind)} {histogram.count}")
+
+            counters = collections.defaultdict(list)
+            for (stage, model, kind, name), value in sorted(self._counters.items()):
+                metric, _, qualifier = name.partition(":")
+                labels = {"stage": stage, "model": model, "kind": kind}
+                if metric == "tokens":
+                    labels["type"] = qualifier
+                elif metric == "bytes":
+                    labels["direction"] = qualifier
+                elif metric == "cache":
+                    labels["result"] = qualifier
+                counters[f"adapttable_{metric}_total"].append(f"{_labels(**labels)} {value}")
+            for metric, samples in counters.items():
+                lines += [f"# TYPE {metric} counter"] + [f"{metric}{sample}" for sample in samples]
+
+            for name, (value, help_text) in sorted(self._gauges.items()):
+                metric = f"adapttable_{name}"
+                if help_text:
+                    lines.append(f"# HELP {metric} {help_text}")
+                lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self, min_interval=0.0):
+        """Write the Prometheus text file if anything changed since the last write.
+
+        With ``min_interval``, a write is also skipped until that many seconds
+        have passed since the previous one.
+        """
+        if self.metrics_path is None or not self._dirty:
+            return
+        if time.time() - self._last_write < min_interval:
+            return
+        self._dirty = False
+        self._last_write = time.time()
+        text = self.prometheus_text()
+        self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.metrics_path.parent, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(text)
+        os.replace(tmp, self.metrics_path)
+
+
+def serve_metrics(tracer, port, host="0.0.0.0"):
+    """Serve ``tracer`` as Prometheus text on ``http://host:port/metrics`` from a daemon thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = tracer.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,41 @@
+"""Uploaded receipts kept out of session memory.
+
+Session state holds one ``StoredReceipt`` per upload: the image's content
+hash, file name, size and a small JPEG thumbnail for display.  The image
+itself goes to the on-disk ``ImageStore`` and is only read back when OCR
+needs it.
+"""
+import io
+from dataclasses import dataclass
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+THUMBNAIL_SIZE = (160, 160)
+THUMBNAIL_QUALITY = 70
+
+
+@dataclass(frozen=True)
+class StoredReceipt:
+    hash: str
+    name: str
+    size: int
+    thumbnail: bytes = b""
+
+
+def make_thumbnail(image_bytes, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """A small JPEG preview of an upload, or ``b""`` if it cannot be decoded."""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            image.thumbnail(size)
+            out = io.BytesIO()
+            image.save(out, format="JPEG", quality=quality, optimize=True)
+            return out.getvalue()
+    except (UnidentifiedImageError, OSError, ValueError):
+        return b""
+
+
+def store_upload(image_store, name, image_bytes):
+    """Put an upload in ``image_store`` and return what the session keeps of it."""
+    key = image_store.put(image_bytes)
+    return StoredReceipt(key, name, len(image_bytes), make_thumbnail(image_bytes))
@@ -0,0 +1,120 @@
+"""Write and query cost of the household purchase history.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_history --items 1000 10000 50000 [--households 20] [--runs 20]
+
+For each size, fills a fresh ``adapttable.history.PurchaseHistory`` in a
+temporary directory with one household of N line items (40 per receipt, a
+few a week, from a mix of stores) alongside ``--households`` other households
+of the same size, then reports receipt write time and the median latency of
+each aggregate the summary prompt uses, plus the size of the resulting
+prompt note.  As in the app, the newest receipts (``--current``, the upload
+being analyzed) are left out of the aggregates.  ``--plans`` prints SQLite's query plans, to check each query is
+an index scan.
+"""
+import argparse
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from adapttable.classify import FOOD_TERMS
+from adapttable.history import PurchaseHistory
+from adapttable.prompts import purchase_history_note
+from adapttable.receipts import Receipt, ReceiptItem
+
+ITEMS_PER_RECEIPT = 40
+STORES = ["Walmart", "Kroger", "Aldi", "Target", "Costco"]
+BRANDS = ["Great Value", "Kroger", "Simple Truth", "", "", ""]
+
+
+def synthetic_receipts(household, items, seed=0):
+    """``[(image hash, [Receipt])]`` adding up to ``items`` line items, oldest first."""
+    rng = random.Random(seed)
+    # A household buys from a limited, skewed set of products
+    products = [f"{rng.choice(BRANDS)} {term}".strip().title() for term, *_ in rng.sample(FOOD_TERMS, 150)]
+    weights = [1 / (rank + 1) for rank in range(len(products))]
+    count = -(-items // ITEMS_PER_RECEIPT)
+    day = date(2024, 1, 1)
+    receipts = []
+    for index in range(count):
+        day += timedelta(days=rng.randint(1, 3))
+        names = rng.choices(products, weights, k=min(ITEMS_PER_RECEIPT, items - index * ITEMS_PER_RECEIPT))
+        receipt = Receipt(
+            rng.choice(STORES),
+            day.strftime("%m/%d/%Y"),
+            tuple(ReceiptItem(name.upper()[:16], name, rng.random() < 0.05) for name in names),
+        )
+        receipts.append((f"{household}-{index}", [receipt]))
+    return receipts
+
+
+def median_ms(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e3
+
+
+def print_plans(history, household):
+    queries = {
+        "item_frequency": ("SELECT MAX(name), COUNT(*), COUNT(DISTINCT day), MAX(day) FROM items"
+                           " WHERE household = ? AND ambiguous = 0 AND receipt_id NOT IN (?, ?)"
+                           " GROUP BY item_norm", (household, 1, 2)),
+        "category_trends": ("SELECT substr(day, 1, 7), category, COUNT(*) FROM items"
+                            " WHERE household = ? AND day >= ? AND receipt_id NOT IN (?, ?) GROUP BY 1, 2",
+                            (household, "2024-01-01", 1, 2)),
+        "by store": ("SELECT COUNT(*) FROM items WHERE household = ? AND store_norm = ?", (household, "aldi")),
+    }
+    with sqlite3.connect(history.path) as conn:
+        for label, (sql, params) in queries.items():
+            plan = "; ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+            print(f"  {label}: {plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 10000, 50000], help="Line items per household")
+    parser.add_argument("--households", type=int, default=20, help="Other households in the store")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--current", type=int, default=3, help="Newest receipts left out as the current upload")
+    parser.add_argument("--plans", action="store_true", help="Print query plans")
+    args = parser.parse_args()
+
+    print(f"{'items':>7}{'write ms/receipt':>18}{'overview':>10}{'frequency':>11}{'trends':>8}"
+          f"{'summary':>9}{'note chars':>12}")
+    for items in args.items:
+        with tempfile.TemporaryDirectory() as directory:
+            history = PurchaseHistory(Path(directory) / "history.sqlite3")
+            for other in range(args.households):
+                for image_hash, receipts in synthetic_receipts(f"other-{other}", items, seed=other + 1):
+                    history.record_receipts(f"other-{other}", image_hash, receipts)
+            receipts = synthetic_receipts("household", items)
+            start = time.perf_counter()
+            for image_hash, parsed in receipts:
+                history.record_receipts("household", image_hash, parsed)
+            write = (time.perf_counter() - start) / len(receipts)
+
+            current = [image_hash for image_hash, _ in receipts[len(receipts) - args.current:]]
+            timings = [
+                median_ms(lambda: history.overview("household", current), args.runs),
+                median_ms(lambda: history.item_frequency("household", exclude_images=current), args.runs),
+                median_ms(lambda: history.category_trends("household", exclude_images=current), args.runs),
+                median_ms(lambda: history.summary("household", exclude_images=current), args.runs),
+            ]
+            note = purchase_history_note(history.summary("household", exclude_images=current))
+            print(f"{items:>7}{write * 1e3:>18.2f}" + "".join(f"{ms:>{width}.2f}" for ms, width in zip(timings, (10, 11, 8, 9)))
+                  + f"{len(note):>12,}")
+            if args.plans:
+                print_plans(history, "household")
+    print("\nQuery times are median ms per call; 'summary' runs all three, as the summary prompt does.")
+
+
+if __name__ == "__main__":
+    main()
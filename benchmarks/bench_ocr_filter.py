@@ -0,0 +1,86 @@
+"""Prompt-size reduction and item recall of the OCR line filter.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_ocr_filter [--verbose]
+
+Runs ``filter_ocr_text`` over every ``benchmarks/fixtures/ocr/*.txt`` receipt.
+Each fixture has a ``<name>.items.json`` list of item names that must survive
+filtering.  Single lines in ``LINE_CASES`` check the edges of the noise
+patterns: item lines that contain a boilerplate word, and payment lines that
+end in an amount.  Reports lines/tokens before and after per fixture and
+exits with status 1 if any item line was dropped or any case is misclassified.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from adapttable.ocr_filter import HEADER_LINES, classify_line, filter_ocr_text
+from adapttable.pipeline import estimate_tokens
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "ocr"
+
+# (line, kept?) for a line past the receipt header
+LINE_CASES = [
+    ("MANAGER SPECIAL CHEESE 3.00", True),
+    ("MANAGER SPECIAL CHEESE", True),
+    ("SAVE MONEY BREAD 2.00", True),
+    ("LOW PRICES COOKIES 1.99", True),
+    ("TERMINAL VELOCITY CEREAL 4.29", True),
+    ("SURVEY BRAND OATS 2.49", True),
+    ("Store Manager: Dana Lopez", False),
+    ("CASHIER: 14", False),
+    ("TOTAL TENDERED 23.45", False),
+    ("VISA TEND 23.45", False),
+    ("MASTERCARD TENDERED $23.45", False),
+    ("CASH TEND 40.00", False),
+    ("Total Tendered 13.46", False),
+]
+
+
+def run(fixtures_dir=FIXTURES, verbose=False):
+    total_before = total_after = 0
+    lost = []
+    for path in sorted(fixtures_dir.glob("*.txt")):
+        text = path.read_text(encoding="utf-8")
+        expected = json.loads(path.with_suffix(".items.json").read_text(encoding="utf-8"))
+        result = filter_ocr_text(text)
+
+        missing = [item for item in expected if not any(item in line for line in result.kept)]
+        lost.extend(f"{path.stem}: {item}" for item in missing)
+
+        before, after = estimate_tokens(text), estimate_tokens(result.text)
+        total_before += before
+        total_after += after
+        print(
+            f"{path.stem:<12} lines {len(text.splitlines()):>3} -> {len(result.kept):>3}  "
+            f"tokens {before:>4} -> {after:>4} ({1 - after / before:.0%} smaller)  "
+            f"items kept {len(expected) - len(missing)}/{len(expected)}"
+        )
+        if verbose:
+            for line in result.dropped:
+                print(f"    - {line}")
+
+    print(f"\nTotal tokens {total_before} -> {total_after} ({1 - total_after / total_before:.0%} smaller)")
+    if lost:
+        print("\nItem lines dropped by the filter:")
+        for entry in lost:
+            print(f"  {entry}")
+
+    wrong = [(line, kept) for line, kept in LINE_CASES if (classify_line(line, HEADER_LINES) != "noise") != kept]
+    print(f"Line cases {len(LINE_CASES) - len(wrong)}/{len(LINE_CASES)} classified as expected")
+    for line, kept in wrong:
+        print(f"  {line!r} should be {'kept' if kept else 'dropped'}")
+    return not lost and not wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="List every dropped line")
+    args = parser.parse_args()
+    sys.exit(0 if run(verbose=args.verbose) else 1)
+
+
+if __name__ == "__main__":
+    main()
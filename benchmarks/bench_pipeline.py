@@ -0,0 +1,178 @@
+"""Offline end-to-end pipeline benchmark against local stub APIs.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_pipeline --synthetic 4 --runs 5
+    python -m benchmarks.bench_pipeline path/to/receipts/ --model "Google Gemini 2.5" \\
+        --llm-latency 0.8 --jitter 0.2 --json results.json --compare previous.json
+
+Runs OCR -> receipt parsing -> household summary -> helpful/challenging foods
+headlessly with ``adapttable.household.analyze_household`` (the pipeline the
+app and the batch CLI use) against the stub Vision,
+OpenAI and Gemini servers in ``benchmarks/stub_servers.py``.  No network
+access or API keys are needed.  Reports per-stage latency distributions
+(p50/p95/max), time to first token, bytes sent and received per service, and
+prompt/completion/cached tokens per stage.  Everything, including the raw
+per-run samples, is written to ``--json`` so runs can be compared; with
+``--compare`` the p50 of each stage is diffed against an earlier results file.
+"""
+import argparse
+import json
+import platform
+import time
+from pathlib import Path
+
+from adapttable.backends import MODEL_REGISTRY, get_backend, model_provider
+from adapttable.expansions import ExpansionIndex
+from adapttable.household import analyze_household, make_complete
+from adapttable.tracing import percentile
+from benchmarks.bench_preprocess import collect_images, synthetic_receipt
+from benchmarks.stub_servers import GeminiStub, Latency, OpenAIStub, VisionStub
+
+OFFLINE_API_KEY = "offline"
+
+
+def distribution(values):
+    return {
+        "n": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "min": min(values),
+        "max": max(values),
+    }
+
+
+def run_pipeline(images, backend, vision_url, expansion_index=None, single_call=False):
+    """One headless pass through ``analyze_household``; returns ``(stage seconds, [(stage, Completion)])``."""
+    complete = make_complete(backend, backend.model_id)
+    result = analyze_household(
+        images, complete, OFFLINE_API_KEY, vision_url=vision_url, expansion_index=expansion_index,
+        single_call=single_call,
+    )
+    return result.timings, result.calls
+
+
+def summarize(runs):
+    stage_names = list(dict.fromkeys(stage for run in runs for stage in run["stages"]))
+    summary = {"stages": {}, "first_token": {}, "tokens": {}, "bytes": {}}
+    for stage in stage_names:
+        summary["stages"][stage] = distribution([run["stages"][stage] for run in runs if stage in run["stages"]])
+
+    for stage in dict.fromkeys(call["stage"] for run in runs for call in run["calls"]):
+        calls = [call for run in runs for call in run["calls"] if call["stage"] == stage]
+        first_tokens = [call["first_token_time"] for call in calls if call["first_token_time"] is not None]
+        if first_tokens:
+            summary["first_token"][stage] = distribution(first_tokens)
+        summary["tokens"][stage] = {
+            key: sum(call[key] for call in calls) / len(runs)
+            for key in ("prompt_tokens", "completion_tokens", "cached_tokens")
+        }
+
+    for service in runs[0]["bytes"]:
+        summary["bytes"][service] = {
+            key: sum(run["bytes"][service][key] for run in runs) / len(runs)
+            for key in runs[0]["bytes"][service]
+        }
+    return summary
+
+
+def print_report(summary, previous=None):
+    print(f"{'stage':<26}{'p50':>9}{'p95':>9}{'max':>9}{'ttft p50':>10}{'prompt':>9}{'cached':>9}{'compl.':>9}")
+    for stage, dist in summary["stages"].items():
+        ttft = summary["first_token"].get(stage)
+        tokens = summary["tokens"].get(stage)
+        line = f"{stage:<26}{dist['p50']:>8.3f}s{dist['p95']:>8.3f}s{dist['max']:>8.3f}s"
+        line += f"{ttft['p50']:>9.3f}s" if ttft else f"{'':>10}"
+        if tokens:
+            line += f"{tokens['prompt_tokens']:>9.0f}{tokens['cached_tokens']:>9.0f}{tokens['completion_tokens']:>9.0f}"
+        if previous and stage in previous["stages"]:
+            before = previous["stages"][stage]["p50"]
+            if before:
+                line += f"   ({dist['p50'] / before - 1:+.0%} vs previous)"
+        print(line)
+
+    print("\nPer run (mean):")
+    for service, counts in summary["bytes"].items():
+        print(
+            f"  {service:<8} {counts['requests']:>5.1f} requests  "
+            f"{counts['bytes_received'] / 1e3:>9.1f} kB sent  {counts['bytes_sent'] / 1e3:>8.1f} kB received"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="Receipt images or directories of images")
+    parser.add_argument("--synthetic", type=int, default=0, help="Add N generated phone-sized receipt photos")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--model", default=next(iter(MODEL_REGISTRY)), choices=list(MODEL_REGISTRY))
+    parser.add_argument("--single-call", action="store_true", help="Use the single-call guidance mode")
+    parser.add_argument("--warm-index", action="store_true",
+                        help="Keep the expansion index between runs instead of starting empty each time")
+    parser.add_argument("--vision-latency", type=float, default=0.5, help="Seconds per Vision call")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds to first token per LLM call")
+    parser.add_argument("--chunk-latency", type=float, default=0.005, help="Seconds between streamed chunks")
+    parser.add_argument("--jitter", type=float, default=0.1, help="+/- seconds added to every first byte")
+    parser.add_argument("--json", dest="json_path", default="bench_pipeline.json",
+                        help="Where to write the machine-readable results")
+    parser.add_argument("--compare", help="Earlier --json results to diff stage p50s against")
+    args = parser.parse_args()
+
+    images = [raw for _, raw in collect_images(args.paths)]
+    images += [synthetic_receipt(seed=i) for i in range(args.synthetic)]
+    if not images:
+        parser.error("no images given (pass paths or --synthetic N)")
+
+    vision_latency = Latency(args.vision_latency, args.jitter)
+    llm_latency = Latency(args.llm_latency, args.jitter, per_chunk=args.chunk_latency)
+    with VisionStub(vision_latency) as vision, OpenAIStub(llm_latency) as openai_stub, \
+            GeminiStub(llm_latency) as gemini_stub:
+        stubs = {"vision": vision, "openai": openai_stub, "gemini": gemini_stub}
+        base_url = openai_stub.base_url if model_provider(args.model) == "openai" else gemini_stub.url
+        backend = get_backend(args.model, OFFLINE_API_KEY, base_url=base_url)
+
+        expansion_index = ExpansionIndex()
+        runs = []
+        for _ in range(args.runs):
+            for stub in stubs.values():
+                stub.reset_stats()
+            if not args.warm_index:
+                expansion_index = ExpansionIndex()
+            stages, calls = run_pipeline(images, backend, vision.annotate_url, expansion_index, args.single_call)
+            runs.append({
+                "stages": stages,
+                "calls": [
+                    {
+                        "stage": stage,
+                        "elapsed": completion.elapsed,
+                        "first_token_time": completion.first_token_time,
+                        "retries": completion.retries,
+                        "prompt_tokens": completion.usage.get("prompt_tokens", 0),
+                        "completion_tokens": completion.usage.get("completion_tokens", 0),
+                        "cached_tokens": completion.usage.get("cached_tokens", 0),
+                    }
+                    for stage, completion in calls
+                ],
+                "bytes": {name: dict(stub.stats) for name, stub in stubs.items()},
+            })
+
+    summary = summarize(runs)
+    previous = json.loads(Path(args.compare).read_text())["summary"] if args.compare else None
+    print_report(summary, previous)
+
+    results = {
+        "config": {
+            **{key: value for key, value in vars(args).items() if key not in ("json_path", "compare")},
+            "images": len(images),
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "summary": summary,
+        "runs": runs,
+    }
+    Path(args.json_path).write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
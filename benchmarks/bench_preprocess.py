@@ -0,0 +1,134 @@
+"""Bytes-on-the-wire and OCR latency before/after receipt preprocessing.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_preprocess path/to/receipts/ [--crop]
+    python -m benchmarks.bench_preprocess --synthetic 3
+
+For each image it reports the annotate JSON body size for the original upload
+and for the preprocessed copy, plus the preprocessing time.  When a Vision API
+key is available (``--api-key`` or ``GOOGLE_VISION_API_KEY``) both versions are
+also sent to Vision and the round-trip latency and extracted text length are
+compared.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import time
+from pathlib import Path
+
+from adapttable.ocr import annotate_batch, prepare_image
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+def _payload_bytes(encoded):
+    body = {"requests": [{"image": {"content": encoded}, "features": [{"type": "TEXT_DETECTION"}]}]}
+    return len(json.dumps(body).encode("utf-8"))
+
+
+def synthetic_receipt(seed=0, size=(3024, 4032)):
+    """A phone-photo-sized JPEG of a fake receipt on a dark, noisy table."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.effect_noise(size, 40).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    paper = (size[0] // 4, size[1] // 10, size[0] * 3 // 4, size[1] * 9 // 10)
+    draw.rectangle(paper, fill=(238, 236, 230))
+    y = paper[1] + 60
+    while y < paper[3] - 60:
+        item = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ ") for _ in range(18))
+        draw.text((paper[0] + 60, y), f"{item}  {rng.randint(1, 20)}.{rng.randint(0, 99):02d}", fill=(30, 30, 30))
+        y += 48
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=95)
+    return output.getvalue()
+
+
+def collect_images(paths):
+    images = []
+    for path in map(Path, paths):
+        files = sorted(path.iterdir()) if path.is_dir() else [path]
+        for file in files:
+            if file.suffix.lower() in IMAGE_SUFFIXES:
+                images.append((file.name, file.read_bytes()))
+    return images
+
+
+def _ocr(encoded, api_key):
+    start = time.perf_counter()
+    (text,) = annotate_batch([(0, encoded)], api_key)
+    return time.perf_counter() - start, len(text or "")
+
+
+def run(images, api_key=None, crop=False):
+    rows = []
+    for name, raw in images:
+        original = prepare_image(raw, preprocess=False)
+        start = time.perf_counter()
+        processed = prepare_image(raw, preprocess=True, crop=crop)
+        row = {
+            "image": name,
+            "file_bytes": len(raw),
+            "payload_bytes_before": _payload_bytes(original),
+            "payload_bytes_after": _payload_bytes(processed),
+            "preprocess_seconds": time.perf_counter() - start,
+        }
+        if api_key:
+            row["ocr_seconds_before"], row["text_chars_before"] = _ocr(original, api_key)
+            row["ocr_seconds_after"], row["text_chars_after"] = _ocr(processed, api_key)
+        rows.append(row)
+    return rows
+
+
+def print_report(rows):
+    for row in rows:
+        line = (
+            f"{row['image']:<28} {row['payload_bytes_before'] / 1e6:8.2f} MB -> "
+            f"{row['payload_bytes_after'] / 1e6:6.2f} MB  "
+            f"(prep {row['preprocess_seconds'] * 1000:6.0f} ms)"
+        )
+        if "ocr_seconds_before" in row:
+            line += (
+                f"  OCR {row['ocr_seconds_before']:5.2f}s -> {row['ocr_seconds_after']:5.2f}s"
+                f"  chars {row['text_chars_before']} -> {row['text_chars_after']}"
+            )
+        print(line)
+
+    before = sum(row["payload_bytes_before"] for row in rows)
+    after = sum(row["payload_bytes_after"] for row in rows)
+    print(f"\nTotal payload: {before / 1e6:.2f} MB -> {after / 1e6:.2f} MB ({after / before:.1%})")
+    if rows and "ocr_seconds_before" in rows[0]:
+        print(
+            "Median OCR latency: "
+            f"{statistics.median(r['ocr_seconds_before'] for r in rows):.2f}s -> "
+            f"{statistics.median(r['ocr_seconds_after'] for r in rows):.2f}s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="Receipt images or directories of images")
+    parser.add_argument("--synthetic", type=int, default=0, help="Add N generated phone-sized receipt photos")
+    parser.add_argument("--crop", action="store_true", help="Also crop to the receipt outline")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_VISION_API_KEY"))
+    parser.add_argument("--json", dest="json_path", help="Write per-image results to this file")
+    args = parser.parse_args()
+
+    images = collect_images(args.paths)
+    images += [(f"synthetic-{i}.jpg", synthetic_receipt(seed=i)) for i in range(args.synthetic)]
+    if not images:
+        parser.error("no images given (pass paths or --synthetic N)")
+
+    rows = run(images, api_key=args.api_key, crop=args.crop)
+    print_report(rows)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Rerun cost of the food-guidance display, per-paragraph vs cached fragments.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_render --items 10 50 200 [--reruns 200]
+
+Builds synthetic helpful/challenging guidance with N food items in the
+format the prompts ask for, then compares the previous display code (split
+on blank lines and one ``st.markdown`` per paragraph, every rerun) with
+``adapttable.rendering.render_guidance`` (one element per section, memoized
+on content).  Reports per-rerun render time, elements per rerun and the
+websocket payload.  Payload is the serialized ``ForwardMsg`` size when
+``streamlit`` is installed, otherwise the UTF-8 size of the element bodies.
+"""
+import argparse
+import time
+
+from adapttable.rendering import HEADINGS, TIPS_HEADING, render_guidance
+
+FOODS = ["Avocado", "Spinach", "Greek Yogurt", "White Bread", "Orange Juice", "Granola Bars", "Eggs", "Lentils"]
+
+TIPS = """💡 **Top Tips for Blood Sugar Stability**
+
+**🥚 Savory Breakfast First**
+Have some protein or fat first (e.g., turkey sausage, egg, avocado) to slow down absorption.
+
+**🥦 Eat Veggies First**
+The fiber acts like a barrier and slows down carb absorption."""
+
+
+def synthetic_guidance(section, items):
+    blocks = ["I've reviewed your recent shopping list, and here's how these choices may affect your blood sugar."]
+    for i in range(items):
+        food = f"{FOODS[i % len(FOODS)]} ({i + 1})"
+        if section == "helpful_foods":
+            blocks += [
+                f"**🥑 Food Item:** {food}  ",
+                "**✅ Why It's Great for Blood Sugar Control:** High in fiber and healthy fats, which slow digestion.  ",
+                "**🍽️ How to Use It:** Add to breakfast eggs or salads to balance a carb-heavy meal.",
+            ]
+        else:
+            blocks += [
+                f"**🍞 Food Item:** {food}  ",
+                "**❌ Why It May Challenge Control:** Refined carbohydrates are digested quickly and spike glucose.  ",
+                "**✅ Try Instead:** A whole grain or higher-fiber version.  ",
+                "**🔄 Adaptation Tip:** Pair with protein and eat after vegetables.",
+            ]
+    if section == "challenging_foods":
+        blocks.append(TIPS)
+    return "\n\n".join(blocks)
+
+
+def legacy_elements(section, text):
+    """The ``(body, allow_html)`` elements the previous display code emitted for one section."""
+    def food_part(part):
+        lines = part.split("\n")
+        food_line = next(line for line in lines if "Food Item:" in line)
+        return part.replace(
+            food_line, f'<div style="font-size: 1.2em; font-weight: 600; margin: 1em 0;">{food_line}</div>'
+        ), True
+
+    content_parts = text.split("\n\n")
+    elements = []
+    if section == "helpful_foods":
+        elements += [(content_parts[0], False), (HEADINGS[section], True)]
+        for part in content_parts[1:]:
+            elements.append(food_part(part) if "Food Item:" in part else (part, False))
+    else:
+        elements.append((HEADINGS[section], True))
+        for part in content_parts:
+            if "Food Item:" in part:
+                elements.append(food_part(part))
+            elif "💡 **Top Tips" in part:
+                elements += [(TIPS_HEADING, True), (part, False)]
+            elif not any(skip in part for skip in ["let's take a look", "Okay,", "Remember, this is about"]):
+                elements.append((part, False))
+    return elements
+
+
+def payload_bytes(elements):
+    try:
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+    except ImportError:
+        return sum(len(body.encode("utf-8")) for body, _ in elements), "body bytes"
+    total = 0
+    for index, (body, allow_html) in enumerate(elements):
+        msg = ForwardMsg()
+        msg.metadata.delta_path[:] = [0, index]
+        msg.delta.new_element.markdown.body = body
+        msg.delta.new_element.markdown.allow_html = allow_html
+        total += msg.ByteSize()
+    return total, "ForwardMsg bytes"
+
+
+def time_per_call(fn, reruns):
+    start = time.perf_counter()
+    for _ in range(reruns):
+        fn()
+    return (time.perf_counter() - start) / reruns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[10, 50, 200], help="Food items per section")
+    parser.add_argument("--reruns", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'items':>6}{'section':>19}{'ms/rerun before':>17}{'after':>9}{'first':>9}"
+          f"{'elements':>10}{'after':>7}{'payload before':>16}{'after':>9}")
+    for items in args.items:
+        for section in ("helpful_foods", "challenging_foods"):
+            text = synthetic_guidance(section, items)
+            before = time_per_call(lambda: legacy_elements(section, text), args.reruns)
+            render_guidance.cache_clear()
+            first = time_per_call(lambda: render_guidance(section, text), 1)
+            after = time_per_call(lambda: render_guidance(section, text), args.reruns)
+
+            old_elements = legacy_elements(section, text)
+            new_elements = [(render_guidance(section, text), True)]
+            old_bytes, unit = payload_bytes(old_elements)
+            new_bytes, _ = payload_bytes(new_elements)
+            print(f"{items:>6}{section:>19}{before * 1e3:>17.3f}{after * 1e3:>9.3f}{first * 1e3:>9.3f}"
+                  f"{len(old_elements):>10}{len(new_elements):>7}{old_bytes:>16,}{new_bytes:>9,}")
+    print(f"\nPayload is {unit}; the 'Completed in' info line (one element before and after) is not counted.")
+
+
+if __name__ == "__main__":
+    main()
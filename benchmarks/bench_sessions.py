@@ -0,0 +1,193 @@
+"""Multi-session load test of the Streamlit app with stubbed APIs.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_sessions --sessions 1 2 4 8 16 --receipts 2
+    python -m benchmarks.bench_sessions --sessions 1 4 --model "Google Gemini 2.5" --json sessions.json
+
+Drives N simulated households through the app with ``streamlit.testing``'s
+``AppTest``: first page load, receipt upload, "Analyze" (OCR, parsing,
+summary), "Continue to Food Guidance", and a plain rerun with nothing new to
+do.  Vision, OpenAI and Gemini are the local stubs from
+``benchmarks/stub_servers.py``, configured through the app's endpoint
+secrets.  Each session stays alive while the next one runs, the way
+concurrent households share one server process, so the numbers reflect
+accumulated session state and process-wide caches.
+
+For every session count it reports the mean and max rerun wall time per
+action, the process RSS and its growth per session, and the external calls
+(stub requests) per action.  Together these give the scaling curve used to
+size a deployment.  Results are also written to ``--json``.
+
+AppTest cannot drive ``st.file_uploader``.  Uploads are simulated by storing
+the images the way the uploader code does (``store_upload`` into the image
+store) and putting the resulting ``StoredReceipt`` entries into
+``uploaded_receipts``.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from adapttable.uploads import store_upload
+from benchmarks.bench_preprocess import synthetic_receipt
+from benchmarks.stub_servers import GeminiStub, Latency, OpenAIStub, VisionStub
+
+APP_PATH = Path(__file__).resolve().parent.parent / "streamlit_app.py"
+ACTIONS = ("load", "upload", "analyze", "guidance", "idle_rerun")
+RUN_TIMEOUT = 600
+
+
+def rss_bytes():
+    """Current resident set size (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def new_session(stubs, model):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(str(APP_PATH), default_timeout=RUN_TIMEOUT)
+    app.secrets["google_api_key"] = "offline"
+    app.secrets["openai_api_key"] = "offline"
+    app.secrets["google_ai_api_key"] = "offline"
+    app.secrets["vision_url"] = stubs["vision"].annotate_url
+    app.secrets["openai_base_url"] = stubs["openai"].base_url
+    app.secrets["gemini_base_url"] = stubs["gemini"].url
+    return app
+
+
+def click(app, label_prefix):
+    button = next(button for button in app.button if button.label.startswith(label_prefix))
+    button.click()
+
+
+def drive_session(app, session_index, receipts, model, stubs):
+    """Run one session through every action; returns ``{action: (seconds, external calls)}``."""
+    def upload():
+        app.sidebar.selectbox[0].set_value(model)
+        # Imported here so CACHE_DIR picks up the benchmark's ADAPTTABLE_CACHE_DIR
+        from adapttable.cache import CACHE_DIR, ImageStore
+
+        image_store = ImageStore(CACHE_DIR / "images")
+        stored = [
+            store_upload(image_store, f"session{session_index}-receipt{i}.jpg", image)
+            for i, image in enumerate(receipts)
+        ]
+        app.session_state["uploaded_receipts"] = stored
+        app.session_state["receipt_hashes"] = {receipt.hash for receipt in stored}
+
+    steps = {
+        "load": lambda: None,
+        "upload": upload,
+        "analyze": lambda: click(app, "✅ I'm Ready"),
+        "guidance": lambda: click(app, "Continue to Food Guidance"),
+        "idle_rerun": lambda: None,
+    }
+    results = {}
+    for action in ACTIONS:
+        steps[action]()
+        calls_before = sum(stub.stats["requests"] for stub in stubs.values())
+        start = time.perf_counter()
+        app.run()
+        elapsed = time.perf_counter() - start
+        if app.exception:
+            raise RuntimeError(f"session {session_index} failed on {action}: {app.exception[0].message}")
+        calls = sum(stub.stats["requests"] for stub in stubs.values()) - calls_before
+        results[action] = (elapsed, calls)
+    return results
+
+
+def run_level(sessions, receipts_per_session, model, stubs, live_sessions):
+    """Add sessions until ``sessions`` are live; measure the ones added at this level."""
+    rss_before = rss_bytes()
+    added = sessions - len(live_sessions)
+    samples = {action: [] for action in ACTIONS}
+    for _ in range(added):
+        index = len(live_sessions)
+        # Every household uploads its own photos, so OCR is never a cross-session cache hit
+        receipts = [
+            synthetic_receipt(seed=index * 100 + i, size=(1512, 2016)) for i in range(receipts_per_session)
+        ]
+        app = new_session(stubs, model)
+        for action, sample in drive_session(app, index, receipts, model, stubs).items():
+            samples[action].append(sample)
+        live_sessions.append(app)
+    rss_after = rss_bytes()
+
+    return {
+        "sessions": sessions,
+        "rss_mb": rss_after / 1e6,
+        "rss_growth_per_session_mb": (rss_after - rss_before) / 1e6 / added if added else 0.0,
+        "actions": {
+            action: {
+                "mean_seconds": sum(seconds for seconds, _ in values) / len(values),
+                "max_seconds": max(seconds for seconds, _ in values),
+                "external_calls": sum(calls for _, calls in values) / len(values),
+            }
+            for action, values in samples.items() if values
+        },
+    }
+
+
+def print_curve(levels):
+    header = f"{'sessions':>8}{'RSS MB':>9}{'MB/sess':>9}"
+    header += "".join(f"{action:>22}" for action in ACTIONS)
+    print(header)
+    print(f"{'':>26}" + "".join(f"{'mean s / max s / calls':>22}" for _ in ACTIONS))
+    for level in levels:
+        line = f"{level['sessions']:>8}{level['rss_mb']:>9.1f}{level['rss_growth_per_session_mb']:>9.2f}"
+        for action in ACTIONS:
+            stats = level["actions"].get(action)
+            line += (
+                f"{stats['mean_seconds']:>10.2f}/{stats['max_seconds']:>5.2f}/{stats['external_calls']:>4.1f}"
+                if stats else f"{'-':>22}"
+            )
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Live session counts to measure (increasing)")
+    parser.add_argument("--receipts", type=int, default=2, help="Receipts uploaded per session")
+    parser.add_argument("--model", default="OpenAI GPT-4o")
+    parser.add_argument("--vision-latency", type=float, default=0.3)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--json", dest="json_path", default="bench_sessions.json")
+    args = parser.parse_args()
+
+    # Keep the run's OCR/response caches and expansion index away from the real ones
+    os.environ.setdefault("ADAPTTABLE_CACHE_DIR", tempfile.mkdtemp(prefix="adapttable-bench-"))
+
+    vision_latency = Latency(args.vision_latency, args.jitter)
+    llm_latency = Latency(args.llm_latency, args.jitter, per_chunk=0.002)
+    levels = []
+    with VisionStub(vision_latency) as vision, OpenAIStub(llm_latency) as openai_stub, \
+            GeminiStub(llm_latency) as gemini_stub:
+        stubs = {"vision": vision, "openai": openai_stub, "gemini": gemini_stub}
+        live_sessions = []
+        for sessions in sorted(set(args.sessions)):
+            levels.append(run_level(sessions, args.receipts, args.model, stubs, live_sessions))
+            print(f"  measured {sessions} live session(s)", file=sys.stderr)
+
+    print_curve(levels)
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key != "json_path"},
+        "levels": levels,
+    }
+    Path(args.json_path).write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Cold-start import cost of the app's modules and the provider SDKs.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_startup [--runs 5]
+
+Imports each module in a fresh interpreter, the way a new container or
+worker process does, and reports the median wall time.  ``adapttable`` rows
+should not include the SDKs: provider SDKs are imported lazily by
+``adapttable.backends`` on first use, so their rows show what the first
+call to that provider adds.  Modules that are not installed are reported as
+such.  Per-rerun overhead inside a running app is shown in the sidebar with
+the ``profile_reruns`` secret.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+MODULES = (
+    "adapttable.backends",
+    "adapttable.household",
+    "adapttable.batch",
+    "openai",
+    "google.generativeai",
+    "streamlit",
+)
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+sdks = [name for name in ("openai", "google.generativeai") if name in sys.modules]
+print(elapsed, ",".join(sdks))
+"""
+
+
+def import_time(module):
+    """``(seconds, SDKs loaded as a side effect)`` in a fresh interpreter, or None if it fails."""
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module)], capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None
+    seconds, _, sdks = result.stdout.strip().partition(" ")
+    return float(seconds), sdks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("modules", nargs="*", default=list(MODULES))
+    args = parser.parse_args()
+
+    print(f"{'module':<24}{'median ms':>11}{'max ms':>9}  SDKs loaded")
+    for module in args.modules:
+        samples = [import_time(module) for _ in range(args.runs)]
+        if any(sample is None for sample in samples):
+            print(f"{module:<24}{'not importable (missing dependency?)':>40}")
+            continue
+        seconds = [elapsed for elapsed, _ in samples]
+        print(f"{module:<24}{statistics.median(seconds) * 1e3:>11.1f}{max(seconds) * 1e3:>9.1f}  "
+              f"{samples[0][1] or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Local stand-ins for the Vision, OpenAI and Gemini HTTP APIs.
+
+Each stub speaks just enough of the real wire format for the clients in
+``adapttable`` (``requests`` for Vision, the OpenAI SDK, and the Gemini SDK's
+REST transport) and answers with deterministic content after a configurable
+delay, so the whole pipeline can be timed without network access:
+
+- Vision returns the OCR text of one of the ``fixtures/ocr`` receipts, picked
+  by a hash of the image.
+- The LLM stubs build receipt JSON from the lines in a parser prompt, fill any
+  other JSON schema with placeholder markdown, and otherwise answer with
+  markdown shaped like the guidance sections.  Responses stream in chunks.
+
+Every stub counts requests and bytes in each direction, and reports token
+usage with a simple prefix cache (prompts sharing 1,024+ tokens with an
+earlier prompt get the shared part back as cached tokens, in 128-token steps,
+as OpenAI does).
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from adapttable.expansions import normalize_item
+from adapttable.pipeline import estimate_tokens
+
+OCR_FIXTURES = Path(__file__).resolve().parent / "fixtures" / "ocr"
+
+MIN_CACHED_PREFIX_TOKENS = 1024
+CACHED_PREFIX_STEP = 128
+STREAM_CHUNK_CHARS = 40
+
+_PRICE = re.compile(r"\d+[.,]\d{2}")
+
+GUIDANCE_MARKDOWN = """Here is a look at how some of the items in your cart may affect blood sugar.
+
+**🥬 Food Item:** {item}
+
+**✅ Why It's Great for Blood Sugar Control:** Fiber and protein slow how quickly carbohydrates are absorbed.
+
+**🍽️ How to Use It:** Pair it with a lean protein at lunch.
+
+**🍞 Food Item:** {other}
+
+**❌ Why It May Challenge Control:** Refined carbohydrates are absorbed quickly.
+
+**✅ Try Instead:** A whole-grain version.
+
+**🔄 Adaptation Tip:** Eat it after vegetables and protein."""
+
+
+@dataclass
+class Latency:
+    """Delay before the first byte of a response: ``base`` seconds +/- ``jitter``."""
+    base: float = 0.0
+    jitter: float = 0.0
+    # Delay between streamed chunks
+    per_chunk: float = 0.0
+
+    def first_byte(self):
+        return max(0.0, self.base + random.uniform(-self.jitter, self.jitter))
+
+
+class _PrefixCache:
+    def __init__(self, limit=256):
+        self._prompts = []
+        self._limit = limit
+        self._lock = threading.Lock()
+
+    def cached_tokens(self, prompt):
+        with self._lock:
+            shared = max((_common_prefix(prompt, seen) for seen in self._prompts), default=0)
+            self._prompts = (self._prompts + [prompt])[-self._limit:]
+        tokens = shared // 4
+        if tokens < MIN_CACHED_PREFIX_TOKENS:
+            return 0
+        return tokens - tokens % CACHED_PREFIX_STEP
+
+
+def _common_prefix(a, b):
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+class StubServer:
+    """One stub API on ``127.0.0.1`` and an ephemeral port, served from a daemon thread."""
+
+    name = "stub"
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self.stats = {"requests": 0, "bytes_received": 0, "bytes_sent": 0}
+        self._lock = threading.Lock()
+        self.prefix_cache = _PrefixCache()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                stub.count(requests=1, bytes_received=len(body))
+                time.sleep(stub.latency.first_byte())
+                stub.handle(self, json.loads(body or b"{}"))
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=self.name, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, **amounts):
+        with self._lock:
+            for key, amount in amounts.items():
+                self.stats[key] += amount
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = dict.fromkeys(self.stats, 0)
+
+    def handle(self, request, payload):
+        raise NotImplementedError
+
+    def send_json(self, request, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+        self.count(bytes_sent=len(body))
+
+    def send_events(self, request, events):
+        """Stream ``events`` (JSON-able objects or raw strings) as server-sent events."""
+        request.send_response(200)
+        request.send_header("Content-Type", "text/event-stream")
+        request.end_headers()
+        for index, event in enumerate(events):
+            if index:
+                time.sleep(self.latency.per_chunk)
+            data = event if isinstance(event, str) else json.dumps(event)
+            chunk = f"data: {data}\r\n\r\n".encode("utf-8")
+            request.wfile.write(chunk)
+            request.wfile.flush()
+            self.count(bytes_sent=len(chunk))
+
+
+class VisionStub(StubServer):
+    """``POST /v1/images:annotate``; the client's ``url`` is ``VisionStub.annotate_url``."""
+
+    name = "vision"
+
+    def __init__(self, latency=None, fixtures_dir=OCR_FIXTURES):
+        super().__init__(latency)
+        self.texts = [path.read_text(encoding="utf-8") for path in sorted(fixtures_dir.glob("*.txt"))]
+        self.annotate_url = f"{self.url}/v1/images:annotate"
+
+    def handle(self, request, payload):
+        responses = []
+        for item in payload.get("requests", []):
+            digest = hashlib.sha256(item["image"]["content"].encode("ascii")).digest()
+            text = self.texts[int.from_bytes(digest[:4], "big") % len(self.texts)]
+            responses.append({
+                "textAnnotations": [{"description": text}],
+                "fullTextAnnotation": {"text": text},
+            })
+        self.send_json(request, {"responses": responses})
+
+
+def _receipts_json(prompt):
+    """Receipt JSON for the lines of a parser prompt: every priced line is an item."""
+    text = prompt.rsplit("Extracted Receipt Text:", 1)[-1]
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    items = []
+    for line in lines:
+        raw = normalize_item(line)
+        if raw and _PRICE.search(line):
+            items.append({"raw": raw, "expansion": raw.title(), "ambiguous": False})
+    store = lines[0] if lines else "Stub Store"
+    return json.dumps({"receipts": [{"store": store, "date": "01/01/2024", "items": items}]})
+
+
+def stub_response(prompt, schema=None):
+    """Deterministic response text for a prompt and optional JSON schema."""
+    if schema is not None and "receipts" in schema.get("properties", {}):
+        return _receipts_json(prompt)
+    items = re.findall(r"=> (.+)", prompt) or ["Whole Wheat Bread", "Spinach"]
+    markdown = GUIDANCE_MARKDOWN.format(item=items[0], other=items[-1])
+    if schema is not None:
+        return json.dumps({key: markdown for key in schema.get("properties", {})})
+    return markdown
+
+
+def _chunks(text):
+    return [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+
+
+class OpenAIStub(StubServer):
+    """``POST /v1/chat/completions``, streaming only; use ``OpenAIStub.base_url``."""
+
+    name = "openai"
+
+    def __init__(self, latency=None):
+        super().__init__(latency)
+        self.base_url = f"{self.url}/v1"
+
+    def handle(self, request, payload):
+        prompt = "\n".join(message["content"] for message in payload["messages"])
+        response_format = payload.get("response_format") or {}
+        schema = response_format.get("json_schema", {}).get("schema")
+        if schema is None and response_format.get("type") == "json_object" and "receipts" in prompt:
+            schema = {"properties": {"receipts": {}}}
+        text = stub_response(prompt, schema)
+
+        base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": payload["model"]}
+        events = [
+            {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece},
+                                  "finish_reason": None}]}
+            for piece in _chunks(text)
+        ]
+        events.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if payload.get("stream_options", {}).get("include_usage"):
+            prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+            events.append({**base, "choices": [], "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": self.prefix_cache.cached_tokens(prompt)},
+            }})
+        events.append("[DONE]")
+        self.send_events(request, events)
+
+
+class GeminiStub(StubServer):
+    """``POST /v1beta/models/<model>:streamGenerateContent?alt=sse``; use ``GeminiStub.url``."""
+
+    name = "gemini"
+
+    def handle(self, request, payload):
+        prompt = "\n".join(
+            part.get("text", "") for content in payload.get("contents", []) for part in content.get("parts", [])
+        )
+        config = payload.get("generationConfig") or payload.get("generation_config") or {}
+        schema = config.get("responseSchema") or config.get("response_schema")
+        text = stub_response(prompt, schema)
+
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        chunks = _chunks(text)
+        events = []
+        for index, piece in enumerate(chunks):
+            event = {"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}, "index": 0}]}
+            if index == len(chunks) - 1:
+                event["candidates"][0]["finishReason"] = "STOP"
+                event["usageMetadata"] = {
+                    "promptTokenCount": prompt_tokens,
+                    "candidatesTokenCount": completion_tokens,
+                    "totalTokenCount": prompt_tokens + completion_tokens,
+                    "cachedContentTokenCount": self.prefix_cache.cached_tokens(prompt),
+                }
+            events.append(event)
+        if request.path.split("?")[0].endswith(":streamGenerateContent"):
+            self.send_events(request, events)
+        else:
+            merged = dict(events[-1])
+            merged["candidates"] = [{**events[-1]["candidates"][0],
+                                     "content": {"parts": [{"text": text}], "role": "model"}}]
+            self.send_json(request, merged)
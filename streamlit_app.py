@@ -1,36 +1,44 @@
+import time
+
+# Wall-clock start of this script run, for the profiling mode
+run_start_time = time.perf_counter()
+
 import streamlit as st
-from openai import OpenAI
-import base64
-import requests
 import streamlit.components.v1 as components
-import os
-import toml
-import time
-import google.generativeai as genai
+import functools
+import html
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from adapttable.backends import MODEL_REGISTRY, SDK_IMPORT_SECONDS, get_backend, model_provider
+from adapttable.cache import CACHE_DIR, DiskCache, ImageStore, ResponseCache
+from adapttable.classify import partition_record
+from adapttable.expansions import ExpansionIndex
+from adapttable.history import PurchaseHistory
+from adapttable.household import (
+    make_complete,
+    update_combined_guidance,
+    update_guidance,
+    update_summary,
+    write_combined_guidance,
+    write_guidance,
+    write_summary,
+)
+from adapttable.jobs import FAILED, QUEUED, RUNNING, ConcurrencyLimiter, JobManager
+from adapttable.ocr import VISION_URL, image_hash, iter_annotations
+from adapttable.parsing import parse_receipt_text
+from adapttable.pipeline import (
+    content_hash,
+    stage_is_fresh,
+    stage_result,
+    store_stage,
+)
+from adapttable.receipts import MasterRecord
+from adapttable.rendering import GUIDANCE_CSS, render_guidance
+from adapttable.tracing import METRICS_WRITE_INTERVAL, SessionMemory, Span, Tracer, estimate_size, serve_metrics
+from adapttable.uploads import store_upload
 
-# Add custom CSS for food items
-st.markdown("""
-<style>
-.food-item-helpful {
-    background-color: #e8f5e9;  /* Light green background */
-    padding: 15px;
-    border-radius: 8px;
-    margin: 15px 0;
-    font-size: 1.2em;
-    font-weight: 600;
-    color: #2e7d32;  /* Darker green text */
-}
-.food-item-challenging {
-    background-color: #ffebee;  /* Light red background */
-    padding: 15px;
-    border-radius: 8px;
-    margin: 15px 0;
-    font-size: 1.2em;
-    font-weight: 600;
-    color: #c62828;  /* Darker red text */
-}
-</style>
-""", unsafe_allow_html=True)
+# Imports are only slow on a process's first run; later reruns find them loaded
+imports_seconds = time.perf_counter() - run_start_time
 
 # --- Callback Function ---
 def on_continue_click():
@@ -45,11 +53,8 @@ def on_radio_change():
 def on_continue_to_guidance_click():
     st.session_state.analysis_complete = True
     st.session_state.show_helps_hinders = True
-    # Clear any existing helps/hinders content to ensure fresh generation
-    if 'helpful_foods_content' in st.session_state:
-        del st.session_state.helpful_foods_content
-    if 'challenging_foods_content' in st.session_state:
-        del st.session_state.challenging_foods_content
+    # Helps/hinders content is regenerated by the pipeline only when the
+    # master record or model changes, so there is nothing to clear here.
 
 # --- Load Secrets ---
 try:
@@ -61,13 +66,127 @@ except Exception as e:
     st.error("Error loading secrets from Streamlit Cloud. Please ensure all API keys are configured in your Streamlit Cloud secrets.")
     st.stop()
 
-# Initialize clients
-client = OpenAI(api_key=OPENAI_API_KEY)
-genai.configure(api_key=GOOGLE_AI_API_KEY)
+# OCR tuning: receipts per annotate call and max in-flight calls (Vision quota)
+VISION_BATCH_SIZE = int(st.secrets.get("vision_batch_size", 4))
+VISION_MAX_CONCURRENCY = int(st.secrets.get("vision_max_concurrency", 4))
+# Max receipts parsed by the model at once
+PARSER_MAX_CONCURRENCY = int(st.secrets.get("parser_max_concurrency", 4))
+# Shrink photos before upload; cropping to the receipt outline is opt-in
+PREPROCESS_RECEIPTS = bool(st.secrets.get("preprocess_receipts", True))
+CROP_RECEIPTS = bool(st.secrets.get("crop_receipts", False))
+# Drop totals/tenders/addresses/boilerplate lines before the parser prompt
+FILTER_OCR_LINES = bool(st.secrets.get("filter_ocr_lines", True))
+# Report import time, per-rerun setup overhead and provider SDK import cost in the sidebar
+PROFILE_RERUNS = bool(st.secrets.get("profile_reruns", False))
+# Revise the summary and guidance with delta prompts when receipts add new items
+INCREMENTAL_GUIDANCE = bool(st.secrets.get("incremental_guidance", True))
+# Endpoint overrides, e.g. a proxy or the stub servers in benchmarks/
+VISION_ENDPOINT = st.secrets.get("vision_url", VISION_URL)
+PROVIDER_BASE_URLS = {"openai": st.secrets.get("openai_base_url"), "gemini": st.secrets.get("gemini_base_url")}
+
+# OCR results are cached on disk by image hash and shared across sessions
+@st.cache_resource
+def get_ocr_cache():
+    return DiskCache(
+        CACHE_DIR / "ocr",
+        max_bytes=int(st.secrets.get("ocr_cache_max_mb", 200)) * 1024 * 1024,
+        max_age=int(st.secrets.get("ocr_cache_max_age_days", 30)) * 24 * 3600,
+    )
+
+# Uploaded images live on disk, addressed by content; sessions keep only the hash
+@st.cache_resource
+def get_image_store():
+    return ImageStore(
+        CACHE_DIR / "images",
+        max_bytes=int(st.secrets.get("image_store_max_mb", 2048)) * 1024 * 1024,
+        max_age=int(st.secrets.get("image_store_max_age_days", 7)) * 24 * 3600,
+    )
+
+image_store = get_image_store()
+
+# Model responses are cached by provider, model and prompts, with a TTL
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(
+        CACHE_DIR / "responses.sqlite3",
+        ttl=int(st.secrets.get("response_cache_ttl_hours", 24 * 7)) * 3600,
+        max_entries=int(st.secrets.get("response_cache_max_entries", 5000)),
+    )
+
+response_cache = get_response_cache()
+
+# Known item expansions per store, learned from past parser output
+@st.cache_resource
+def get_expansion_index():
+    return ExpansionIndex(CACHE_DIR / "expansions.json")
+
+expansion_index = get_expansion_index()
+
+# Parsed receipt items per household, kept across visits for longitudinal summaries
+@st.cache_resource
+def get_purchase_history():
+    return PurchaseHistory(CACHE_DIR / "history.sqlite3")
+
+purchase_history = get_purchase_history() if st.secrets.get("purchase_history", True) else None
+
+# Spans for every external call and pipeline step go to a rotating JSONL log and
+# a Prometheus text file (also served on /metrics when metrics_port is set)
+@st.cache_resource
+def get_tracer():
+    tracer = Tracer(
+        CACHE_DIR / "traces" / "spans.jsonl",
+        CACHE_DIR / "traces" / "metrics.prom",
+        max_bytes=int(st.secrets.get("trace_log_max_mb", 10)) * 1024 * 1024,
+        backup_count=int(st.secrets.get("trace_log_backups", 5)),
+    )
+    if st.secrets.get("metrics_port"):
+        serve_metrics(tracer, int(st.secrets["metrics_port"]))
+    return tracer
+
+tracer = get_tracer()
+
+# Session-state size of every live session, reported against these budgets
+@st.cache_resource
+def get_session_memory():
+    return SessionMemory()
+
+session_memory = get_session_memory()
+
+# OCR and model work runs as jobs on one pool shared by every session (see adapttable.jobs);
+# sessions keep job IDs and poll them, so reruns neither interrupt nor repeat the work
+@st.cache_resource
+def get_job_manager():
+    return JobManager(max_workers=int(st.secrets.get("job_workers", 8)))
+
+jobs = get_job_manager()
+JOB_POLL_SECONDS = float(st.secrets.get("job_poll_seconds", 0.5))
+
+# Requests in flight to each provider, across all sessions, so bursts queue here
+# instead of tripping provider rate limits
+@st.cache_resource
+def get_provider_limiter():
+    return ConcurrencyLimiter({
+        "vision": int(st.secrets.get("vision_max_in_flight", 8)),
+        "openai": int(st.secrets.get("openai_max_in_flight", 8)),
+        "gemini": int(st.secrets.get("gemini_max_in_flight", 4)),
+    })
+
+provider_limiter = get_provider_limiter()
+SESSION_MEMORY_BUDGET = int(st.secrets.get("session_memory_budget_mb", 20)) * 1024 * 1024
+GLOBAL_MEMORY_BUDGET = int(st.secrets.get("global_memory_budget_mb", 1024)) * 1024 * 1024
+
+# Model backends are built once per process by get_backend; these only configure them
+PROVIDER_API_KEYS = {"openai": OPENAI_API_KEY, "gemini": GOOGLE_AI_API_KEY}
+LLM_TIMEOUT = float(st.secrets.get("llm_timeout_seconds", 120))
+LLM_MAX_RETRIES = int(st.secrets.get("llm_max_retries", 3))
 
 # --- Initialize Session State ---
 if "uploaded_receipts" not in st.session_state:
     st.session_state.uploaded_receipts = []
+if "receipt_hashes" not in st.session_state:
+    st.session_state.receipt_hashes = set()
+if "upload_hashes" not in st.session_state:
+    st.session_state.upload_hashes = {}  # uploader file ID -> image hash
 if "show_helps_hinders" not in st.session_state:
     st.session_state.show_helps_hinders = False
 if "master_record" not in st.session_state:
@@ -76,53 +195,222 @@ if "household_summary" not in st.session_state:
     st.session_state.household_summary = None
 if "analysis_complete" not in st.session_state:
     st.session_state.analysis_complete = False
-if "cleaned_items_output" not in st.session_state:
-    st.session_state.cleaned_items_output = None
 if "current_step" not in st.session_state:
     st.session_state.current_step = "upload"
 if "processing_times" not in st.session_state:
     st.session_state.processing_times = {}
+if "pipeline_stages" not in st.session_state:
+    st.session_state.pipeline_stages = {}
+if "ocr_cache_stats" not in st.session_state:
+    st.session_state.ocr_cache_stats = {"hits": 0, "misses": 0}
+if "expansion_stats" not in st.session_state:
+    st.session_state.expansion_stats = {"local": 0, "parsed": 0, "tokens_saved": 0}
+if "trace_session" not in st.session_state:
+    st.session_state.trace_session = uuid.uuid4().hex[:12]
+if "guidance_mode_stats" not in st.session_state:
+    st.session_state.guidance_mode_stats = {}
+if "guidance_basis" not in st.session_state:
+    st.session_state.guidance_basis = {}
+if "guidance_update_stats" not in st.session_state:
+    st.session_state.guidance_update_stats = {"full": 0, "delta": 0}
+if "ocr_filter_stats" not in st.session_state:
+    st.session_state.ocr_filter_stats = {"lines_dropped": 0, "tokens_dropped": 0}
+if "ocr_failed" not in st.session_state:
+    st.session_state.ocr_failed = set()
+if "history_recorded" not in st.session_state:
+    st.session_state.history_recorded = set()
+if "background_jobs" not in st.session_state:
+    st.session_state.background_jobs = {}
 
 # --- Model Selection ---
 st.sidebar.title("Model Selection")
 model_choice = st.sidebar.selectbox(
     "Select Model",
-    ["OpenAI GPT-4o", "OpenAI GPT-3.5-Turbo-0125", "Google Gemini 2.5"],
+    list(MODEL_REGISTRY),
     index=0
 )
+use_response_cache = st.sidebar.checkbox(
+    "Reuse cached model responses",
+    value=True,
+    help="Untick to always call the model, e.g. to compare fresh runs. Fresh responses still refresh the cache."
+)
+single_call_guidance = st.sidebar.checkbox(
+    "Single-call guidance",
+    value=bool(st.secrets.get("single_call_guidance", False)),
+    help="Write the summary, helpful foods and challenging foods in one structured response instead of three calls."
+)
 
-# --- Helper Function: Extract all store blocks from markdown table ---
-def extract_all_store_blocks(parsed_text):
-    blocks = []
-    current_store = None
-    current_items = []
-
-    for line in parsed_text.strip().splitlines():
-        line = line.strip()
-        if line.lower().startswith("store name:"):
-            if current_store and current_items:
-                blocks.append((current_store, "\n".join(current_items)))
-                current_items = []
-            current_store = line.split(":", 1)[-1].strip()
-
-        elif line.startswith("| Raw Item"):
-            continue  # skip header
-        elif line.startswith("|") and current_store:
-            parts = line.split("|")
-            if len(parts) > 2:
-                raw = parts[1].strip()
-                if raw.lower() != "raw item":
-                    current_items.append(raw)
-        elif not line and current_store and current_items:
-            blocks.append((current_store, current_items))
-            current_store = None
-            current_items = []
-
-    # Catch final block
-    if current_store and current_items:
-        blocks.append((current_store, current_items))
-
-    return blocks
+# --- Purchase History ---
+# Receipts are stored under the household ID, which is kept in the URL so a
+# bookmarked link brings a returning household back to its history
+household_id = ""
+if purchase_history is not None:
+    st.sidebar.subheader("Purchase History")
+    household_id = st.sidebar.text_input(
+        "Household ID",
+        value=st.query_params.get("household", ""),
+        help="Receipts you analyze are saved under this ID, and your summary draws on everything saved before.",
+    ).strip()
+    if household_id:
+        if st.query_params.get("household") != household_id:
+            st.query_params["household"] = household_id
+        history_overview = purchase_history.overview(household_id)
+        if history_overview["receipts"]:
+            st.sidebar.markdown(
+                f"- {history_overview['receipts']} receipts, {history_overview['items']:,} items "
+                f"({history_overview['first_day']} to {history_overview['last_day']})"
+            )
+        else:
+            st.sidebar.markdown("- No receipts saved yet")
+
+# --- Model Call Helper ---
+# Streamed output is redrawn at most this often to limit websocket traffic
+STREAM_REFRESH_SECONDS = 0.15
+
+def throttled(callback, interval=STREAM_REFRESH_SECONDS):
+    """Wrap ``callback`` so it runs at most once per ``interval`` seconds."""
+    if callback is None:
+        return None
+    last_call = [0.0]
+
+    def wrapper(text):
+        now = time.time()
+        if now - last_call[0] >= interval:
+            last_call[0] = now
+            callback(text)
+
+    return wrapper
+
+# Read here, on the script thread, so worker threads can tag their spans
+trace_session = st.session_state.trace_session
+
+def run_model(system_prompt, user_prompt, on_text=None, response_schema=None, stage="model_call"):
+    """Run the selected model, serving repeated prompts from the response cache.
+
+    ``on_text`` receives the partial text while it streams. Returns a
+    Completion and records a ``stage`` span; safe to call from worker threads.
+    """
+    provider = model_provider(model_choice)
+    backend = get_backend(
+        model_choice,
+        PROVIDER_API_KEYS[provider],
+        timeout=LLM_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        base_url=PROVIDER_BASE_URLS[provider],
+    )
+    complete = make_complete(
+        backend,
+        model_choice,
+        response_cache=response_cache,
+        read_cache=use_response_cache,
+        tracer=tracer,
+        session=trace_session,
+        concurrency=provider_limiter,
+    )
+    return complete(
+        system_prompt, user_prompt, on_text=throttled(on_text), response_schema=response_schema, stage=stage
+    )
+
+def record_processing_time(step, processing_time, first_token_time=None):
+    """Store the latest timing for ``step`` under the selected model and trace it."""
+    tracer.record(Span(step, model_choice, processing_time, kind="step", first_token_time=first_token_time,
+                       session=trace_session))
+    if step not in st.session_state.processing_times:
+        st.session_state.processing_times[step] = {}
+    st.session_state.processing_times[step][model_choice] = processing_time
+
+def record_guidance_run(mode, key, latency, completions):
+    """Accumulate latency and prompt/cached tokens for a guidance mode.
+
+    Totals cover the latest master record (``key``) only, so the split and
+    single-call modes can be compared on the same input.
+    """
+    stats = st.session_state.guidance_mode_stats.get(mode)
+    if stats is None or stats["key"] != key:
+        stats = {"key": key, "calls": 0, "latency": 0.0, "prompt_tokens": 0, "cached_tokens": 0}
+        st.session_state.guidance_mode_stats[mode] = stats
+    stats["calls"] += len(completions)
+    stats["latency"] += latency
+    for completion in completions:
+        stats["prompt_tokens"] += completion.usage.get("prompt_tokens", 0)
+        stats["cached_tokens"] += completion.usage.get("cached_tokens", 0)
+
+def guidance_key_for(master_record):
+    """Summary and guidance depend only on the set of items bought, the model and the household's history."""
+    return content_hash(model_choice, household_id, *master_record.item_names())
+
+def items_added_since(stages, master_record):
+    """A record of the items ``stages`` were not written from, or None to write them in full.
+
+    A delta is only possible when every stage was last written by the selected
+    model from the same item set, and the current record still has all of it.
+    """
+    bases = [st.session_state.guidance_basis.get(stage) for stage in stages]
+    if not INCREMENTAL_GUIDANCE or bases[0] is None or any(basis != bases[0] for basis in bases):
+        return None
+    if bases[0]["model"] != model_choice or bases[0]["household"] != household_id:
+        return None
+    if stage_result(st.session_state, stages[0]) is None:
+        return None
+    known_names = bases[0]["items"]
+    if not set(known_names) <= set(master_record.item_names()):
+        return None
+    return master_record.items_not_in(known_names)
+
+def record_guidance_basis(stages, master_record, delta):
+    """Remember which items ``stages`` were just written from."""
+    basis = {"model": model_choice, "household": household_id, "items": master_record.item_names()}
+    for stage in stages:
+        st.session_state.guidance_basis[stage] = basis
+    st.session_state.guidance_update_stats["delta" if delta else "full"] += len(stages)
+
+def record_history(receipt_hash, receipts):
+    """Add one image's parsed receipts to the household's stored history, once per session."""
+    if purchase_history is None or not household_id or (household_id, receipt_hash) in st.session_state.history_recorded:
+        return
+    purchase_history.record_receipts(household_id, receipt_hash, receipts)
+    st.session_state.history_recorded.add((household_id, receipt_hash))
+
+def job_for(kind, key, fn):
+    """The session's ``kind`` job for inputs ``key``, submitting ``fn(job)`` if there is none.
+
+    A job for other inputs (e.g. from before the model was changed) is left to
+    finish on its own and its result ignored.
+    """
+    job = jobs.get(st.session_state.background_jobs.get(kind))
+    if job is None or job.key != key:
+        job = jobs.submit(kind, key, fn, session=trace_session)
+        st.session_state.background_jobs[kind] = job.id
+    return job
+
+def wait_for(job, show_progress):
+    """Draw a running job with ``show_progress(progress, partial)``, then rerun to poll it again."""
+    state, progress, partial = job.status()
+    if state == QUEUED:
+        st.caption("⏳ Waiting for a free worker...")
+    show_progress(progress, partial)
+    time.sleep(JOB_POLL_SECONDS)
+    st.rerun()
+
+def show_job_error(kind, job, message):
+    """Report a failed job and stop; it is only resubmitted when the user asks."""
+    st.error(message)
+    st.exception(job.error)
+    if st.button("Try again", key=f"retry_{kind}"):
+        st.session_state.background_jobs.pop(kind, None)
+        st.rerun()
+    st.stop()
+
+def finish_job(kind, job):
+    """Forget a finished job once its result is applied, tracing its queue wait and run time."""
+    st.session_state.background_jobs.pop(kind, None)
+    tracer.record(Span(f"job_{kind}_wait", model_choice, job.started_at - job.submitted_at, kind="step",
+                       session=trace_session))
+    tracer.record(Span(f"job_{kind}", model_choice, job.finished_at - job.started_at, kind="step",
+                       error=type(job.error).__name__ if job.error else None, session=trace_session))
+
+# Everything above runs on every rerun before any page content: config, caches, session state, sidebar
+setup_seconds = time.perf_counter() - run_start_time - imports_seconds
 
 # --- Styled Logo Header ---
 st.markdown(
@@ -153,9 +441,17 @@ Upload as many as you like (the more items, the better)!
 st.markdown("### 📤 Upload Your Receipt")
 new_receipt = st.file_uploader("Upload your grocery receipt image", type=["jpg", "jpeg", "png"])
 
-if new_receipt is not None:
-    if new_receipt.name not in [f.name for f in st.session_state.uploaded_receipts]:
-        st.session_state.uploaded_receipts.append(new_receipt)
+# The uploader returns its file on every rerun (including each job poll); a file
+# is read and hashed once, the first time its upload ID is seen
+if new_receipt is not None and new_receipt.file_id not in st.session_state.upload_hashes:
+    # Compare image content, so a renamed copy of the same photo is still caught
+    new_receipt_bytes = new_receipt.getvalue()
+    new_receipt_hash = image_hash(new_receipt_bytes)
+    st.session_state.upload_hashes[new_receipt.file_id] = new_receipt_hash
+    if new_receipt_hash not in st.session_state.receipt_hashes:
+        # The image goes to the on-disk store; the session keeps its hash, name, size and a thumbnail
+        st.session_state.uploaded_receipts.append(store_upload(image_store, new_receipt.name, new_receipt_bytes))
+        st.session_state.receipt_hashes.add(new_receipt_hash)
         st.success("Receipt uploaded!")
     else:
         st.warning("This receipt has already been uploaded.")
@@ -163,8 +459,15 @@ if new_receipt is not None:
 # --- Show Receipt Count ---
 if st.session_state.uploaded_receipts:
     st.markdown(f"📥 **{len(st.session_state.uploaded_receipts)} receipt(s) uploaded:**")
-    for file in st.session_state.uploaded_receipts:
-        st.markdown(f"- {file.name}")
+    for receipt in st.session_state.uploaded_receipts:
+        st.markdown(f"- {receipt.name}")
+    thumbnails = [receipt for receipt in st.session_state.uploaded_receipts if receipt.thumbnail]
+    if thumbnails:
+        st.image(
+            [receipt.thumbnail for receipt in thumbnails],
+            caption=[receipt.name for receipt in thumbnails],
+            width=96,
+        )
 
     # --- Conversational Prompt ---
     st.markdown("**I've scanned and structured your shopping data.**")
@@ -183,36 +486,111 @@ else:
 
 # --- Combined Text Extraction and Analysis ---
 if st.session_state.current_step == "analysis":
-    combined_text = ""
-
-    for uploaded_file in st.session_state.uploaded_receipts:
-        uploaded_file.seek(0)  # Reset file pointer
-        image_content = uploaded_file.read()
-        image_base64 = base64.b64encode(image_content).decode("utf-8")
-
-        vision_url = f"https://vision.googleapis.com/v1/images:annotate?key={GOOGLE_VISION_API_KEY}"
-        vision_payload = {
-            "requests": [{
-                "image": {"content": image_base64},
-                "features": [{"type": "TEXT_DETECTION"}]
-            }]
-        }
-
-        vision_response = requests.post(vision_url, json=vision_payload)
-        result = vision_response.json()
-
-        if (
-            isinstance(result, dict) and
-            "responses" in result and
-            isinstance(result["responses"], list) and
-            len(result["responses"]) > 0 and
-            "fullTextAnnotation" in result["responses"][0]
+    # Each stage below is keyed by the content of its inputs and only re-runs
+    # when they change; plain UI reruns reuse the stored results. The work
+    # itself runs as background jobs, so reruns while it is in flight only
+    # redraw its progress.
+    ocr_cache = get_ocr_cache()
+
+    def read_receipts(receipts, job):
+        """OCR job: load ``receipts`` (stored uploads) from the image store and read them."""
+        present, images, evicted = [], [], []
+        for receipt in receipts:
+            image = image_store.get(receipt.hash)
+            if image is None:
+                evicted.append(receipt)
+            else:
+                present.append(receipt)
+                images.append(image)
+                job.report(receipt.name, "⏳")
+
+        texts, cached_hashes = {}, set()
+        ocr_start_time = time.time()
+        for index, extracted_text, cached in iter_annotations(
+            images,
+            GOOGLE_VISION_API_KEY,
+            batch_size=VISION_BATCH_SIZE,
+            max_concurrency=VISION_MAX_CONCURRENCY,
+            preprocess=PREPROCESS_RECEIPTS,
+            crop=CROP_RECEIPTS,
+            cache=ocr_cache,
+            url=VISION_ENDPOINT,
+            concurrency=provider_limiter,
         ):
-            extracted_text = result["responses"][0]["fullTextAnnotation"]["text"]
-            combined_text += extracted_text + "\n\n"
-        else:
-            st.error(f"Could not process: {uploaded_file.name}. Please check image quality.")
-            st.stop()
+            receipt = present[index]
+            texts[receipt.hash] = extracted_text
+            if cached:
+                cached_hashes.add(receipt.hash)
+            # Per receipt: how long after the OCR stage started its text arrived
+            tracer.record(Span(
+                "ocr",
+                "google-vision",
+                time.time() - ocr_start_time,
+                bytes_sent=0 if cached else len(images[index]),
+                bytes_received=len((extracted_text or "").encode("utf-8")),
+                cache="hit" if cached else "miss",
+                error=None if extracted_text is not None else "no_text",
+                session=trace_session,
+            ))
+            job.report(receipt.name, "✅" if extracted_text is not None else "❌")
+        return {"texts": texts, "cached": cached_hashes, "evicted": evicted}
+
+    def show_ocr_progress(progress, partial):
+        done = sum(status != "⏳" for status in progress.values())
+        st.progress(done / max(1, len(progress)), text=f"🔍 Read {done} of {len(progress)} receipt(s)")
+        for name, status in progress.items():
+            st.markdown(f"{status} {name}")
+
+    # Each receipt is OCR'd once; adding a receipt only reads the new one. Failed
+    # reads are not stored as results: they wait for the user to retry them.
+    pending_ocr = [
+        receipt for receipt in st.session_state.uploaded_receipts
+        if not stage_is_fresh(st.session_state, f"ocr:{receipt.hash}", receipt.hash)
+        and receipt.hash not in st.session_state.ocr_failed
+    ]
+    if pending_ocr:
+        ocr_job = job_for(
+            "ocr", content_hash(*(receipt.hash for receipt in pending_ocr)),
+            functools.partial(read_receipts, pending_ocr),
+        )
+        if not ocr_job.finished:
+            wait_for(ocr_job, show_ocr_progress)
+        if ocr_job.state == FAILED:
+            show_job_error("ocr", ocr_job, "There was a problem reading your receipts.")
+        for receipt in ocr_job.result["evicted"]:
+            # Evicted from the store before it was ever read
+            st.error(f"{receipt.name} is no longer available. Please upload it again.")
+            if receipt in st.session_state.uploaded_receipts:
+                st.session_state.uploaded_receipts.remove(receipt)
+            st.session_state.receipt_hashes.discard(receipt.hash)
+        for receipt_hash, extracted_text in ocr_job.result["texts"].items():
+            if extracted_text is None:
+                # Reported rather than retried on every rerun, until the user retries it
+                st.session_state.ocr_failed.add(receipt_hash)
+            else:
+                store_stage(st.session_state, f"ocr:{receipt_hash}", receipt_hash, extracted_text)
+            st.session_state.ocr_cache_stats["hits" if receipt_hash in ocr_job.result["cached"] else "misses"] += 1
+        finish_job("ocr", ocr_job)
+
+    # Keep every receipt that was read; only the failed ones are reported
+    receipts = st.session_state.uploaded_receipts
+    ocr_texts = [stage_result(st.session_state, f"ocr:{receipt.hash}") for receipt in receipts]
+    ocr_result = {
+        "receipts": [
+            {"name": receipt.name, "hash": receipt.hash, "text": text}
+            for receipt, text in zip(receipts, ocr_texts)
+            if text is not None
+        ],
+        "failed": [receipt.name for receipt, text in zip(receipts, ocr_texts) if text is None],
+    }
+    combined_text = "".join(receipt["text"] + "\n\n" for receipt in ocr_result["receipts"])
+    for name in ocr_result["failed"]:
+        st.error(f"Could not process: {name}. Please check image quality.")
+    if ocr_result["failed"] and st.button("Retry failed receipts"):
+        st.session_state.ocr_failed.clear()
+        st.rerun()
+    if not ocr_result["receipts"]:
+        st.stop()
 
     # --- Show All Raw Combined Text ---
     st.text_area("📝 Combined Receipt Text", combined_text, height=250)
@@ -221,107 +599,133 @@ if st.session_state.current_step == "analysis":
         try:
             st.subheader("Generating Master Shopping Record...")
 
-            system_prompt_receipt_parser = """
-            You are an expert receipt parser. Your role is to extract and expand grocery items from OCR-processed receipts using consistent formatting and practical product knowledge.
-
-            You will be provided with:
-            - The name of the store (e.g., Walmart)
-            - A full list of extracted receipt text
-            
-            Your job:
-            - Extract the raw item names exactly as written
-            - Use your knowledge of common grocery products, retail item formats, and the store context to expand abbreviated names
-            
-            ### Output Format
-            Return your output as a markdown table with two columns:
-            | Raw Item | Expansion |
-            
-            Formatting Rules:
-            - List every item in order. Include the original item name as-is under "Raw Item."
-            - Use the "Expansion" column to rewrite the full product name if you can confidently infer it from:
-              - Common abbreviations (e.g., "GV SHP SH" → "Great Value Sharp Shredded Cheddar")
-              - Known store-brand items (e.g., Walmart's Great Value)
-              - Household or grocery items (e.g., "POPCRN" → "Popcorn", "HP JUICE" → "High Pulp Juice")
-              - Product codes or sizes when common (e.g., "1.62Z KA LIQ" → "1.62 oz Kool-Aid Liquid")
-            - If the item is unclear or unknown, mark the Expansion as `Ambiguous`
-            
-            Do not:
-            - Skip items
-            - Remove duplicates
-            - Guess fictional products
-            - Reorganize or reclassify
-            - Add a third column or commentary
-            
-            If the receipt includes a store name, use it to inform what types of products are likely to appear.
-            
-            You may expand even without 100% certainty when:
-            - The expansion is widely accepted/common at that store
-            - The abbreviation closely matches a well-known grocery item
-            - The context is strong enough (e.g., surrounded by other dairy items)
-            """
-
-            user_prompt_receipt_parser = f"""
-            Extract the store name, date, and all receipt items from the text below. 
-            Follow the format:
-            
-            Store Name: [Store Name]  
-            Date: [Date]  
-            
-            | Raw Item | Expansion |
-            |----------|-----------|
-            | ITEM A   | Expansion |
-            | ITEM B   | Ambiguous |
-            
-            Extracted Receipt Text:
-            {combined_text}
-            """
-
-            # Process with selected model
-            start_time = time.time()
-            
-            if model_choice == "OpenAI GPT-4o":
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": system_prompt_receipt_parser},
-                        {"role": "user", "content": user_prompt_receipt_parser}
-                    ]
+            def parse_receipt(receipt_text):
+                """Parse one receipt on a worker thread (see ``adapttable.parsing``)."""
+                return parse_receipt_text(
+                    receipt_text, run_model, expansion_index=expansion_index, filter_lines=FILTER_OCR_LINES
                 )
-                cleaned_items_output = response.choices[0].message.content
-            elif model_choice == "OpenAI GPT-3.5-Turbo-0125":
-                response = client.chat.completions.create(
-                    model="gpt-3.5-turbo-0125",
-                    messages=[
-                        {"role": "system", "content": system_prompt_receipt_parser},
-                        {"role": "user", "content": user_prompt_receipt_parser}
-                    ]
+
+            def parse_receipts(stale, job):
+                """Parse job: parse ``stale`` receipts in parallel, saving each to the purchase history as it comes back."""
+                parsed, failed, first_token_times = {}, {}, []
+                start_time = time.time()
+                with ThreadPoolExecutor(max_workers=min(PARSER_MAX_CONCURRENCY, len(stale))) as pool:
+                    futures = {pool.submit(parse_receipt, receipt["text"]): receipt for receipt in stale}
+                    for future in as_completed(futures):
+                        receipt = futures[future]
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            failed[receipt["name"]] = e
+                            continue
+                        expansion_index.seed(result.receipts)
+                        if purchase_history is not None and household_id:
+                            # Saved as each receipt is parsed, so an interrupted run keeps what it got
+                            purchase_history.record_receipts(household_id, receipt["hash"], result.receipts)
+                        if result.completion.first_token_time is not None:
+                            first_token_times.append(result.completion.first_token_time)
+                        parsed[receipt["hash"]] = result
+                        # Show the merged table growing as each receipt comes back
+                        job.report("parsed", f"{len(parsed)} of {len(stale)}")
+                        job.stream("master_record", MasterRecord([
+                            parsed_receipt for receipt in stale if receipt["hash"] in parsed
+                            for parsed_receipt in parsed[receipt["hash"]].receipts
+                        ]).to_markdown())
+                expansion_index.save()
+                return {
+                    "parsed": parsed,
+                    "failed": failed,
+                    "elapsed": time.time() - start_time,
+                    "first_token_time": min(first_token_times) if first_token_times else None,
+                }
+
+            def show_parse_progress(progress, partial):
+                if "parsed" in progress:
+                    st.caption(f"Parsed {progress['parsed']} receipt(s)")
+                if "master_record" in partial:
+                    st.text(partial["master_record"])
+
+            # Each receipt is parsed separately and in parallel; only receipts
+            # whose OCR text (or the model) changed go back to the model
+            parse_keys = {
+                receipt["hash"]: content_hash(receipt["text"], model_choice)
+                for receipt in ocr_result["receipts"]
+            }
+            stale_receipts = [
+                receipt for receipt in ocr_result["receipts"]
+                if not stage_is_fresh(st.session_state, f"parsed_receipt:{receipt['hash']}", parse_keys[receipt["hash"]])
+            ]
+
+            def merged_receipts():
+                return [
+                    parsed_receipt
+                    for parsed in parsed_receipts_so_far()
+                    for parsed_receipt in parsed
+                ]
+
+            def parsed_receipts_so_far():
+                return [
+                    stage_result(st.session_state, f"parsed_receipt:{receipt['hash']}")
+                    for receipt in ocr_result["receipts"]
+                    if stage_is_fresh(st.session_state, f"parsed_receipt:{receipt['hash']}", parse_keys[receipt["hash"]])
+                ]
+
+            if stale_receipts:
+                parse_job = job_for(
+                    "parse",
+                    content_hash(*(parse_keys[receipt["hash"]] for receipt in stale_receipts)),
+                    functools.partial(parse_receipts, stale_receipts),
                 )
-                cleaned_items_output = response.choices[0].message.content
-            elif model_choice == "Google Gemini 2.5":
-                model = genai.GenerativeModel('gemini-2.5-pro-preview-03-25')
-                response = model.generate_content(
-                    f"{system_prompt_receipt_parser}\n\n{user_prompt_receipt_parser}"
+                if not parse_job.finished:
+                    wait_for(parse_job, show_parse_progress)
+                if parse_job.state == FAILED:
+                    show_job_error("parse", parse_job, "There was a problem generating the shopping record.")
+                for name, error in parse_job.result["failed"].items():
+                    st.error(f"Could not parse: {name}.")
+                    st.exception(error)
+                for receipt in stale_receipts:
+                    result = parse_job.result["parsed"].get(receipt["hash"])
+                    if result is None:
+                        continue
+                    for stat, value in result.expansion_stats.items():
+                        st.session_state.expansion_stats[stat] += value
+                    for stat, value in result.filter_stats.items():
+                        st.session_state.ocr_filter_stats[stat] += value
+                    store_stage(
+                        st.session_state,
+                        f"parsed_receipt:{receipt['hash']}",
+                        parse_keys[receipt["hash"]],
+                        result.receipts,
+                    )
+                    if household_id:
+                        st.session_state.history_recorded.add((household_id, receipt["hash"]))
+
+                # Store the processing time
+                record_processing_time(
+                    "receipt_parsing", parse_job.result["elapsed"], parse_job.result["first_token_time"]
                 )
-                cleaned_items_output = response.text
-            
-            end_time = time.time()
-            processing_time = end_time - start_time
-            
-            # Store the processing time
-            if "receipt_parsing" not in st.session_state.processing_times:
-                st.session_state.processing_times["receipt_parsing"] = {}
-            
-            st.session_state.processing_times["receipt_parsing"][model_choice] = processing_time
-            
-            st.session_state.master_record = cleaned_items_output
-            st.session_state.cleaned_items_output = cleaned_items_output
+                finish_job("parse", parse_job)
+
+            # Receipts parsed before a household ID was entered are saved now
+            for receipt in ocr_result["receipts"]:
+                if stage_is_fresh(st.session_state, f"parsed_receipt:{receipt['hash']}", parse_keys[receipt["hash"]]):
+                    record_history(receipt["hash"], stage_result(st.session_state, f"parsed_receipt:{receipt['hash']}"))
+
+            # Merge per-receipt results in upload order; each keeps its own store name and date
+            master_record = MasterRecord(merged_receipts())
+            if not master_record.receipts:
+                st.stop()
+            cleaned_items_output = master_record.to_markdown()
+            processing_time = st.session_state.processing_times.get("receipt_parsing", {}).get(model_choice, 0.0)
+
+            st.session_state.master_record = master_record
             
             st.markdown("### 🧾 Your Master Shopping Record")
 
             components.html(
                 f"""
                 <div style="max-height: 300px; overflow-y: auto; padding: 10px; border: 1px solid #ccc; border-radius: 8px;">
-                    <pre style="white-space: pre-wrap;">{cleaned_items_output}</pre>
+                    <pre style="white-space: pre-wrap;">{html.escape(cleaned_items_output)}</pre>
                 </div>
                 """,
                 height=350,
@@ -331,95 +735,120 @@ if st.session_state.current_step == "analysis":
             # Display processing time
             st.info(f"Processing time: {processing_time:.2f} seconds")
 
-            # --- Extract Raw Items Only (for LLM use) ---
-            store_blocks = extract_all_store_blocks(cleaned_items_output)
-            combined_raw_items = "\n\n".join(
-                f"**Store: {store}**\n{items}" for store, items in store_blocks
-            )
-
             # Set analysis_complete to True after generating the master record
             st.session_state.analysis_complete = True
 
         except Exception as e:
             st.error("There was a problem generating the shopping record.")
             st.exception(e)
+            st.stop()
 
     try:
         st.subheader("💡 Summary of Your Shopping Habits")
 
-        # Only generate summary if it doesn't exist in session state or is None
-        if 'household_summary' not in st.session_state or st.session_state.household_summary is None:
-            pen_portrait_prompt = f"""
-            You are a registered dietitian who specializes in empowering households to understand and improve their food choices. You are reviewing the output of a tool that converts a grocery receipt into a structured list of items. Each item may include a short name and, when possible, a longer expansion. You are creating a patient-facing summary to help the user understand their shopping habits and identify opportunities for improvement. The tone should be supportive but not overly positive — focus on clear, specific insights rooted in evidence and behavioral observation.
-            
-            Step 1: Review Input Format
-            You are provided with a list of grocery items purchased by a household. Each row contains a raw item name and, when available, a confident expansion. Use both fields when identifying trends, favoring the expansion when it offers more clarity. Do not make assumptions based on items that are unclear or ambiguous.
-            
-            Step 2: Identify and Analyze Shopping Patterns
-            Analyze shopping patterns based solely on the visible item names and expansions. Do not rely on any internal food database. Instead, use commonsense knowledge and observable trends. Where appropriate, cite examples from the list. Analyze for the following:
-            
-            - ✅ Recurring food categories, such as proteins, grains, snacks, dairy, beverages, sweets, condiments, or frozen meals. Name the categories only if there are multiple examples.
-            - ✅ Household size & composition, if inferable (e.g., kids, adults, multiple dietary needs).
-            - ✅ Meal preparation habits, such as reliance on convenience items vs. ingredients for home-cooked meals.
-            - ✅ Spending habits, such as bulk items, store brands, or premium brands.
-            - ✅ Dietary preferences or restrictions, such as gluten-free, low-carb, vegetarian, etc.
-            - ✅ Brand preferences, if certain brands appear multiple times.
-            - ✅ Lifestyle indicators, such as a busy or social household — include only if confident based on 3+ distinct items (≥60% confidence).
-            - ✅ Unexpected or culturally specific patterns, like repeated purchases of a specific spice, dish, or ingredient type.
-            
-            Cite only patterns that are clearly supported by the data. Avoid vague or overly positive generalizations.
-            
-            Step 3: Write the Patient Summary
-            Write a short, specific summary that reflects this household's current shopping patterns. Use an empathetic tone, but prioritize clarity, usefulness, and behavioral insight. If relevant, comment on strengths and possible areas for improvement in a way that helps the household feel understood and supported. Do not mention any item that wasn't clearly extracted or expanded.
-            
-            Master Shop Record:
-            {cleaned_items_output}
-            """
-            system_message = "You are a registered dietitian. Base your summary on Raw Item names, using Expansion only when it improves clarity. Do not use expansions marked Ambiguous."
-
-            # Process with selected model
-            start_time = time.time()
-            
-            if model_choice == "OpenAI GPT-4o":
-                pen_portrait_response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": system_message},
-                        {"role": "user", "content": pen_portrait_prompt}
-                    ]
+        # Downstream prompts get the compact serialization, not the display table
+        master_record_prompt = master_record.to_prompt()
+
+        # Summary, helpful and challenging foods depend only on the items bought and the model,
+        # so a receipt that adds no new items leaves them as they are
+        guidance_key = guidance_key_for(master_record)
+        # Local food categories, counted for the summary (see adapttable.classify)
+        category_counts = partition_record(master_record).category_counts
+
+        current_images = [receipt["hash"] for receipt in ocr_result["receipts"]]
+
+        def household_history():
+            """Aggregates of a returning household's earlier receipts, not the receipts themselves."""
+            if not purchase_history or not household_id:
+                return None
+            return purchase_history.summary(household_id, exclude_images=current_images)
+
+        # Only generate the summary when the item set or model has changed. Reads
+        # of session state happen here; the job gets plain values.
+        def write_household_summary(added_items, previous_summary, job):
+            """Summary job: stream the summary as it is written. When receipts only added
+            items, revise the earlier summary with a delta prompt instead of resending the
+            whole record."""
+            on_text = functools.partial(job.stream, "household_summary")
+            if added_items is not None:
+                return update_summary(
+                    run_model, previous_summary, added_items.to_prompt(), on_text=on_text,
+                    category_counts=category_counts, history=household_history(),
                 )
-                pen_portrait_output = pen_portrait_response.choices[0].message.content
-            elif model_choice == "OpenAI GPT-3.5-Turbo-0125":
-                pen_portrait_response = client.chat.completions.create(
-                    model="gpt-3.5-turbo-0125",
-                    messages=[
-                        {"role": "system", "content": system_message},
-                        {"role": "user", "content": pen_portrait_prompt}
-                    ]
+            return write_summary(
+                run_model, master_record_prompt, on_text=on_text, category_counts=category_counts,
+                history=household_history(),
+            )
+
+        def write_all_guidance(added_items, previous_sections, job):
+            """Summary job in single-call mode: summary, helpful and challenging foods from one structured response."""
+            on_text = functools.partial(job.stream, "combined_guidance")
+            if added_items is not None:
+                return update_combined_guidance(run_model, previous_sections, added_items.to_prompt(), on_text=on_text)
+            return write_combined_guidance(
+                run_model, master_record_prompt, on_text=on_text, category_counts=category_counts,
+                history=household_history(),
+            )
+
+        def show_summary_progress(progress, partial):
+            if "household_summary" in partial:
+                st.markdown(partial["household_summary"])
+            elif "combined_guidance" in partial:
+                st.caption(
+                    f"Writing your summary and food guidance… {len(partial['combined_guidance']):,} characters so far"
                 )
-                pen_portrait_output = pen_portrait_response.choices[0].message.content
-            elif model_choice == "Google Gemini 2.5":
-                model = genai.GenerativeModel('gemini-2.5-pro-preview-03-25')
-                response = model.generate_content(
-                    f"{system_message}\n\n{pen_portrait_prompt}"
+
+        if not stage_is_fresh(st.session_state, "household_summary", guidance_key):
+            stages = ["household_summary", "helpful_foods", "challenging_foods"] if single_call_guidance else ["household_summary"]
+            added_items = items_added_since(stages, master_record)
+            if single_call_guidance:
+                previous_sections = {
+                    "summary": stage_result(st.session_state, "household_summary"),
+                    "helpful_foods": stage_result(st.session_state, "helpful_foods"),
+                    "challenging_foods": stage_result(st.session_state, "challenging_foods"),
+                }
+                generate = functools.partial(write_all_guidance, added_items, previous_sections)
+            else:
+                generate = functools.partial(
+                    write_household_summary, added_items, stage_result(st.session_state, "household_summary")
                 )
-                pen_portrait_output = response.text
-            
-            end_time = time.time()
-            processing_time = end_time - start_time
-            
-            # Store the processing time
-            if "household_summary" not in st.session_state.processing_times:
-                st.session_state.processing_times["household_summary"] = {}
-            
-            st.session_state.processing_times["household_summary"][model_choice] = processing_time
-            
-            # Store the summary in session state if it's not None or empty
-            if pen_portrait_output and pen_portrait_output.strip():
-                st.session_state.household_summary = pen_portrait_output
+            summary_job = job_for("summary", content_hash(guidance_key, str(single_call_guidance)), generate)
+            if not summary_job.finished:
+                wait_for(summary_job, show_summary_progress)
+            if summary_job.state == FAILED:
+                if isinstance(summary_job.error, ValueError):
+                    message = "The model returned guidance that could not be read. Please try again."
+                else:
+                    message = "There was a problem generating the Household Profile."
+                show_job_error("summary", summary_job, message)
+            finish_job("summary", summary_job)
+
+            if single_call_guidance:
+                completion, sections = summary_job.result
+                record_processing_time("household_summary", completion.elapsed, completion.first_token_time)
+                record_processing_time("combined_guidance", completion.elapsed, completion.first_token_time)
+                record_guidance_run("single_call", guidance_key, completion.elapsed, [completion])
+                # The food guidance arrived in the same response; the helps/hinders
+                # block finds it fresh and renders it without another call
+                st.session_state.helpful_processing_time = completion.elapsed
+                st.session_state.challenging_processing_time = completion.elapsed
+                store_stage(st.session_state, "helpful_foods", guidance_key, sections["helpful_foods"])
+                store_stage(st.session_state, "challenging_foods", guidance_key, sections["challenging_foods"])
+                store_stage(st.session_state, "household_summary", guidance_key, sections["summary"])
+                record_guidance_basis(stages, master_record, delta=added_items is not None)
             else:
-                st.error("Failed to generate household summary. Please try again.")
-                st.stop()
+                completion = summary_job.result
+                # Store the processing time
+                record_processing_time("household_summary", completion.elapsed, completion.first_token_time)
+                record_guidance_run("split", guidance_key, completion.elapsed, [completion])
+                # Only keep the summary if it's not None or empty
+                if not completion.text or not completion.text.strip():
+                    st.error("Failed to generate household summary. Please try again.")
+                    st.stop()
+                store_stage(st.session_state, "household_summary", guidance_key, completion.text)
+                record_guidance_basis(stages, master_record, delta=added_items is not None)
+
+        st.session_state.household_summary = stage_result(st.session_state, "household_summary")
 
         # Display the stored summary if it exists and is not None
         if st.session_state.household_summary and st.session_state.household_summary.strip():
@@ -445,258 +874,245 @@ if st.session_state.current_step == "analysis":
 # --- Helps / Hinders GPT Analysis Block ---
 if st.session_state.analysis_complete and st.session_state.show_helps_hinders and st.session_state.master_record:
     st.subheader("🍽️ How Your Foods May Impact Blood Sugar")
+    # Card styles are only needed, and only sent, while guidance is shown
+    st.markdown(GUIDANCE_CSS, unsafe_allow_html=True)
     try:
-        # Define the helpful foods prompt
-        helpful_foods_prompt = f"""
-        🧠 ROLE:
-        You are a registered dietitian helping a household understand how their recent grocery purchases may affect blood sugar control for someone managing Type 1 Diabetes (T1D).
-
-        🎯 GOAL:
-        From the Master Shopping Record, analyze the food items and produce friendly, fact-based, actionable guidance grounded in nutritional science that:
-        - Helps users understand which foods support or challenge blood sugar control
-        - Explains *why* in clear, evidence-based language
-        - Provides alternatives and practical adaptation tips
-        - Supports decision-making for future shops or conversations with health care providers
-
-        Only use food items that appear in the provided shopping list — never invent or assume new ones.
-
-        ---
-
-        STEP 1: Write a Conversational Introduction
-        Start with a friendly, personalized introduction that:
-        - Acknowledges their shopping choices
-        - Sets up the purpose of the analysis
-        - Creates a supportive, non-judgmental tone
-        Example: "I've reviewed your recent shopping list, and I'm excited to help you understand how these choices might affect your blood sugar control. Let's look at specific items that could help support your goals..."
-
-        STEP 2: Analyze Helpful Foods
-        For each food that supports blood sugar control (low-GI, high-fiber, high-protein, or rich in healthy fats):
-        - Identify all relevant items from their shopping list
-        - Use appropriate food icons (🥑 for avocado, 🥛 for milk, 🥬 for vegetables, etc.)
-        - Format each item EXACTLY as follows with double line breaks between items:
-          **🥑 Food Item:** [name]  
-          
-          **✅ Why It's Great for Blood Sugar Control:** [clear, evidence-based explanation]  
-          
-          **🍽️ How to Use It:** [practical, specific suggestions]
-          
-          [Double line break before next item]
-
-        ✅ RULES:
-        - Never make up food items
-        - Do not give medical advice or suggest medication
-        - Use a friendly, informative tone that builds confidence
-        - Keep explanations evidence-based and specific
-        - Use appropriate food icons that match the items
-        - Analyze ALL relevant items from the shopping list
-        - Do not show the steps or internal structure to the user
-        - IMPORTANT: Use double line breaks between each food item to ensure proper formatting
-
-        Master Shop Record:
-        {st.session_state.master_record}
-        """
-
-        # Process helpful foods first if not already in session state
-        if 'helpful_foods_content' not in st.session_state:
-            with st.spinner("Analyzing helpful foods in your shopping list..."):
-                start_time = time.time()
-                
-                if model_choice == "OpenAI GPT-4o":
-                    response = client.chat.completions.create(
-                        model="gpt-4o",
-                        messages=[
-                            {"role": "system", "content": "You are a registered dietitian specializing in diabetes management."},
-                            {"role": "user", "content": helpful_foods_prompt}
-                        ]
-                    )
-                    helpful_foods_output = response.choices[0].message.content
-                elif model_choice == "OpenAI GPT-3.5-Turbo-0125":
-                    response = client.chat.completions.create(
-                        model="gpt-3.5-turbo-0125",
-                        messages=[
-                            {"role": "system", "content": "You are a registered dietitian specializing in diabetes management."},
-                            {"role": "user", "content": helpful_foods_prompt}
-                        ]
-                    )
-                    helpful_foods_output = response.choices[0].message.content
-                elif model_choice == "Google Gemini 2.5":
-                    model = genai.GenerativeModel('gemini-2.5-pro-preview-03-25')
-                    response = model.generate_content(
-                        f"You are a registered dietitian specializing in diabetes management.\n\n{helpful_foods_prompt}"
-                    )
-                    helpful_foods_output = response.text
-                
-                end_time = time.time()
-                helpful_processing_time = end_time - start_time
-                
-                # Store in session state
-                st.session_state.helpful_foods_content = helpful_foods_output
-                st.session_state.helpful_processing_time = helpful_processing_time
-
-        # Display helpful foods
-        if 'helpful_foods_content' in st.session_state:
-            content_parts = st.session_state.helpful_foods_content.split("\n\n")
-            if content_parts:
-                intro = content_parts[0]
-                st.markdown(intro)
-                st.markdown("<h3 style='font-size: 1.5rem; font-weight: 600; color: #2e7d32; margin-top: 1.5em; margin-bottom: 1em;'>Here are some items from your list that can be particularly helpful in managing blood sugar:</h3>", unsafe_allow_html=True)
-                
-                for part in content_parts[1:]:
-                    if "Food Item:" in part:
-                        lines = part.split("\n")
-                        food_line = next(line for line in lines if "Food Item:" in line)
-                        # Make food items larger and bolder
-                        modified_part = part.replace(food_line, f'<div style="font-size: 1.2em; font-weight: 600; margin: 1em 0;">{food_line}</div>')
-                        st.markdown(modified_part, unsafe_allow_html=True)
-                    else:
-                        st.markdown(part)
-        
-            st.info(f"Helpful foods analysis completed in {st.session_state.helpful_processing_time:.2f} seconds")
-
-        # Process challenging foods in background if not already done
-        if 'challenging_foods_content' not in st.session_state:
-            challenging_foods_prompt = f"""
-            🧠 ROLE:
-            You are a registered dietitian helping a household understand how their recent grocery purchases may affect blood sugar control for someone managing Type 1 Diabetes (T1D).
-
-            🎯 GOAL:
-            From the Master Shopping Record, analyze the food items and produce friendly, fact-based, actionable guidance grounded in nutritional science that:
-            - Helps users understand which foods support or challenge blood sugar control
-            - Explains *why* in clear, evidence-based language
-            - Provides alternatives and practical adaptation tips
-            - Supports decision-making for future shops or conversations with health care providers
-
-            Only use food items that appear in the provided shopping list — never invent or assume new ones.
-
-            ---
-
-            STEP 1: Analyze Challenging Foods
-            For each food that may hinder blood sugar control (high-GI, refined carbs, low fiber, low protein, or high in added sugar):
-            - Identify all relevant items from their shopping list
-            - Use appropriate food icons (🍞 for bread, 🍪 for cookies, 🥤 for sugary drinks, etc.)
-            - Format each item EXACTLY as follows with double line breaks between items:
-              **[icon] Food Item:** [name]  
-              
-              **❌ Why It May Challenge Control:** [clear, evidence-based explanation]  
-              
-              **✅ Try Instead:** [specific alternative with better glycemic profile]  
-              
-              **🔄 Adaptation Tip:** Suggest how to still use or enjoy this food with adjustments (e.g., pairing with protein, changing timing, reducing portion)
-              
-              [Double line break before next item]
-
-            STEP 2: Include Fixed Top Tips Section
-            Always include these specific tips, personalizing only the bracketed examples with items from their shopping list:
-
-            💡 **Top Tips for Blood Sugar Stability**
-
-            **🥚 Savory Breakfast First**  
-            Most people love a sweet start like [insert item if available – e.g., bananas or honey]. But mornings are when your body is more insulin-resistant — so starting with sugary foods can lead to big blood sugar spikes. Have some protein or fat first (e.g., turkey sausage, egg, avocado) to slow down absorption.
-
-            **🥦 Eat Veggies First**  
-            If your meals include pasta, rice, or bread, eat veggies or salad first. The fiber acts like a barrier and slows down carb absorption — making blood sugar easier to manage.
-
-            **🍽️ Eat In This Order:**  
-            Veggies → Protein/Fat → Carbs  
-            This simple order change can dramatically reduce blood sugar spikes.
-
-            **🧬 Pair Your Carbs**  
-            Got bread, granola bars, or crackers? Pair them with nut butter, cheese, or Greek yogurt. The added fat and protein help slow digestion.
-
-            **👟 Move After Meals**  
-            Even 10 minutes of walking after a meal can help flatten your glucose curve and aid digestion.
-
-            **🍏 Juice = Medicine, Not a Drink**  
-            Juice like [insert juice brand if available] works great for treating low blood sugar — but not for sipping throughout the day. Try water with lemon or a splash of juice instead.
-
-            **🥖 Choose Whole Over Processed**  
-            Highly processed foods (like [insert example from cart]) spike blood sugar faster. Opt for whole, fiber-rich versions when you can.
-
-            **🌾 Fiber = Power**  
-            Fiber slows digestion and supports blood sugar balance. Beans, whole grains, lentils, veggies — aim for more!
-
-            **🧘‍♀️ Sleep & Stress Matter**  
-            Poor sleep and stress can raise blood sugar. Prioritize rest and find calming rituals like yoga, walking, or mindfulness.
-
-            ✅ RULES:
-            - Never make up food items
-            - Do not give medical advice or suggest medication
-            - Use a friendly, informative tone that builds confidence
-            - Keep explanations evidence-based and specific
-            - Use appropriate food icons that match the items
-            - Analyze ALL relevant items from the shopping list
-            - Do not show the steps or internal structure to the user
-            - Maintain the exact wording of the top tips section, only personalizing the bracketed examples
-            - IMPORTANT: Use double line breaks between each food item to ensure proper formatting
-
-            Master Shop Record:
-            {st.session_state.master_record}
-            """
-
-            with st.spinner("Analyzing challenging foods in your shopping list..."):
-                start_time = time.time()
-                
-                if model_choice == "OpenAI GPT-4o":
-                    response = client.chat.completions.create(
-                        model="gpt-4o",
-                        messages=[
-                            {"role": "system", "content": "You are a registered dietitian specializing in diabetes management."},
-                            {"role": "user", "content": challenging_foods_prompt}
-                        ]
-                    )
-                    challenging_foods_output = response.choices[0].message.content
-                elif model_choice == "OpenAI GPT-3.5-Turbo-0125":
-                    response = client.chat.completions.create(
-                        model="gpt-3.5-turbo-0125",
-                        messages=[
-                            {"role": "system", "content": "You are a registered dietitian specializing in diabetes management."},
-                            {"role": "user", "content": challenging_foods_prompt}
-                        ]
-                    )
-                    challenging_foods_output = response.choices[0].message.content
-                elif model_choice == "Google Gemini 2.5":
-                    model = genai.GenerativeModel('gemini-2.5-pro-preview-03-25')
-                    response = model.generate_content(
-                        f"You are a registered dietitian specializing in diabetes management.\n\n{challenging_foods_prompt}"
+        master_record = st.session_state.master_record
+
+        # Helps/hinders only need regenerating when the item set or model changes
+        # (in single-call mode they were already stored with the summary)
+        guidance_key = guidance_key_for(master_record)
+
+        # Each section renders into its own container, so helpful foods always
+        # appear first no matter which response arrives first
+        guidance_sections = {
+            "helpful_foods": ("helpful_processing_time", "Helpful foods", st.container()),
+            "challenging_foods": ("challenging_processing_time", "Challenging foods", st.container()),
+        }
+
+        def render_section(stage, text):
+            """Emit a section as one element, from a fragment cached per content (see adapttable.rendering)."""
+            time_key, label, _ = guidance_sections[stage]
+            start_time = time.perf_counter()
+            fragment = render_guidance(stage, text)
+            st.markdown(fragment, unsafe_allow_html=True)
+            # Traced on every rerun: time to render and bytes sent to the browser
+            tracer.record(Span(
+                f"render_{stage}",
+                model_choice,
+                time.perf_counter() - start_time,
+                kind="step",
+                bytes_sent=len(fragment.encode("utf-8")),
+                session=trace_session,
+            ))
+            st.info(f"{label} analysis completed in {st.session_state[time_key]:.2f} seconds")
+
+        stale = [stage for stage in guidance_sections if not stage_is_fresh(st.session_state, stage, guidance_key)]
+
+        def write_sections(stale, added_items, previous_sections, items, job):
+            """Guidance job: both analyses depend only on the master record, so they are
+            issued at once, each streaming into the job. Returns ``({stage: Completion or
+            exception}, wall clock seconds)``."""
+            def write_section(stage):
+                on_text = functools.partial(job.stream, stage)
+                if added_items[stage] is not None:
+                    completion = update_guidance(
+                        run_model, stage, previous_sections[stage], added_items[stage], on_text=on_text
                     )
-                    challenging_foods_output = response.text
-                
-                end_time = time.time()
-                challenging_processing_time = end_time - start_time
-                
-                # Store in session state
-                st.session_state.challenging_foods_content = challenging_foods_output
-                st.session_state.challenging_processing_time = challenging_processing_time
-
-        # Display challenging foods if available
-        if 'challenging_foods_content' in st.session_state:
-            content_parts = st.session_state.challenging_foods_content.split("\n\n")
-            st.markdown("<h3 style='font-size: 1.5rem; font-weight: 600; color: #c62828; margin-top: 1.5em; margin-bottom: 1em;'>Now let's take a look at food items that could be more challenging:</h3>", unsafe_allow_html=True)
-            
-            for part in content_parts:
-                if "Food Item:" in part:
-                    lines = part.split("\n")
-                    food_line = next(line for line in lines if "Food Item:" in line)
-                    # Make food items larger and bolder
-                    modified_part = part.replace(food_line, f'<div style="font-size: 1.2em; font-weight: 600; margin: 1em 0;">{food_line}</div>')
-                    st.markdown(modified_part, unsafe_allow_html=True)
-                elif "💡 **Top Tips" in part:
-                    st.markdown("<h3 style='font-size: 1.5rem; font-weight: 600; color: #1565c0; margin-top: 1.5em; margin-bottom: 1em;'>💡 Top Tips for Blood Sugar Stability</h3>", unsafe_allow_html=True)
-                    st.markdown(part)
-                elif not any(skip in part for skip in ["let's take a look", "Okay,", "Remember, this is about"]):
-                    st.markdown(part)
-            
-            st.info(f"Challenging foods analysis completed in {st.session_state.challenging_processing_time:.2f} seconds")
+                else:
+                    completion = write_guidance(run_model, stage, items[stage], on_text=on_text)
+                job.stream(stage, completion.text)
+                job.report(stage, "done")
+                return completion
+
+            wall_start_time = time.time()
+            outcomes = {}
+            with ThreadPoolExecutor(max_workers=len(stale)) as pool:
+                futures = {stage: pool.submit(write_section, stage) for stage in stale}
+                for stage, future in futures.items():
+                    try:
+                        outcomes[stage] = future.result()
+                    except Exception as e:
+                        outcomes[stage] = e
+            return outcomes, time.time() - wall_start_time
+
+        def show_guidance_progress(progress, partial):
+            for stage, (_, _, section) in guidance_sections.items():
+                if stage in partial:
+                    with section:
+                        if progress.get(stage) == "done":
+                            st.markdown(render_guidance(stage, partial[stage]), unsafe_allow_html=True)
+                        else:
+                            st.markdown(partial[stage])
+
+        if stale:
+            # Each section gets only the items the local classifier sorted into it, and
+            # sections that only need newly added items are revised with delta prompts;
+            # a section with no items to cover makes no call. Session state is read
+            # here, not on the job's threads.
+            partition = partition_record(master_record)
+            added_items = {}
+            for stage in stale:
+                added = items_added_since([stage], master_record)
+                added_items[stage] = None if added is None else partition_record(added).record_for(stage)
+            previous_sections = {stage: stage_result(st.session_state, stage) for stage in stale}
+            items = {stage: partition.record_for(stage) for stage in stale}
+            guidance_job = job_for(
+                "guidance",
+                content_hash(guidance_key, *stale),
+                functools.partial(write_sections, stale, added_items, previous_sections, items),
+            )
+            if not guidance_job.finished:
+                wait_for(guidance_job, show_guidance_progress)
+            if guidance_job.state == FAILED:
+                show_job_error("guidance", guidance_job, "There was a problem generating the food guidance.")
+            finish_job("guidance", guidance_job)
+
+            outcomes, wall_clock_time = guidance_job.result
+            summed_time = 0.0
+            completions = []
+            for stage, outcome in outcomes.items():
+                time_key, _, section = guidance_sections[stage]
+                if isinstance(outcome, Exception):
+                    with section:
+                        st.error("There was a problem generating the food guidance.")
+                        st.exception(outcome)
+                    continue
+                summed_time += outcome.elapsed
+                completions.append(outcome)
+                st.session_state[time_key] = outcome.elapsed
+                record_processing_time(stage, outcome.elapsed, outcome.first_token_time)
+                store_stage(st.session_state, stage, guidance_key, outcome.text)
+                record_guidance_basis([stage], master_record, delta=added_items[stage] is not None)
+
+            # Wall clock is what the user waits for; summed is the total model time
+            record_processing_time("food_guidance_wall_clock", wall_clock_time)
+            record_guidance_run("split", guidance_key, wall_clock_time, completions)
+            record_processing_time("food_guidance_summed", summed_time)
+
+        for stage, (_, _, section) in guidance_sections.items():
+            if stage_is_fresh(st.session_state, stage, guidance_key):
+                with section:
+                    render_section(stage, stage_result(st.session_state, stage))
 
     except Exception as e:
         st.error("There was a problem generating the food guidance.")
         st.exception(e)
 
+# --- Memory Accounting ---
+# Session state is measured once per run; the process-wide totals cover every live session
+session_state_bytes = estimate_size({key: st.session_state[key] for key in st.session_state.keys()})
+session_memory.update(trace_session, session_state_bytes)
+memory_totals = session_memory.totals()
+tracer.set_gauge("sessions_live", memory_totals["sessions"], "Sessions seen within the idle timeout.")
+tracer.set_gauge("session_state_bytes", memory_totals["total"], "Estimated session-state bytes, all live sessions.")
+tracer.set_gauge("session_state_max_bytes", memory_totals["largest"], "Estimated bytes of the largest session.")
+tracer.set_gauge("session_memory_budget_bytes", SESSION_MEMORY_BUDGET, "Per-session memory budget.")
+tracer.set_gauge("global_memory_budget_bytes", GLOBAL_MEMORY_BUDGET, "Memory budget for all sessions together.")
+
+st.sidebar.markdown("---")
+st.sidebar.subheader("Memory")
+st.sidebar.markdown(
+    f"- This session: {session_state_bytes / 2**20:.2f} MB of {SESSION_MEMORY_BUDGET / 2**20:.0f} MB budget"
+)
+st.sidebar.markdown(
+    f"- All sessions: {memory_totals['total'] / 2**20:.1f} MB of {GLOBAL_MEMORY_BUDGET / 2**20:.0f} MB budget "
+    f"({memory_totals['sessions']} live)"
+)
+if session_state_bytes > SESSION_MEMORY_BUDGET or memory_totals["total"] > GLOBAL_MEMORY_BUDGET:
+    st.sidebar.warning("Session memory is over budget.")
+
+# --- Background Jobs ---
+job_counts = jobs.counts()
+tracer.set_gauge("jobs_queued", job_counts[QUEUED], "Background jobs waiting for a worker.")
+tracer.set_gauge("jobs_running", job_counts[RUNNING], "Background jobs running.")
+for provider, in_flight in provider_limiter.in_use().items():
+    tracer.set_gauge(f"{provider}_requests_in_flight", in_flight, f"Requests to {provider} in flight, all sessions.")
+st.sidebar.markdown(
+    f"- Background jobs: {job_counts[RUNNING]} running, {job_counts[QUEUED]} queued (all sessions)"
+)
+
+# --- Profiling ---
+if PROFILE_RERUNS:
+    run_seconds = time.perf_counter() - run_start_time
+    for step, seconds in (("rerun_imports", imports_seconds), ("rerun_setup", setup_seconds),
+                          ("rerun_total", run_seconds)):
+        tracer.record(Span(step, "app", seconds, kind="step", session=trace_session))
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("Profiling")
+    st.sidebar.markdown(
+        f"- This run: imports {imports_seconds * 1e3:.1f} ms, setup {setup_seconds * 1e3:.1f} ms, "
+        f"total {run_seconds * 1e3:.0f} ms (to here)"
+    )
+    app_summary = tracer.summary(kind="step", model="app")
+    for step in ("rerun_imports", "rerun_setup", "rerun_total"):
+        stats = app_summary.get((step, "app"))
+        if stats is not None:
+            st.sidebar.markdown(
+                f"- {step.replace('_', ' ').capitalize()}: p50 {stats['p50'] * 1e3:.1f} ms · "
+                f"p95 {stats['p95'] * 1e3:.1f} ms ({stats['n']} runs)"
+            )
+    for module, seconds in SDK_IMPORT_SECONDS.items():
+        st.sidebar.markdown(f"- First import of `{module}`: {seconds * 1e3:.0f} ms")
+
 # --- Performance Metrics ---
 if st.session_state.processing_times:
     st.sidebar.markdown("---")
     st.sidebar.subheader("Performance Metrics")
+    # p50/p95 over recent runs from every session (see adapttable.tracing), for the steps run here
+    step_summary = tracer.summary(kind="step")
     for step, times in st.session_state.processing_times.items():
         st.sidebar.markdown(f"**{step.replace('_', ' ').title()}:**")
-        for model, time_taken in times.items():
-            st.sidebar.markdown(f"- {model}: {time_taken:.2f} seconds")
+        for model in times:
+            stats = step_summary.get((step, model))
+            if stats is None:
+                continue
+            line = f"- {model}: p50 {stats['p50']:.2f} s · p95 {stats['p95']:.2f} s ({stats['n']} runs)"
+            if stats["first_token_p50"] is not None:
+                line += f", first token p50 {stats['first_token_p50']:.2f} s"
+            st.sidebar.markdown(line)
+
+    ocr_cache_stats = st.session_state.ocr_cache_stats
+    if ocr_cache_stats["hits"] or ocr_cache_stats["misses"]:
+        st.sidebar.markdown("**OCR Cache:**")
+        st.sidebar.markdown(f"- Hits: {ocr_cache_stats['hits']} (Vision calls skipped)")
+        st.sidebar.markdown(f"- Misses: {ocr_cache_stats['misses']}")
+
+    expansion_stats = st.session_state.expansion_stats
+    expanded_items = expansion_stats["local"] + expansion_stats["parsed"]
+    if expanded_items:
+        st.sidebar.markdown("**Local Expansion Index:**")
+        st.sidebar.markdown(
+            f"- Hit rate: {expansion_stats['local']} of {expanded_items} items "
+            f"({expansion_stats['local'] / expanded_items:.0%})"
+        )
+        st.sidebar.markdown(f"- Est. tokens saved: {expansion_stats['tokens_saved']:,}")
+
+    guidance_mode_stats = st.session_state.guidance_mode_stats
+    if guidance_mode_stats:
+        st.sidebar.markdown("**Guidance Modes:**")
+        for mode, stats in guidance_mode_stats.items():
+            label = "Single call" if mode == "single_call" else "Split calls"
+            cached_share = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0
+            st.sidebar.markdown(
+                f"- {label}: {stats['latency']:.2f} s end to end over {stats['calls']} call(s), "
+                f"{stats['cached_tokens']:,} of {stats['prompt_tokens']:,} prompt tokens cached ({cached_share:.0%})"
+            )
+
+    guidance_update_stats = st.session_state.guidance_update_stats
+    if guidance_update_stats["delta"]:
+        st.sidebar.markdown("**Incremental Updates:**")
+        st.sidebar.markdown(
+            f"- Sections revised from new items only: {guidance_update_stats['delta']} "
+            f"(written in full: {guidance_update_stats['full']})"
+        )
+
+    ocr_filter_stats = st.session_state.ocr_filter_stats
+    if ocr_filter_stats["lines_dropped"]:
+        st.sidebar.markdown("**OCR Line Filter:**")
+        st.sidebar.markdown(f"- Noise lines dropped: {ocr_filter_stats['lines_dropped']:,}")
+        st.sidebar.markdown(f"- Est. prompt tokens saved: {ocr_filter_stats['tokens_dropped']:,}")
+
+# Refresh the Prometheus text file with this run's spans. Every rerun records
+# its render steps, so idle reruns write at most once per interval.
+tracer.write_metrics(min_interval=METRICS_WRITE_INTERVAL)
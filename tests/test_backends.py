@@ -0,0 +1,81 @@
+import pytest
+
+from adapttable import backends
+from adapttable.backends import Backend
+
+
+class Throttled(Exception):
+    status_code = 429
+
+
+class FakeBackend(Backend):
+    """Fails with each of ``errors`` in turn (before or after ``partial``), then streams ``chunks``."""
+
+    provider = "fake"
+
+    def __init__(self, errors=(), chunks=("Hello", ", world"), partial=None, **kwargs):
+        super().__init__("fake-model", "key", **kwargs)
+        self.errors = list(errors)
+        self.chunks = chunks
+        self.partial = partial
+        self.calls = 0
+
+    def stream(self, system_prompt, user_prompt, usage, response_schema=None):
+        self.calls += 1
+        if self.errors:
+            if self.partial:
+                yield self.partial
+            raise self.errors.pop(0)
+        yield from self.chunks
+        usage["completion_tokens"] = len(self.chunks)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff_sleep(monkeypatch):
+    delays = []
+    monkeypatch.setattr(backends.time, "sleep", delays.append)
+    return delays
+
+
+def test_complete_streams_and_reports_usage():
+    seen = []
+    completion = FakeBackend().complete("system", "user", on_text=seen.append)
+    assert completion.text == "Hello, world"
+    assert seen == ["Hello", "Hello, world"]
+    assert completion.usage == {"completion_tokens": 2}
+    assert completion.retries == 0
+
+
+def test_complete_retries_retryable_errors_with_backoff(no_backoff_sleep):
+    backend = FakeBackend(errors=[Throttled(), Throttled()])
+    completion = backend.complete("system", "user")
+    assert completion.text == "Hello, world"
+    assert completion.retries == 2
+    assert backend.calls == 3
+    assert len(no_backoff_sleep) == 2
+
+
+def test_complete_gives_up_after_max_retries():
+    backend = FakeBackend(errors=[Throttled()] * 3, max_retries=2)
+    with pytest.raises(Throttled):
+        backend.complete("system", "user")
+    assert backend.calls == 3
+
+
+def test_complete_does_not_retry_other_errors():
+    backend = FakeBackend(errors=[ValueError("bad request")])
+    with pytest.raises(ValueError):
+        backend.complete("system", "user")
+    assert backend.calls == 1
+
+
+def test_complete_does_not_retry_after_first_token():
+    backend = FakeBackend(errors=[Throttled()], partial="Hel")
+    with pytest.raises(Throttled):
+        backend.complete("system", "user")
+    assert backend.calls == 1
+
+
+def test_backoff_delay_is_capped():
+    assert 0 <= backends.backoff_delay(0) <= backends.BACKOFF_BASE_SECONDS
+    assert backends.backoff_delay(20) <= backends.BACKOFF_MAX_SECONDS
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import time
+
+from adapttable.cache import EVICT_TO, DiskCache, ImageStore, ResponseCache
+
+
+def _age(cache, key, seconds):
+    path = cache._path(key)
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_disk_cache_round_trip(tmp_path):
+    cache = DiskCache(tmp_path)
+    assert cache.get("ab12") is None
+    cache.set("ab12", "receipt text")
+    assert cache.get("ab12") == "receipt text"
+    assert (tmp_path / "ab" / "ab12").exists()
+
+
+def test_disk_cache_expires_old_entries(tmp_path):
+    cache = DiskCache(tmp_path, max_age=60)
+    cache.set("old", "text")
+    _age(cache, "old", 120)
+    assert cache.get("old") is None
+    assert not cache._path("old").exists()
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=25)
+    for age, key in ((30, "k1"), (20, "k2")):
+        cache.set(key, "x" * 10)
+        _age(cache, key, age)
+    assert cache.get("k1") == "x" * 10  # now the most recently used
+    cache.set("k3", "x" * 10)
+    assert cache.get("k2") is None
+    assert cache.get("k1") == cache.get("k3") == "x" * 10
+
+
+def test_response_cache_key_covers_every_input():
+    key = ResponseCache.make_key("openai", "gpt-4o", "system", "user")
+    assert key == ResponseCache.make_key("openai", "gpt-4o", "system", "user")
+    assert len({
+        key,
+        ResponseCache.make_key("gemini", "gpt-4o", "system", "user"),
+        ResponseCache.make_key("openai", "gpt-4o-mini", "system", "user"),
+        ResponseCache.make_key("openai", "gpt-4o", "system 2", "user"),
+        ResponseCache.make_key("openai", "gpt-4o", "system", "user 2"),
+        ResponseCache.make_key("openai", "gpt-4o", "system", "user", {"type": "object"}),
+    }) == 6
+
+
+def test_response_cache_round_trip_and_ttl(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.sqlite3", ttl=60)
+    assert cache.get("key") is None
+    cache.set("key", "response")
+    assert cache.get("key") == "response"
+    cache.ttl = -1
+    assert cache.get("key") is None
+
+
+def test_response_cache_keeps_most_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.sqlite3", max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    time.sleep(0.01)
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+
+
+def test_image_store_is_content_addressed(tmp_path):
+    store = ImageStore(tmp_path)
+    key = store.put(b"\x89PNG image")
+    assert key == hashlib.sha256(b"\x89PNG image").hexdigest()
+    assert store.put(b"\x89PNG image") == key
+    assert store.get(key) == b"\x89PNG image"
+    assert len(list(tmp_path.glob("*/*"))) == 1
+
+
+def test_disk_cache_tracks_size_between_scans(tmp_path, monkeypatch):
+    cache = DiskCache(tmp_path, max_bytes=100)
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: scans.append(1) or evict())
+    cache.set("k1", "x" * 10)  # size unknown: scanned
+    cache.set("k2", "x" * 10)
+    cache.set("k1", "x" * 20)  # replacing counts the difference
+    assert len(scans) == 1
+    assert cache._total_bytes == 30
+
+
+def test_disk_cache_over_budget_evicts_below_it(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=100)
+    for age, key in enumerate(f"k{i}" for i in range(10)):
+        cache.set(key, "x" * 10)
+        _age(cache, key, 100 - age)
+    cache.set("new", "x" * 10)
+    assert cache._total_bytes <= 100 * EVICT_TO
+    assert cache.get("new") is not None and cache.get("k0") is None
@@ -0,0 +1,86 @@
+from adapttable.classify import (
+    HIGH, LOW, NEUTRAL, NON_FOOD, UNKNOWN, WHOLE_GRAINS, default_classifier, is_challenging, is_helpful,
+    partition_record,
+)
+from adapttable.receipts import MasterRecord, Receipt, ReceiptItem
+
+
+def classify(name):
+    return default_classifier().classify([name])[0]
+
+
+def test_two_word_term_wins_over_its_words():
+    assert classify("Sweet Potatoes").band != classify("Potatoes").band
+
+
+def test_head_term_sets_category():
+    assert classify("Spinach").category == "vegetables"
+    assert classify("Spinach").band == LOW
+    assert classify("Seedless Watermelon").band == HIGH
+
+
+def test_any_non_food_term_makes_item_non_food():
+    for name in ("Bounty Paper Towels 6 Roll", "Apple Scented Dish Soap", "Banana Boat Lotion"):
+        item_class = classify(name)
+        assert item_class.category == NON_FOOD
+        assert item_class.band == NEUTRAL
+        assert not item_class.fiber and not item_class.protein
+
+
+def test_non_food_is_neither_helpful_nor_challenging():
+    item_class = classify("Toilet Paper")
+    assert not is_helpful(item_class)
+    assert not is_challenging(item_class)
+
+
+def test_whole_grain_modifier():
+    white, whole = default_classifier().classify(["White Bread", "Whole Wheat Bread"])
+    assert whole.category == WHOLE_GRAINS
+    assert whole.fiber and whole.band < white.band
+
+
+def test_flavor_word_modifies_the_food_after_it():
+    plain, strawberry, chocolate = default_classifier().classify(
+        ["Plain Yogurt", "Strawberry Yogurt", "Chocolate Milk"]
+    )
+    assert strawberry.category == plain.category == "dairy"
+    assert strawberry.band == plain.band + 1
+    assert chocolate.category == "dairy" and chocolate.band == plain.band + 1
+
+
+def test_flavor_word_on_its_own_is_the_food():
+    assert classify("Strawberries").category == "fruit"
+    assert classify("Clover Honey").category == "sweets"
+    assert classify("Milk Chocolate").category == "sweets"
+
+
+def test_longer_phrase_wins_over_flavor_word():
+    assert classify("Sugar Free Syrup").band == LOW
+    assert classify("Cream of Wheat") == classify("Cream of Wheat Original")
+    assert classify("Cream of Wheat").category == "refined grains"
+    assert classify("Cream of Wheat").band == HIGH
+    assert not classify("Cream of Wheat").fiber
+
+
+def test_bare_wheat_is_not_whole_grain():
+    assert classify("Wheat Bread").category == "refined grains"
+    assert classify("Whole Wheat Bread").category == WHOLE_GRAINS
+
+
+def test_unknown_item_goes_to_both_prompts():
+    item_class = classify("Zzyzx")
+    assert item_class.category == UNKNOWN
+    assert is_helpful(item_class) and is_challenging(item_class)
+
+
+def test_partition_record():
+    record = MasterRecord([Receipt("Store", "Unknown date", (
+        ReceiptItem("SPNCH", "Spinach"),
+        ReceiptItem("WTRMLN", "Watermelon"),
+        ReceiptItem("PPR TWL", "Paper Towels"),
+        ReceiptItem("XQZ", "Mystery", True),
+    ))])
+    partition = partition_record(record)
+    assert [item.name for item in partition.helpful.items] == ["Spinach", "XQZ"]
+    assert [item.name for item in partition.challenging.items] == ["Watermelon", "XQZ"]
+    assert partition.category_counts[NON_FOOD] == 1
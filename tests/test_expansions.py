@@ -0,0 +1,88 @@
+from adapttable.expansions import ExpansionIndex, merge_resolved, normalize_item
+from adapttable.receipts import Receipt, ReceiptItem
+
+
+def _index():
+    index = ExpansionIndex()
+    index.add("Walmart", "GV MILK", "Great Value Milk")
+    index.add("Walmart", "HP JUICE 071234567890 2.98", "Hawaiian Punch Juice")
+    index.add("Walmart", "GV SHP SH", "Great Value Shampoo")
+    return index
+
+
+def test_normalize_item_cuts_at_code_or_price():
+    assert normalize_item("  hp   juice 071234567890 2.98 ") == "HP JUICE"
+    assert normalize_item("GV MILK 3.48") == "GV MILK"
+
+
+def test_lookup_exact_match():
+    assert _index().lookup("walmart", "gv milk 3.48") == "Great Value Milk"
+
+
+def test_lookup_unique_completion_of_truncated_code():
+    assert _index().lookup("walmart", "HP JU") == "Hawaiian Punch Juice"
+
+
+def test_lookup_short_or_shared_prefix_is_unresolved():
+    index = _index()
+    index.add("Walmart", "GV MAYO", "Great Value Mayonnaise")
+    assert index.lookup("walmart", "HP") is None
+    assert index.lookup("walmart", "GV M") is None
+    assert index.lookup("walmart", "GV MI") == "Great Value Milk"
+
+
+def test_lookup_does_not_resolve_longer_line():
+    assert _index().lookup("walmart", "GV MILK CHOC 2.50") is None
+
+
+def test_lookup_unknown_store():
+    assert _index().lookup("target", "GV MILK") is None
+
+
+def test_resolve_keeps_original_text():
+    text = "WALMART\n03/14/2024\nGV MILK   3.48\nGV MILK CHOC 2.50\n"
+    store, resolved, remaining = _index().resolve(text)
+    assert store == "Walmart"
+    assert resolved == [(2, ReceiptItem("GV MILK   3.48", "Great Value Milk", False))]
+    assert [line for _, line in remaining] == ["WALMART", "03/14/2024", "GV MILK CHOC 2.50"]
+
+
+def test_resolve_unknown_store_resolves_nothing():
+    text = "TARGET\nGV MILK 3.48\n"
+    assert _index().resolve(text) == (None, [], list(enumerate(text.splitlines())))
+
+
+def test_seed_skips_ambiguous_items():
+    index = ExpansionIndex()
+    index.seed([Receipt("Aldi", "Unknown date", (
+        ReceiptItem("BNNA", "Bananas"),
+        ReceiptItem("XQZ", "Maybe Cheese", True),
+    ))])
+    assert len(index) == 1
+    assert index.lookup("aldi", "BNNA") == "Bananas"
+
+
+def test_merge_resolved_keeps_receipt_line_order():
+    milk = ReceiptItem("GV MILK 3.48", "Great Value Milk")
+    bananas, eggs = ReceiptItem("BNNA", "Bananas"), ReceiptItem("EGGS", "Eggs")
+    remaining = [(0, "WALMART"), (1, "BNNA 1.24"), (3, "EGGS 2.99")]
+    merged = merge_resolved([Receipt("Walmart", "03/14/2024", (bananas, eggs))], "Walmart", [(2, milk)], remaining)
+    assert merged == [Receipt("Walmart", "03/14/2024", (bananas, milk, eggs))]
+
+
+def test_merge_resolved_unmatched_item_follows_previous_item():
+    milk = ReceiptItem("GV MILK 3.48", "Great Value Milk")
+    bananas, mystery = ReceiptItem("BNNA", "Bananas"), ReceiptItem("ZZTOP", "Mystery", True)
+    remaining = [(1, "BNNA 1.24"), (4, "Z-TOP 0.99")]
+    merged = merge_resolved([Receipt("Walmart", "Unknown date", (bananas, mystery))], "Walmart", [(3, milk)], remaining)
+    assert merged[0].items == (bananas, mystery, milk)
+
+
+def test_merge_resolved_without_parser_receipts():
+    milk = ReceiptItem("GV MILK 3.48", "Great Value Milk")
+    assert merge_resolved([], "Walmart", [(2, milk)], []) == [Receipt("Walmart", "Unknown date", (milk,))]
+
+
+def test_merge_resolved_with_nothing_resolved_returns_parser_receipts():
+    receipts = [Receipt("Walmart", "Unknown date", (ReceiptItem("BNNA", "Bananas"),))]
+    assert merge_resolved(receipts, "Walmart", [], [(1, "BNNA 1.24")]) is receipts
@@ -0,0 +1,68 @@
+from adapttable.history import PurchaseHistory, parse_day
+from adapttable.receipts import Receipt, ReceiptItem
+
+
+def _receipt(date, *names):
+    return Receipt("Walmart #123", date, tuple(ReceiptItem(name.upper(), name) for name in names))
+
+
+def _history(tmp_path):
+    history = PurchaseHistory(tmp_path / "history.sqlite3")
+    history.record_receipts("h1", "img-1", [_receipt("01/05/2024", "Spinach", "Bananas")])
+    history.record_receipts("h1", "img-2", [_receipt("02/10/2024", "Spinach", "White Bread")])
+    history.record_receipts("h2", "img-1", [_receipt("02/11/2024", "Soda")])
+    return history
+
+
+def test_parse_day():
+    assert parse_day("03/14/2024") == "2024-03-14"
+    assert parse_day("Mar 14, 2024") == "2024-03-14"
+    assert parse_day("Unknown date", "2024-01-01") == "2024-01-01"
+
+
+def test_recording_an_image_twice_is_a_no_op(tmp_path):
+    history = _history(tmp_path)
+    assert history.record_receipts("h1", "img-1", [_receipt("01/05/2024", "Spinach", "Bananas")]) == 0
+    assert history.overview("h1")["items"] == 4
+
+
+def test_overview_is_per_household(tmp_path):
+    overview = _history(tmp_path).overview("h1")
+    assert overview == {
+        "receipts": 2, "items": 4, "distinct_items": 3, "stores": 1,
+        "first_day": "2024-01-05", "last_day": "2024-02-10",
+    }
+
+
+def test_item_frequency(tmp_path):
+    history = _history(tmp_path)
+    assert history.item_frequency("h1", limit=1) == [("Spinach", 2, 2, "2024-02-10")]
+    assert {row[0] for row in history.item_frequency("h1", since="2024-02-01")} == {"Spinach", "White Bread"}
+    assert history.item_frequency("h1", store="Walmart #456") == []
+
+
+def test_category_trends(tmp_path):
+    trends = _history(tmp_path).category_trends("h1")
+    assert list(trends) == ["2024-01", "2024-02"]
+    assert sum(trends["2024-01"].values()) == 2
+
+
+def test_summary_excludes_current_receipts(tmp_path):
+    history = _history(tmp_path)
+    summary = history.summary("h1", exclude_images=["img-2"])
+    assert summary["receipts"] == 1 and summary["items"] == 2
+    assert {row[0] for row in summary["top_items"]} == {"Spinach", "Bananas"}
+    assert list(summary["category_trends"]) == ["2024-01"]
+
+
+def test_exclusions_past_sqlite_variable_limit(tmp_path):
+    # SQLite allows at most 32,766 bound parameters per statement
+    exclude = [f"unknown-{n}" for n in range(40_000)] + ["img-2"]
+    assert _history(tmp_path).summary("h1", exclude_images=exclude) == \
+        _history(tmp_path).summary("h1", exclude_images=["img-2"])
+
+
+def test_summary_is_none_on_first_visit(tmp_path):
+    history = _history(tmp_path)
+    assert history.summary("h2", exclude_images=["img-1"]) is None
+    assert history.summary("unknown") is None
@@ -0,0 +1,91 @@
+import threading
+import time
+
+from adapttable.jobs import DONE, FAILED, QUEUED, RUNNING, ConcurrencyLimiter, JobManager
+
+
+def _wait(job, timeout=5):
+    deadline = time.time() + timeout
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.005)
+    return job
+
+
+def test_job_result_progress_and_partial_text():
+    def run(job):
+        job.report("ocr", "2/2 receipts")
+        job.stream("summary", "Your household")
+        return 42
+
+    job = _wait(JobManager().submit("analysis", "key", run, session="s1"))
+    assert job.state == DONE and job.result == 42
+    assert job.status() == (DONE, {"ocr": "2/2 receipts"}, {"summary": "Your household"})
+    assert job.started_at <= job.finished_at
+
+
+def test_failure_is_kept_on_the_job():
+    def run(job):
+        raise ValueError("bad receipt")
+
+    job = _wait(JobManager().submit("analysis", "key", run))
+    assert job.state == FAILED and isinstance(job.error, ValueError)
+
+
+def test_resubmitting_an_unfinished_job_returns_it():
+    manager = JobManager()
+    release = threading.Event()
+    first = manager.submit("analysis", "key", lambda job: release.wait(5), session="s1")
+    assert manager.submit("analysis", "key", lambda job: None, session="s1") is first
+    assert manager.submit("analysis", "key", lambda job: None, session="s2") is not first
+    assert manager.submit("analysis", "other", lambda job: None, session="s1") is not first
+    release.set()
+    _wait(first)
+    assert manager.submit("analysis", "key", lambda job: None, session="s1") is not first
+
+
+def test_counts_and_expiry():
+    manager = JobManager(max_workers=1, retention=0)
+    release = threading.Event()
+    running = manager.submit("analysis", "a", lambda job: release.wait(5))
+    queued = manager.submit("analysis", "b", lambda job: None)
+    while running.state != RUNNING:
+        time.sleep(0.005)
+    assert manager.counts() == {QUEUED: 1, RUNNING: 1, DONE: 0, FAILED: 0}
+    release.set()
+    _wait(running)
+    _wait(queued)
+    assert manager.counts()[DONE] == 2
+    # Finished jobs past ``retention`` are dropped on the next submit
+    time.sleep(0.01)
+    _wait(manager.submit("analysis", "c", lambda job: None))
+    assert manager.get(running.id) is None and manager.get(queued.id) is None
+
+
+def test_limiter_caps_requests_in_flight():
+    limiter = ConcurrencyLimiter({"openai": 2})
+    lock = threading.Lock()
+    in_flight, peak = [0], [0]
+
+    def request():
+        with limiter.slot("openai"):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.02)
+            with lock:
+                in_flight[0] -= 1
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+    assert limiter.in_use() == {"openai": 0}
+
+
+def test_limiter_counts_slots_and_ignores_unlisted_providers():
+    limiter = ConcurrencyLimiter({"vision": 1})
+    with limiter.slot("vision"), limiter.slot("gemini"):
+        assert limiter.in_use() == {"vision": 1}
+    assert limiter.in_use() == {"vision": 0}
@@ -0,0 +1,32 @@
+import base64
+
+from adapttable import ocr
+from adapttable.cache import DiskCache
+from adapttable.ocr import annotate_images, image_hash
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+
+
+def test_limiter_is_only_used_for_images_sent_to_vision(tmp_path, monkeypatch):
+    sent = []
+
+    def annotate_batch(batch, api_key, url=ocr.VISION_URL):
+        sent.extend(batch)
+        return [f"text of {base64.b64decode(content).decode()}" for _, content in batch]
+
+    monkeypatch.setattr(ocr, "annotate_batch", annotate_batch)
+    images = [b"image-0", b"image-1", b"image-2"]
+    cache = DiskCache(tmp_path)
+    cache.set(image_hash(images[1]), "cached text")
+    limiter = CountingLimiter()
+
+    texts = annotate_images(images, "key", batch_size=1, preprocess=False, cache=cache, limiter=limiter)
+    assert texts == ["text of image-0", "cached text", "text of image-2"]
+    assert len(sent) == limiter.acquired == 2
+    assert cache.get(image_hash(images[2])) == "text of image-2"
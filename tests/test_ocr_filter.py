@@ -0,0 +1,68 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from adapttable.ocr_filter import HEADER_LINES, classify_line, filter_ocr_text
+
+FIXTURES = Path(__file__).resolve().parent.parent / "benchmarks" / "fixtures" / "ocr"
+
+
+@pytest.mark.parametrize("path", sorted(FIXTURES.glob("*.txt")), ids=lambda path: path.stem)
+def test_fixture_items_survive(path):
+    expected = json.loads(path.with_suffix(".items.json").read_text(encoding="utf-8"))
+    result = filter_ocr_text(path.read_text(encoding="utf-8"))
+    assert [item for item in expected if not any(item in line for line in result.kept)] == []
+    assert result.dropped
+
+
+@pytest.mark.parametrize("line", [
+    "GV WHL MLK 3.48 F",
+    "BANANAS",
+    "MANAGER SPECIAL CHEESE 3.00",
+    "MANAGER SPECIAL CHEESE",
+    "SAVE MONEY BREAD 2.00",
+    "LOW PRICES COOKIES 1.99",
+    "TERMINAL VELOCITY CEREAL 4.29",
+    "SURVEY BRAND OATS 2.49",
+])
+def test_item_lines_are_kept(line):
+    assert classify_line(line, HEADER_LINES) != "noise"
+
+
+@pytest.mark.parametrize("line", [
+    "Store Manager: Dana Lopez",
+    "CASHIER: 14",
+    "SUBTOTAL 23.45",
+    "TOTAL TENDERED 23.45",
+    "VISA TEND 23.45",
+    "MASTERCARD TENDERED $23.45",
+    "CASH TEND 40.00",
+    "Total Tendered 13.46",
+    "CHANGE DUE 0.00",
+    "************1234",
+    "3.48",
+    "THANK YOU FOR SHOPPING",
+    "www.example.com/survey",
+    "(555) 123-4567",
+    "10:42 AM",
+])
+def test_noise_lines_are_dropped(line):
+    assert classify_line(line, HEADER_LINES) == "noise"
+
+
+def test_header_and_date_lines_are_kept():
+    assert classify_line("TOTAL 23.45", 0) == "header"
+    assert classify_line("03/14/2024 10:42", HEADER_LINES) == "date"
+
+
+def test_unrecognised_lines_are_kept():
+    assert classify_line("ORGANIC", HEADER_LINES) == "other"
+
+
+def test_filter_keeps_line_order():
+    text = "WALMART\nSTORE 12\nMAIN ST\nBANANAS 1.24\nTOTAL 1.24\nAPPLES 2.00\n"
+    result = filter_ocr_text(text)
+    assert result.kept == ["WALMART", "STORE 12", "MAIN ST", "BANANAS 1.24", "APPLES 2.00"]
+    assert result.dropped == ["TOTAL 1.24"]
+    assert result.text == "\n".join(result.kept)
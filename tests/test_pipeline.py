@@ -0,0 +1,37 @@
+from adapttable.pipeline import content_hash, estimate_tokens, stage_is_fresh, stage_result, store_stage
+
+
+def test_content_hash_treats_str_and_bytes_alike():
+    assert content_hash("receipt", b"\x89PNG") == content_hash(b"receipt", b"\x89PNG")
+
+
+def test_content_hash_is_order_sensitive_and_keeps_part_boundaries():
+    assert content_hash("a", "b") != content_hash("b", "a")
+    assert content_hash("ab", "c") != content_hash("a", "bc")
+    assert content_hash() != content_hash("")
+
+
+def test_stage_is_stale_until_stored():
+    state = {}
+    assert not stage_is_fresh(state, "ocr", "key-1")
+    assert stage_result(state, "ocr", default="none") == "none"
+    store_stage(state, "ocr", "key-1", ["text"])
+    assert stage_is_fresh(state, "ocr", "key-1")
+    assert stage_result(state, "ocr") == ["text"]
+
+
+def test_new_key_invalidates_only_its_stage():
+    state = {}
+    store_stage(state, "ocr", "images-1", "ocr text")
+    store_stage(state, "summary", "record-1", "summary text")
+    assert not stage_is_fresh(state, "ocr", "images-2")
+    assert stage_is_fresh(state, "summary", "record-1")
+    store_stage(state, "ocr", "images-2", "new ocr text")
+    assert not stage_is_fresh(state, "ocr", "images-1")
+    assert stage_result(state, "ocr") == "new ocr text"
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
@@ -0,0 +1,13 @@
+import os
+
+from adapttable.pipeline import estimate_tokens
+from adapttable.prompts import challenging_foods_prompt, helpful_foods_prompt
+
+
+def test_guidance_prompts_share_a_cacheable_static_prefix():
+    helpful = helpful_foods_prompt("# Walmart | 01/01/2024\nGV MILK => Great Value Milk")
+    challenging = challenging_foods_prompt("# Aldi | 02/01/2024\nWHT BRD => White Bread")
+    shared = os.path.commonprefix([helpful, challenging])
+    # OpenAI only caches prefixes of 1,024+ tokens
+    assert estimate_tokens(shared) >= 1024
+    assert "Walmart" not in shared and "helpful_foods` section now" in helpful
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from adapttable.receipts import MasterRecord, Receipt, ReceiptItem, parse_receipts_json
+
+VALID = {
+    "receipts": [{
+        "store": "Walmart",
+        "date": "03/14/2024",
+        "items": [
+            {"raw": "GV WHL MLK", "expansion": "Great Value Whole Milk", "ambiguous": False},
+            {"raw": "XQZ 4OZ", "expansion": "ambiguous", "ambiguous": False},
+        ],
+    }],
+}
+
+
+def test_parse_valid_output():
+    assert parse_receipts_json(json.dumps(VALID)) == [Receipt("Walmart", "03/14/2024", (
+        ReceiptItem("GV WHL MLK", "Great Value Whole Milk", False),
+        ReceiptItem("XQZ 4OZ", None, True),
+    ))]
+
+
+def test_parse_fenced_block_and_bare_receipt():
+    fenced = "```json\n" + json.dumps(VALID["receipts"][0]) + "\n```"
+    assert parse_receipts_json(fenced) == parse_receipts_json(json.dumps(VALID))
+
+
+def test_missing_fields_get_defaults():
+    receipts = parse_receipts_json(json.dumps({"receipts": [
+        {"items": [{"raw": "BNNA"}, {"expansion": "No raw text"}, {"raw": "  ", "expansion": "Blank"}]},
+    ]}))
+    assert receipts == [Receipt("Unknown store", "Unknown date", (ReceiptItem("BNNA", None, True),))]
+    assert parse_receipts_json('{"receipts": [{"store": "Aldi", "items": null}, "stray"]}') == [
+        Receipt("Aldi", "Unknown date"),
+    ]
+
+
+@pytest.mark.parametrize("text", ['{"receipts": [', "not json", "", '"just a string"'])
+def test_malformed_output_raises_value_error(text):
+    with pytest.raises(ValueError):
+        parse_receipts_json(text)
+
+
+def test_master_record_round_trip():
+    record = MasterRecord(parse_receipts_json(json.dumps(VALID)))
+    assert MasterRecord(parse_receipts_json(record.to_json())) == record
+    assert record.to_prompt() == "# Walmart | 03/14/2024\nGV WHL MLK => Great Value Whole Milk\nXQZ 4OZ (ambiguous)"
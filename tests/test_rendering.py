@@ -0,0 +1,59 @@
+from adapttable.rendering import FoodItemCard, Guidance, HEADINGS, TIPS_HEADING, parse_guidance, render_guidance
+
+TEXT = """Great choices overall.
+
+**Food Item: Spinach**
+Why it helps: fiber.
+
+How to Use It: add to eggs.
+
+**Food Item: Oats**
+Why it helps: slow carbs.
+
+💡 **Top Tips**
+- Pair carbs with protein.
+
+Keep it up!"""
+
+
+def test_parse_guidance_sections():
+    assert parse_guidance(TEXT) == Guidance(
+        intro=("Great choices overall.",),
+        cards=(
+            FoodItemCard("Food Item: Spinach", ("Why it helps: fiber.", "How to Use It: add to eggs.")),
+            FoodItemCard("Food Item: Oats", ("Why it helps: slow carbs.",)),
+        ),
+        tips="💡 **Top Tips**\n- Pair carbs with protein.",
+        closing=("Keep it up!",),
+    )
+
+
+def test_parse_guidance_keeps_stray_text_with_its_card():
+    guidance = parse_guidance("**Food Item: Rice**\n\nWhy: starch.\n\nAlso try brown rice.")
+    assert guidance.cards == (FoodItemCard("Food Item: Rice", ("Why: starch.", "Also try brown rice.")),)
+
+
+def test_parse_guidance_without_cards():
+    assert parse_guidance("No items to review.\r\n\r\nUpload more.") == Guidance(
+        intro=("No items to review.", "Upload more."),
+    )
+
+
+def test_render_guidance_order():
+    fragment = render_guidance("helpful_foods", TEXT)
+    positions = [fragment.index(part) for part in (
+        "Great choices overall.", HEADINGS["helpful_foods"], "Food Item: Spinach", "Food Item: Oats",
+        TIPS_HEADING, "Pair carbs", "Keep it up!",
+    )]
+    assert positions == sorted(positions)
+
+
+def test_render_challenging_drops_lead_ins():
+    text = "Okay, here we go.\n\n**Food Item: Soda**\nWhy: sugar.\n\nRemember, this is about balance."
+    fragment = render_guidance("challenging_foods", text)
+    assert "Okay," not in fragment and "Remember, this is about" not in fragment
+    assert "Food Item: Soda" in fragment and "Why: sugar." in fragment
+
+
+def test_render_guidance_is_one_fragment_per_content():
+    assert render_guidance("helpful_foods", TEXT) is render_guidance("helpful_foods", TEXT)
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from adapttable.tracing import Span, Tracer, percentile
+
+
+def _spans():
+    return [
+        Span("ocr", "vision", 0.2, bytes_sent=1000, bytes_received=200),
+        Span("ocr", "vision", 0.4, retries=1),
+        Span("ocr", "vision", 3.0),
+        Span("summary", "gpt-4o", 1.5, first_token_time=0.3, prompt_tokens=800, completion_tokens=120,
+             cached_tokens=512, cache="miss"),
+        Span("summary", "gpt-4o", 0.01, first_token_time=0.01, cache="hit"),
+        Span("summary", "gpt-4o", 9.0, error="APITimeoutError"),
+    ]
+
+
+def test_percentile_nearest_rank():
+    assert percentile([3, 1, 2], 0.5) == 2
+    assert percentile([5.0], 0.95) == 5.0
+    assert percentile(list(range(1, 101)), 0.95) == 95
+
+
+def test_summary_groups_by_stage_and_model_without_errors():
+    tracer = Tracer()
+    for span in _spans():
+        tracer.record(span)
+    summary = tracer.summary()
+    assert summary[("ocr", "vision")] == {"n": 3, "p50": 0.4, "p95": 3.0, "first_token_p50": None}
+    assert summary[("summary", "gpt-4o")]["n"] == 2
+    assert summary[("summary", "gpt-4o")]["first_token_p50"] == 0.01
+    assert tracer.summary(model="vision").keys() == {("ocr", "vision")}
+    assert tracer.summary(kind="step") == {}
+
+
+def test_prometheus_text_format():
+    tracer = Tracer()
+    for span in _spans():
+        tracer.record(span)
+    tracer.set_gauge("jobs_running", 2, "Background jobs running.")
+    lines = tracer.prometheus_text().splitlines()
+    labels = 'stage="ocr",model="vision",kind="call"'
+    assert "# TYPE adapttable_stage_duration_seconds histogram" in lines
+    assert f'adapttable_stage_duration_seconds_bucket{{{labels},le="0.25"}} 1' in lines
+    assert f'adapttable_stage_duration_seconds_bucket{{{labels},le="0.5"}} 2' in lines
+    assert f'adapttable_stage_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in lines
+    assert f"adapttable_stage_duration_seconds_count{{{labels}}} 3" in lines
+    assert f'adapttable_bytes_total{{{labels},direction="sent"}} 1000' in lines
+    assert f"adapttable_retries_total{{{labels}}} 1" in lines
+    summary = 'stage="summary",model="gpt-4o",kind="call"'
+    assert f'adapttable_tokens_total{{{summary},type="cached"}} 512' in lines
+    assert f'adapttable_cache_total{{{summary},result="hit"}} 1' in lines
+    assert f"adapttable_errors_total{{{summary}}} 1" in lines
+    assert lines.count("# TYPE adapttable_tokens_total counter") == 1
+    assert lines[-3:] == [
+        "# HELP adapttable_jobs_running Background jobs running.",
+        "# TYPE adapttable_jobs_running gauge",
+        "adapttable_jobs_running 2",
+    ]
+
+
+def test_label_values_are_escaped():
+    tracer = Tracer()
+    tracer.record(Span('say "hi"\n', "m\\1", 0.1))
+    assert 'stage="say \\"hi\\"\\n",model="m\\\\1"' in tracer.prometheus_text()
+
+
+def test_write_metrics_only_when_changed(tmp_path):
+    path = tmp_path / "metrics.prom"
+    tracer = Tracer(metrics_path=path)
+    tracer.set_gauge("jobs_running", 1)
+    tracer.write_metrics()
+    assert path.read_text(encoding="utf-8") == tracer.prometheus_text()
+    path.unlink()
+    tracer.set_gauge("jobs_running", 1)  # unchanged
+    tracer.write_metrics()
+    assert not path.exists()
+    tracer.set_gauge("jobs_running", 2)
+    tracer.write_metrics(min_interval=3600)  # too soon after the last write
+    assert not path.exists()
+    tracer.write_metrics()
+    assert "adapttable_jobs_running 2" in path.read_text(encoding="utf-8")
+
+
+@pytest.fixture
+def tracers():
+    created = []
+    yield created
+    for tracer in created:
+        for handler in tracer._logger.handlers:
+            handler.close()
+
+
+def test_log_rotates_and_primes_the_window(tmp_path, tracers):
+    log_path = tmp_path / "spans.jsonl"
+    tracer = Tracer(log_path=log_path, max_bytes=2000, backup_count=2)
+    tracers.append(tracer)
+    for index in range(40):
+        tracer.record(Span("ocr", "vision", index / 100))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["spans.jsonl", "spans.jsonl.1", "spans.jsonl.2"]
+    last = json.loads(log_path.read_text(encoding="utf-8").splitlines()[-1])
+    assert last["duration"] == 0.39
+
+    restarted = Tracer(log_path=log_path)
+    tracers.append(restarted)
+    lines = log_path.read_text(encoding="utf-8").splitlines()
+    assert restarted.summary()[("ocr", "vision")]["n"] == len(lines)